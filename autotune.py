@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+"""
+SGLang 启动参数自动调优
+基于 SGLangServerLauncher 逐个启动候选配置，等待服务就绪后运行固定压测负载，
+记录吞吐与延迟，输出帕累托最优配置并可写回为新的量化预设
+"""
+
+import argparse
+import asyncio
+import copy
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import yaml
+
+from benchmark import build_default_workload, load_workload, run_benchmark
+from launch_server import SGLangServerLauncher, terminate_process
+
+# 调优参数 -> (配置 section, 对应的启动器命令行参数名)
+TUNABLE_PARAMS = {
+    "mem_fraction_static": ("memory", "mem_fraction_static"),
+    "chunked_prefill_size": ("memory", "chunked_prefill_size"),
+    "max_running_requests": ("memory", "max_running_requests"),
+    "torchao_config": ("quantization", "torchao_config"),
+    "kv_cache_dtype": ("quantization", "kv_cache_dtype"),
+}
+
+# 帕累托目标: (指标名, 方向)
+DEFAULT_OBJECTIVES = [
+    ("output_throughput", "max"),
+    ("p99_ttft_ms", "min"),
+    ("p99_tpot_ms", "min"),
+]
+
+
+def parse_none(value: str) -> Optional[str]:
+    """命令行中的 none/null 表示不设置该参数"""
+    return None if value.lower() in ("none", "null") else value
+
+
+def build_search_space(args: argparse.Namespace) -> Dict[str, List[Any]]:
+    space = {
+        "mem_fraction_static": args.sweep_mem_fraction_static,
+        "chunked_prefill_size": args.sweep_chunked_prefill_size,
+        "max_running_requests": args.sweep_max_running_requests,
+        "torchao_config": [parse_none(v) for v in args.sweep_torchao_config],
+        "kv_cache_dtype": args.sweep_kv_cache_dtype,
+    }
+    return {k: v for k, v in space.items() if v}
+
+
+def generate_candidates(space: Dict[str, List[Any]], max_trials: Optional[int],
+                        seed: int) -> List[Dict[str, Any]]:
+    """网格展开；超过 max_trials 时随机抽样"""
+    keys = list(space)
+    grid = [dict(zip(keys, values)) for values in itertools.product(*(space[k] for k in keys))]
+    if max_trials and len(grid) > max_trials:
+        grid = random.Random(seed).sample(grid, max_trials)
+    return grid
+
+
+def pareto_front(trials: List[Dict[str, Any]],
+                 objectives: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+    """返回非支配解集合"""
+    def better_or_equal(a, b, key, direction):
+        return a[key] >= b[key] if direction == "max" else a[key] <= b[key]
+
+    def strictly_better(a, b, key, direction):
+        return a[key] > b[key] if direction == "max" else a[key] < b[key]
+
+    front = []
+    for candidate in trials:
+        dominated = any(
+            all(better_or_equal(other["metrics"], candidate["metrics"], k, d) for k, d in objectives)
+            and any(strictly_better(other["metrics"], candidate["metrics"], k, d) for k, d in objectives)
+            for other in trials if other is not candidate
+        )
+        if not dominated:
+            front.append(candidate)
+    return front
+
+
+def detect_gpu_name() -> str:
+    """通过 nvidia-smi 获取 GPU 型号，用于命名预设"""
+    try:
+        output = subprocess.run(["nvidia-smi", "--query-gpu=name", "--format=csv,noheader"],
+                                capture_output=True, text=True, timeout=10).stdout
+        name = output.strip().splitlines()[0]
+        return "".join(c if c.isalnum() else "_" for c in name).strip("_").lower()
+    except (OSError, subprocess.SubprocessError, IndexError):
+        return "gpu"
+
+
+class AutoTuner:
+    """逐个试验候选配置"""
+
+    tuned_params = TUNABLE_PARAMS
+
+    def __init__(self, args: argparse.Namespace, launcher_argv: List[str]):
+        self.args = args
+        self.launcher = SGLangServerLauncher()
+        self.launcher_args = self.launcher.create_parser().parse_args(launcher_argv)
+        config_path = self.launcher_args.config or self.launcher.default_config_path
+        self.base_config = self.launcher.load_config(config_path)
+        if self.launcher_args.preset:
+            self.base_config = self.launcher.apply_quantization_preset(self.base_config,
+                                                                       self.launcher_args.preset)
+        # 调优参数以配置为准，清除命令行中的同名覆盖
+        for _, arg_name in self.tuned_params.values():
+            setattr(self.launcher_args, arg_name, None)
+        os.makedirs(args.log_dir, exist_ok=True)
+
+    def build_trial_command(self, candidate: Dict[str, Any]) -> List[str]:
+        config = copy.deepcopy(self.base_config)
+        for key, value in candidate.items():
+            section, _ = TUNABLE_PARAMS[key]
+            config.setdefault(section, {})[key] = value
+        return self.launcher.build_command(self.launcher_args, config)
+
+    def load_trial_workload(self) -> List[Dict[str, Any]]:
+        if self.args.dataset:
+            return load_workload(self.args.dataset, self.args.api, self.args.num_prompts, self.args.max_tokens)
+        return build_default_workload(self.args.api, self.args.num_prompts, self.args.max_tokens)
+
+    def run_trial(self, index: int, candidate: Dict[str, Any]) -> Dict[str, Any]:
+        cmd = self.build_trial_command(candidate)
+        self.launcher.check_server_flags(self.launcher_args, cmd)
+        base_url = self.launcher.local_base_url(cmd)
+        log_path = os.path.join(self.args.log_dir, f"trial_{index:03d}.log")
+        trial = {"index": index, "params": candidate, "command": " ".join(cmd), "log": log_path}
+
+        print(f"\n[试验 {index}] {candidate}")
+        with open(log_path, 'w', encoding='utf-8') as log_file:
+            proc = subprocess.Popen(cmd, stdout=log_file, stderr=subprocess.STDOUT)
+            try:
+                start = time.time()
+                if not self.launcher.wait_until_healthy(base_url, self.args.startup_timeout, proc):
+                    trial["status"] = "launch_failed" if proc.poll() is not None else "startup_timeout"
+                    print(f"  启动失败: {trial['status']}，日志: {log_path}")
+                    return trial
+                trial["startup_s"] = time.time() - start
+
+                # 预热: CUDA Graph / JIT 与缓存预热不计入测量
+                if self.args.warmup_prompts:
+                    asyncio.run(run_benchmark(base_url, self.args.api,
+                                              self.load_trial_workload()[:self.args.warmup_prompts],
+                                              concurrency=self.args.concurrency))
+                outcome = asyncio.run(run_benchmark(
+                    base_url, self.args.api, self.load_trial_workload(),
+                    request_rate=self.args.request_rate,
+                    concurrency=self.args.concurrency,
+                    ignore_eos=True,
+                    seed=self.args.seed,
+                ))
+                metrics = outcome["metrics"]
+                trial["metrics"] = metrics
+                self.collect_extra_metrics(base_url, trial)
+                trial["status"] = "ok" if metrics["failed"] == 0 else "partial_failure"
+                print(f"  吞吐: {metrics['output_throughput']:.1f} tok/s, "
+                      f"p99 TTFT: {metrics['p99_ttft_ms']:.1f} ms, p99 TPOT: {metrics['p99_tpot_ms']:.1f} ms, "
+                      f"失败: {metrics['failed']}")
+                return trial
+            finally:
+                terminate_process(proc, timeout=60)
+                time.sleep(self.args.cooldown)
+
+    def collect_extra_metrics(self, base_url: str, trial: Dict[str, Any]):
+        """压测结束、服务器关闭前采集额外指标，子类可覆盖"""
+
+    def run(self, candidates: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        trials = []
+        with open(self.args.results, 'w', encoding='utf-8') as results_file:
+            for index, candidate in enumerate(candidates):
+                trial = self.run_trial(index, candidate)
+                trials.append(trial)
+                results_file.write(json.dumps(trial, ensure_ascii=False) + "\n")
+                results_file.flush()
+        return trials
+
+
+def select_best(front: List[Dict[str, Any]], max_p99_ttft_ms: Optional[float],
+                max_p99_tpot_ms: Optional[float]) -> Optional[Dict[str, Any]]:
+    """在满足延迟约束的帕累托解中选择吞吐最高者"""
+    feasible = [
+        t for t in front
+        if (max_p99_ttft_ms is None or t["metrics"]["p99_ttft_ms"] <= max_p99_ttft_ms)
+        and (max_p99_tpot_ms is None or t["metrics"]["p99_tpot_ms"] <= max_p99_tpot_ms)
+    ]
+    if not feasible:
+        return None
+    return max(feasible, key=lambda t: t["metrics"]["output_throughput"])
+
+
+def trial_to_preset(trial: Dict[str, Any], base_preset: Dict[str, Any]) -> Dict[str, Any]:
+    preset = dict(base_preset)
+    preset.update(trial["params"])
+    return preset
+
+
+def write_back_preset(config_path: str, name: str, preset: Dict[str, Any]):
+    """把预设插入配置文件的 quantization_presets 段，保留原文件中的注释"""
+    with open(config_path, 'r', encoding='utf-8') as f:
+        lines = f.read().splitlines(keepends=True)
+    existing = yaml.safe_load("".join(lines)) or {}
+    if name in (existing.get('quantization_presets') or {}):
+        print(f"错误: 预设 '{name}' 已存在于 {config_path}，请使用 --preset-name 指定新名称")
+        sys.exit(1)
+
+    block = yaml.safe_dump({name: preset}, allow_unicode=True, sort_keys=False)
+    block = "".join(f"  {line}\n" for line in block.splitlines())
+    block = "  # autotune.py 自动生成\n" + block + "\n"
+    for i, line in enumerate(lines):
+        if line.rstrip() == "quantization_presets:":
+            lines.insert(i + 1, block)
+            break
+    else:
+        if lines and not lines[-1].endswith("\n"):
+            lines[-1] += "\n"
+        lines.append("\nquantization_presets:\n" + block)
+    with open(config_path, 'w', encoding='utf-8') as f:
+        f.write("".join(lines))
+
+
+def add_trial_arguments(parser: argparse.ArgumentParser, log_dir: str = "autotune_logs",
+                        results: str = "autotune_results.jsonl"):
+    """压测负载与试验控制参数 (autotune.py / spec_ab.py 共用)"""
+    workload = parser.add_argument_group("压测负载")
+    workload.add_argument("--api", choices=["completions", "chat"], default="chat")
+    workload.add_argument("--dataset", help="请求 JSONL 文件 (默认使用内置问题)")
+    workload.add_argument("--num-prompts", type=int, default=200)
+    workload.add_argument("--max-tokens", type=int, default=256)
+    workload.add_argument("--concurrency", type=int, default=32)
+    workload.add_argument("--request-rate", type=float, default=float("inf"))
+    workload.add_argument("--warmup-prompts", type=int, default=16, help="正式测量前的预热请求数")
+
+    control = parser.add_argument_group("试验控制")
+    control.add_argument("--startup-timeout", type=float, default=1200, help="等待服务就绪的超时(秒)")
+    control.add_argument("--cooldown", type=float, default=5, help="两次试验之间的等待(秒)")
+    control.add_argument("--log-dir", default=log_dir, help="每次试验的服务器日志目录")
+    control.add_argument("--results", default=results, help="试验结果 JSONL")
+
+
+def create_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="SGLang 启动参数自动调优",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+未识别的参数会原样传给 launch_server.py，例如:
+  python autotune.py --sweep-mem-fraction-static 0.8 0.9 --sweep-torchao-config none int4wo-128 \\
+      --num-prompts 200 --concurrency 32 --write-back server_config.yaml \\
+      --config server_config.yaml --model-path /path/to/Qwen3-4B --port 30100
+        """
+    )
+    sweep = parser.add_argument_group("搜索空间")
+    sweep.add_argument("--sweep-mem-fraction-static", type=float, nargs="+", default=[0.8, 0.85, 0.9])
+    sweep.add_argument("--sweep-chunked-prefill-size", type=int, nargs="+", default=[512, 1024, 2048])
+    sweep.add_argument("--sweep-max-running-requests", type=int, nargs="+", default=[16, 32, 64])
+    sweep.add_argument("--sweep-torchao-config", nargs="+", default=["none", "int4wo-128"],
+                       help="none 表示不量化")
+    sweep.add_argument("--sweep-kv-cache-dtype", nargs="+", default=["auto", "fp8_e5m2"])
+    sweep.add_argument("--max-trials", type=int, help="候选数上限，超过时随机抽样")
+    sweep.add_argument("--seed", type=int, default=0)
+
+    add_trial_arguments(parser)
+
+    output = parser.add_argument_group("输出")
+    output.add_argument("--max-p99-ttft-ms", type=float, help="选择最佳配置时的 p99 TTFT 约束")
+    output.add_argument("--max-p99-tpot-ms", type=float, help="选择最佳配置时的 p99 TPOT 约束")
+    output.add_argument("--preset-name", help="生成的预设名 (默认: autotuned_<GPU型号>)")
+    output.add_argument("--output-presets", default="autotuned_presets.yaml",
+                        help="帕累托最优配置输出文件")
+    output.add_argument("--write-back", metavar="CONFIG", help="将最佳配置写回该配置文件的 quantization_presets")
+    return parser
+
+
+def main():
+    parser = create_parser()
+    args, launcher_argv = parser.parse_known_args()
+
+    tuner = AutoTuner(args, launcher_argv)
+    space = build_search_space(args)
+    candidates = generate_candidates(space, args.max_trials, args.seed)
+    print(f"搜索空间: {space}")
+    print(f"共 {len(candidates)} 个候选配置")
+    trials = tuner.run(candidates)
+    succeeded = [t for t in trials if t.get("status") == "ok"]
+    if not succeeded:
+        print("\n没有成功完成的试验，请检查日志目录: " + args.log_dir)
+        sys.exit(1)
+
+    front = pareto_front(succeeded, DEFAULT_OBJECTIVES)
+    front.sort(key=lambda t: t["metrics"]["output_throughput"], reverse=True)
+    preset_name = args.preset_name or f"autotuned_{detect_gpu_name()}"
+    base_preset = {}
+    if tuner.launcher_args.preset:
+        base_preset = dict(tuner.base_config.get('quantization_presets', {}).get(tuner.launcher_args.preset, {}))
+
+    print("\n" + "=" * 60)
+    print(f"帕累托最优配置 ({len(front)}/{len(succeeded)})")
+    print("=" * 60)
+    presets = {}
+    for rank, trial in enumerate(front):
+        m = trial["metrics"]
+        print(f"{rank}. {trial['params']}")
+        print(f"   吞吐 {m['output_throughput']:.1f} tok/s, p99 TTFT {m['p99_ttft_ms']:.1f} ms, "
+              f"p99 TPOT {m['p99_tpot_ms']:.1f} ms")
+        presets[f"{preset_name}_{rank}"] = trial_to_preset(trial, base_preset)
+    with open(args.output_presets, 'w', encoding='utf-8') as f:
+        yaml.safe_dump({"quantization_presets": presets}, f, allow_unicode=True, sort_keys=False)
+    print(f"\n帕累托预设已写入: {args.output_presets}")
+
+    best = select_best(front, args.max_p99_ttft_ms, args.max_p99_tpot_ms)
+    if best is None:
+        print("没有满足延迟约束的配置")
+        sys.exit(1)
+    print(f"最佳配置 (约束内吞吐最高): {best['params']}")
+    if args.write_back:
+        write_back_preset(args.write_back, preset_name, trial_to_preset(best, base_preset))
+        print(f"已写回预设 '{preset_name}' 到 {args.write_back}，使用: python launch_server.py --preset {preset_name}")
+
+
+if __name__ == "__main__":
+    main()
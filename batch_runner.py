@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""
+SGLang 离线批处理工具
+流式读取 JSONL 对话请求，以有限并发发送到服务器，
+结果按完成顺序写入输出 JSONL (带输入行号)，支持断点续跑
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, Iterator, Optional, Set, Tuple
+
+from http_transport import TRANSPORT_ERRORS, AsyncTransport, dumps, loads
+from token_counter import DEFAULT_CONTEXT_LENGTH, POLICIES, PromptTooLongError, TokenCounter
+
+# 可重试的 HTTP 状态码 (请求超时、服务器过载或重启中)
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class CompletionTracker:
+    """记录已完成的输入行号
+
+    watermark 之前的行全部完成，之后零散完成的行保存在 done_above 中；
+    两者一起构成断点信息，体积与在途窗口大小成正比，与总行数无关。
+    """
+
+    def __init__(self, watermark: int = 0, done_above: Optional[Set[int]] = None):
+        self.watermark = watermark
+        self.done_above = set(done_above or ())
+        self._advance()
+
+    def is_done(self, index: int) -> bool:
+        return index < self.watermark or index in self.done_above
+
+    def mark_done(self, index: int):
+        self.done_above.add(index)
+        self._advance()
+
+    def _advance(self):
+        while self.watermark in self.done_above:
+            self.done_above.remove(self.watermark)
+            self.watermark += 1
+
+
+class Checkpoint:
+    """断点文件读写 - 原子替换，保证崩溃时不会留下半个断点"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def save(self, state: Dict[str, Any]):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def iter_requests(path: str) -> Iterator[Tuple[int, str]]:
+    """逐行读取输入 JSONL，产出 (行号, 原始行)；空行也占用行号以保持编号稳定"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for index, line in enumerate(f):
+            yield index, line
+
+
+def build_payload(item: Dict[str, Any], args: argparse.Namespace) -> Dict[str, Any]:
+    """将输入行转换为 /v1/chat/completions 请求体"""
+    body = dict(item.get("body", item))
+    for key in ("id", "custom_id"):
+        body.pop(key, None)
+    if "messages" not in body and "prompt" in body:
+        body["messages"] = [{"role": "user", "content": body.pop("prompt")}]
+    body.setdefault("model", "default")
+    body.setdefault("max_tokens", args.max_tokens)
+    body.setdefault("temperature", args.temperature)
+    body.setdefault("chat_template_kwargs", {"enable_thinking": args.enable_thinking})
+    body["stream"] = False
+    return body
+
+
+def build_token_counter(args: argparse.Namespace) -> TokenCounter:
+    """预检计数器: --tokenizer 优先，否则读取 --config；按字节近似计数时 truncate/reject 会误截误拒，只允许 clamp"""
+    if args.tokenizer or not args.config:
+        counter = TokenCounter(args.tokenizer, args.context_length or DEFAULT_CONTEXT_LENGTH)
+    else:
+        try:
+            counter = TokenCounter.from_config(args.config, **({"context_length": args.context_length}
+                                                                 if args.context_length else {}))
+        except OSError as e:
+            print(f"错误: 无法读取配置文件: {e}")
+            sys.exit(1)
+    if counter.approximate:
+        if args.preflight != "clamp":
+            print(f"错误: --preflight {args.preflight} 需要可用的 tokenizer，字节近似计数不够准确")
+            sys.exit(1)
+        print(f"警告: 预检使用{counter.tokenizer.description}，token 数只是估算，max_tokens 的下调可能偏多或偏少")
+    return counter
+
+
+class BatchRunner:
+    """有限并发的批处理执行器"""
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.url = f"http://{args.host}:{args.port}/v1/chat/completions"
+        self.checkpoint = Checkpoint(args.checkpoint or f"{args.output}.ckpt")
+        self.tracker = CompletionTracker()
+        self.counter = build_token_counter(args) if args.preflight else None
+        self.output = None
+        self.completed = 0
+        self.failed = 0
+        self.skipped = 0
+        self._since_checkpoint = 0
+        self._last_checkpoint_time = 0.0
+        self._window_changed: Optional[asyncio.Condition] = None
+
+    def open_output(self):
+        """打开输出文件；续跑时截断到上次断点记录的位置，避免重复结果"""
+        state = None if self.args.overwrite else self.checkpoint.load()
+        if state is not None:
+            if state.get("input") != os.path.abspath(self.args.input):
+                print(f"错误: 断点文件对应的输入为 {state.get('input')}，与当前输入不一致")
+                sys.exit(1)
+            self.tracker = CompletionTracker(state["watermark"], set(state["done_above"]))
+            self.completed = state.get("completed", 0)
+            self.failed = state.get("failed", 0)
+            self.output = open(self.args.output, 'ab')
+            self.output.truncate(state["output_offset"])
+            self.output.seek(state["output_offset"])
+            print(f"从断点恢复: 已完成 {self.tracker.watermark + len(self.tracker.done_above)} 行 "
+                  f"(watermark={self.tracker.watermark})")
+        else:
+            if os.path.exists(self.args.output) and not self.args.overwrite:
+                print(f"错误: 输出文件 {self.args.output} 已存在且没有断点，使用 --overwrite 覆盖")
+                sys.exit(1)
+            self.output = open(self.args.output, 'wb')
+
+    def save_checkpoint(self):
+        self.output.flush()
+        os.fsync(self.output.fileno())
+        self.checkpoint.save({
+            "input": os.path.abspath(self.args.input),
+            "watermark": self.tracker.watermark,
+            "done_above": sorted(self.tracker.done_above),
+            "output_offset": self.output.tell(),
+            "completed": self.completed,
+            "failed": self.failed,
+        })
+        self._since_checkpoint = 0
+        self._last_checkpoint_time = time.time()
+
+    async def send(self, transport: AsyncTransport, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """发送单个请求，对可重试错误做指数退避"""
+        delay = 1.0
+        for attempt in range(self.args.max_retries + 1):
+            try:
+                start = time.perf_counter()
+                async with transport.post_json(self.url, payload) as response:
+                    if response.status == 200:
+                        result = await response.json()
+                        choice = result["choices"][0]
+                        return {
+                            "content": choice["message"].get("content") or "",
+                            "finish_reason": choice.get("finish_reason"),
+                            "usage": result.get("usage"),
+                            "latency": time.perf_counter() - start,
+                        }
+                    error = f"HTTP {response.status}: {await response.text()}"
+                    if response.status not in RETRYABLE_STATUS:
+                        return {"error": error}
+            except TRANSPORT_ERRORS as e:
+                error = f"{type(e).__name__}: {e}"
+            if attempt < self.args.max_retries:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30.0)
+        return {"error": error}
+
+    async def process(self, transport: AsyncTransport, index: int, line: str,
+                      semaphore: asyncio.Semaphore):
+        try:
+            try:
+                item = loads(line)
+                record = {"index": index, "id": item.get("id", item.get("custom_id"))}
+                payload = build_payload(item, self.args)
+                if self.counter is not None:
+                    # 超长请求在本地拒绝，不占用服务器队列
+                    try:
+                        payload = (await self.counter.apreflight(payload, self.args.preflight)).body
+                    except PromptTooLongError as e:
+                        payload = None
+                        record["error"] = f"本地预检: {e}"
+                if payload is not None:
+                    record.update(await self.send(transport, payload))
+            except (ValueError, AttributeError, KeyError, IndexError, TypeError) as e:
+                record = {"index": index, "id": None, "error": f"无效请求: {e}"}
+            await self.write_result(index, record)
+        finally:
+            semaphore.release()
+
+    async def write_result(self, index: int, record: Dict[str, Any]):
+        # 先写结果再标记完成，断点中的 output_offset 始终覆盖所有已标记完成的行
+        self.output.write(dumps(record) + b"\n")
+        self.tracker.mark_done(index)
+        if "error" in record:
+            self.failed += 1
+        else:
+            self.completed += 1
+        self._since_checkpoint += 1
+        if (self._since_checkpoint >= self.args.checkpoint_interval
+                or time.time() - self._last_checkpoint_time >= self.args.checkpoint_seconds):
+            self.save_checkpoint()
+        if (self.completed + self.failed) % self.args.log_interval == 0:
+            self.print_progress()
+        async with self._window_changed:
+            self._window_changed.notify_all()
+
+    def print_progress(self):
+        elapsed = time.time() - self._start_time
+        done = self.completed + self.failed - self._initial_done
+        rate = done / elapsed if elapsed > 0 else 0.0
+        print(f"进度: 成功 {self.completed}, 失败 {self.failed}, 跳过 {self.skipped}, "
+              f"watermark {self.tracker.watermark}, {rate:.1f} req/s")
+
+    async def run(self):
+        self.open_output()
+        self._window_changed = asyncio.Condition()
+        self._start_time = time.time()
+        self._last_checkpoint_time = self._start_time
+        self._initial_done = self.completed + self.failed
+        semaphore = asyncio.Semaphore(self.args.max_concurrency)
+        tasks = set()
+        try:
+            async with AsyncTransport(pool_size=self.args.max_concurrency, timeout=self.args.request_timeout,
+                                      http2=self.args.http2) as transport:
+                for index, line in iter_requests(self.args.input):
+                    if self.tracker.is_done(index):
+                        self.skipped += 1
+                        continue
+                    if not line.strip():
+                        await self.write_result(index, {"index": index, "id": None, "error": "空行"})
+                        continue
+                    # 限制最早未完成行与当前行的距离，使断点中的 done_above 保持有界
+                    async with self._window_changed:
+                        await self._window_changed.wait_for(
+                            lambda: index - self.tracker.watermark < self.args.max_window)
+                    await semaphore.acquire()
+                    task = asyncio.create_task(self.process(transport, index, line, semaphore))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                if tasks:
+                    await asyncio.gather(*tasks)
+        finally:
+            self.save_checkpoint()
+            self.output.close()
+
+        self.print_progress()
+        print(f"批处理完成，结果已写入: {self.args.output}")
+        if not self.args.keep_checkpoint:
+            self.checkpoint.remove()
+
+
+def create_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="SGLang 离线批处理 - 有限并发 + 断点续跑",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+输入格式 (每行一个 JSON):
+  {"id": "q1", "messages": [{"role": "user", "content": "什么是深度学习？"}], "max_tokens": 200}
+  {"custom_id": "q2", "body": {"messages": [...], "temperature": 0.3}}
+
+输出格式 (按完成顺序，index 为输入行号):
+  {"index": 0, "id": "q1", "content": "...", "finish_reason": "stop", "usage": {...}, "latency": 0.8}
+  {"index": 1, "id": "q2", "error": "HTTP 400: ..."}
+
+中断后使用相同命令重新运行即可从断点继续。
+        """
+    )
+    parser.add_argument("input", help="输入请求 JSONL 文件")
+    parser.add_argument("--output", "-o", required=True, help="输出结果 JSONL 文件")
+    parser.add_argument("--host", default="localhost", help="服务器主机地址")
+    parser.add_argument("--port", default=30000, type=int, help="服务器端口")
+    parser.add_argument("--max-concurrency", type=int, default=64, help="最大在途请求数")
+    parser.add_argument("--max-window", type=int, default=100000,
+                        help="最早未完成行与最新发出行的最大距离")
+    parser.add_argument("--max-tokens", type=int, default=512, help="默认最大生成token数")
+    parser.add_argument("--temperature", type=float, default=0.7, help="默认采样温度")
+    parser.add_argument("--enable-thinking", action="store_true", help="启用思考模式")
+    parser.add_argument("--preflight", choices=POLICIES,
+                        help="发送前本地计数 prompt token: clamp 下调 max_tokens，truncate 截断超长对话，reject 直接拒绝")
+    parser.add_argument("--tokenizer", help="预检使用的 tokenizer 路径 (优先于 --config)")
+    parser.add_argument("--config", "-c",
+                        help="从服务器配置读取预检的 tokenizer (model.tokenizer_path / model_path) 与 memory.context_length")
+    parser.add_argument("--context-length", type=int,
+                        help=f"预检使用的上下文长度 (默认取配置文件或 {DEFAULT_CONTEXT_LENGTH})")
+    parser.add_argument("--max-retries", type=int, default=3, help="可重试错误的最大重试次数")
+    parser.add_argument("--request-timeout", type=float, default=600, help="单请求超时时间(秒)")
+    parser.add_argument("--http2", action="store_true", help="使用 HTTP/2 (需要 httpx[http2])")
+    parser.add_argument("--checkpoint", help="断点文件路径 (默认: <output>.ckpt)")
+    parser.add_argument("--checkpoint-interval", type=int, default=1000, help="每完成多少行保存一次断点")
+    parser.add_argument("--checkpoint-seconds", type=float, default=30, help="两次断点之间的最长间隔(秒)")
+    parser.add_argument("--keep-checkpoint", action="store_true", help="完成后保留断点文件")
+    parser.add_argument("--overwrite", action="store_true", help="忽略断点，从头开始并覆盖输出")
+    parser.add_argument("--log-interval", type=int, default=1000, help="进度打印间隔(行)")
+    return parser
+
+
+def main():
+    parser = create_parser()
+    args = parser.parse_args()
+    if args.preflight in ("truncate", "reject") and not (args.tokenizer or args.config):
+        parser.error(f"--preflight {args.preflight} 需要 --tokenizer 或 --config 指定 tokenizer")
+    runner = BatchRunner(args)
+    try:
+        asyncio.run(runner.run())
+    except KeyboardInterrupt:
+        print("\n用户中断，断点已保存，重新运行相同命令即可继续")
+
+
+if __name__ == "__main__":
+    main()
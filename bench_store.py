@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+"""
+压测结果存储与回归比较
+每次压测保存一条结果记录 (.npz): 配置哈希、预设、sglang/torch 版本、负载 ID 与逐请求时延数组；
+compare 比较两次运行或与保存的基线比较，用 bootstrap 置信区间检验吞吐与分位时延，
+超过阈值且统计显著的回退以非零退出码返回，便于在升级 sglang 前后做自动检查
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import requests
+
+from http_transport import get_sync_transport, response_json
+
+DEFAULT_STORE_DIR = "bench_results"
+BASELINE_DIR = "baselines"
+DEFAULT_BASELINE = "default"
+
+TRACKED_PACKAGES = ["sglang", "torch", "flashinfer-python", "transformers", "triton"]
+
+# /get_server_info 中随运行状态变化、不属于配置的字段
+VOLATILE_SERVER_KEYS = {"internal_states", "version", "host", "port", "last_gen_throughput", "memory_usage"}
+
+# 分位数之外至少要有这么多请求，否则该分位数的 bootstrap 区间不可信，不做判定
+MIN_TAIL_SAMPLES = 5
+
+# (指标, 显示名, 方向): 1 表示越大越好，-1 表示越小越好
+COMPARED_METRICS = [
+    ("output_throughput", "输出吞吐 (tok/s)", 1),
+    ("p50_ttft_ms", "p50 TTFT (ms)", -1),
+    ("p99_ttft_ms", "p99 TTFT (ms)", -1),
+    ("p50_tpot_ms", "p50 TPOT (ms)", -1),
+    ("p99_tpot_ms", "p99 TPOT (ms)", -1),
+    ("p50_e2e_latency_ms", "p50 E2E (ms)", -1),
+    ("p99_e2e_latency_ms", "p99 E2E (ms)", -1),
+]
+
+
+def package_versions() -> Dict[str, Optional[str]]:
+    """本机安装的推理相关包版本 (未安装为 None)"""
+    from importlib import metadata
+    versions = {}
+    for name in TRACKED_PACKAGES:
+        try:
+            versions[name] = metadata.version(name)
+        except metadata.PackageNotFoundError:
+            versions[name] = None
+    return versions
+
+
+def fetch_server_info(base_url: str) -> Dict[str, Any]:
+    try:
+        info = response_json(get_sync_transport().get(f"{base_url}/get_server_info", timeout=10))
+    except (requests.exceptions.RequestException, ValueError):
+        return {}
+    return info if isinstance(info, dict) else {}
+
+
+def server_config(info: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in info.items() if k not in VOLATILE_SERVER_KEYS}
+
+
+def stable_hash(value: Any) -> str:
+    text = json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:12]
+
+
+def workload_id(workload: List[Dict[str, Any]], settings: Dict[str, Any]) -> str:
+    """请求内容与到达参数相同的运行得到相同的负载 ID，只有同一负载的结果可以直接比较"""
+    return stable_hash({"workload": workload, "settings": settings})
+
+
+def results_to_arrays(results: List[Any]) -> Dict[str, np.ndarray]:
+    """逐请求结果转为列存数组；ITL 拼接为一维数组，按 itl_offsets 切分"""
+    itl_lengths = [len(r.itl) for r in results]
+    return {
+        "success": np.array([r.success for r in results], dtype=bool),
+        "ttft": np.array([r.ttft for r in results], dtype=np.float64),
+        "latency": np.array([r.latency for r in results], dtype=np.float64),
+        "prompt_tokens": np.array([r.prompt_tokens for r in results], dtype=np.int32),
+        "output_tokens": np.array([r.output_tokens for r in results], dtype=np.int32),
+        "itl": np.array([gap for r in results for gap in r.itl], dtype=np.float32),
+        "itl_offsets": np.concatenate([[0], np.cumsum(itl_lengths)]).astype(np.int64),
+    }
+
+
+def save_run(store_dir: str, results: List[Any], metrics: Dict[str, Any], workload: List[Dict[str, Any]],
+             base_url: Optional[str] = None, label: Optional[str] = None, preset: Optional[str] = None,
+             settings: Optional[Dict[str, Any]] = None) -> str:
+    """保存一次压测 (单个接口) 的结果记录，返回文件路径"""
+    info = fetch_server_info(base_url) if base_url else {}
+    config = server_config(info)
+    meta = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "label": label,
+        "preset": preset,
+        "api": metrics.get("api"),
+        "base_url": base_url,
+        "server_version": info.get("version"),
+        "packages": package_versions(),
+        "config_hash": stable_hash(config) if config else None,
+        "server_args": config,
+        "workload_id": workload_id(workload, settings or {}),
+        "num_requests": len(workload),
+        "settings": settings or {},
+        "metrics": metrics,
+    }
+    run_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{meta['api']}-{meta['config_hash'] or 'noinfo'}"
+    if label:
+        run_id += f"-{label}"
+    meta["run_id"] = run_id
+    os.makedirs(store_dir, exist_ok=True)
+    path = os.path.join(store_dir, f"{run_id}.npz")
+    np.savez_compressed(path, meta=np.array(json.dumps(meta, ensure_ascii=False, default=str)),
+                        **results_to_arrays(results))
+    return path
+
+
+def load_run(path: str) -> Tuple[Dict[str, Any], Dict[str, np.ndarray]]:
+    with np.load(path, allow_pickle=False) as data:
+        meta = json.loads(str(data["meta"]))
+        arrays = {k: data[k] for k in data.files if k != "meta"}
+    return meta, arrays
+
+
+def list_runs(store_dir: str) -> List[str]:
+    if not os.path.isdir(store_dir):
+        return []
+    return sorted(os.path.join(store_dir, name) for name in os.listdir(store_dir) if name.endswith(".npz"))
+
+
+def resolve_run(store_dir: str, ref: Optional[str], api: Optional[str] = None) -> str:
+    """结果引用: 文件路径、run_id (可只写前缀)、baseline:<名称>，或 latest (可按接口过滤)"""
+    if ref and os.path.isfile(ref):
+        return ref
+    if ref and ref.startswith("baseline:"):
+        path = os.path.join(store_dir, BASELINE_DIR, f"{ref.split(':', 1)[1]}.npz")
+        if not os.path.isfile(path):
+            raise FileNotFoundError(f"基线不存在: {path}")
+        return path
+    runs = list_runs(store_dir)
+    if ref in (None, "latest"):
+        if api:
+            runs = [p for p in runs if f"-{api}-" in os.path.basename(p)]
+        if not runs:
+            raise FileNotFoundError(f"{store_dir} 中没有压测结果")
+        return runs[-1]
+    matches = [p for p in runs if os.path.basename(p).startswith(ref)]
+    if len(matches) != 1:
+        raise FileNotFoundError(f"无法确定结果 '{ref}' (匹配 {len(matches)} 个)")
+    return matches[0]
+
+
+def request_tpot(arrays: Dict[str, np.ndarray]) -> np.ndarray:
+    ok = arrays["success"] & (arrays["output_tokens"] > 1)
+    return (arrays["latency"][ok] - arrays["ttft"][ok]) * 1000 / (arrays["output_tokens"][ok] - 1)
+
+
+def metric_samples(arrays: Dict[str, np.ndarray], metric: str) -> np.ndarray:
+    """指标对应的逐请求样本 (时延单位 ms)；输出吞吐对应逐请求输出 token 数"""
+    ok = arrays["success"]
+    if "ttft" in metric:
+        return arrays["ttft"][ok & (arrays["output_tokens"] > 0)] * 1000
+    if "tpot" in metric:
+        return request_tpot(arrays)
+    if "e2e" in metric:
+        return arrays["latency"][ok] * 1000
+    return arrays["output_tokens"][ok].astype(np.float64)
+
+
+def bootstrap_statistic(samples: np.ndarray, metric: str, duration: float, rng: np.random.Generator,
+                        num_resamples: int) -> np.ndarray:
+    """对请求重采样得到指标的 bootstrap 分布；吞吐按固定总耗时计算"""
+    n = len(samples)
+    if n == 0:
+        return np.zeros(num_resamples)
+    chunk = max(1, 20_000_000 // n)
+    values = []
+    for start in range(0, num_resamples, chunk):
+        idx = rng.integers(0, n, size=(min(chunk, num_resamples - start), n))
+        resampled = samples[idx]
+        if "throughput" in metric:
+            values.append(resampled.sum(axis=1) / duration)
+        else:
+            q = float(metric.split("_", 1)[0][1:])
+            values.append(np.percentile(resampled, q, axis=1))
+    return np.concatenate(values)
+
+
+def compare_runs(base: Tuple[Dict[str, Any], Dict[str, np.ndarray]],
+                 new: Tuple[Dict[str, Any], Dict[str, np.ndarray]],
+                 threshold: float, confidence: float = 0.95, num_resamples: int = 1000,
+                 seed: int = 0) -> List[Dict[str, Any]]:
+    """逐指标比较 new 相对 base 的变化
+
+    变化超过 threshold (相对值) 且 bootstrap 置信区间不跨过 0 时判定为回退或改善
+    """
+    rng = np.random.default_rng(seed)
+    (base_meta, base_arrays), (new_meta, new_arrays) = base, new
+    alpha = (1 - confidence) / 2
+    rows = []
+    for metric, label, direction in COMPARED_METRICS:
+        base_value = base_meta["metrics"].get(metric, 0.0)
+        new_value = new_meta["metrics"].get(metric, 0.0)
+        base_samples, new_samples = metric_samples(base_arrays, metric), metric_samples(new_arrays, metric)
+        if not base_value:
+            rows.append({"metric": metric, "label": label, "base": base_value, "new": new_value,
+                         "change": 0.0, "ci": (0.0, 0.0), "verdict": "无数据"})
+            continue
+        change = (new_value - base_value) / base_value
+        if "throughput" not in metric:
+            tail = 1 - float(metric.split("_", 1)[0][1:]) / 100
+            if min(len(base_samples), len(new_samples)) * tail < MIN_TAIL_SAMPLES:
+                rows.append({"metric": metric, "label": label, "base": base_value, "new": new_value,
+                             "change": change, "ci": None, "verdict": "样本不足"})
+                continue
+        base_dist = bootstrap_statistic(base_samples, metric, base_meta["metrics"]["duration_s"], rng, num_resamples)
+        new_dist = bootstrap_statistic(new_samples, metric, new_meta["metrics"]["duration_s"], rng, num_resamples)
+        ratios = new_dist / np.where(base_dist == 0, np.nan, base_dist) - 1
+        low, high = np.nanquantile(ratios, [alpha, 1 - alpha]) if np.isfinite(ratios).any() else (change, change)
+        worse = change * direction < -threshold and (high < 0 if direction > 0 else low > 0)
+        better = change * direction > threshold and (low > 0 if direction > 0 else high < 0)
+        rows.append({"metric": metric, "label": label, "base": base_value, "new": new_value,
+                     "change": change, "ci": (float(low), float(high)),
+                     "verdict": "回退" if worse else "改善" if better else "持平"})
+
+    base_fail = base_meta["metrics"]["failed"] / max(base_meta["num_requests"], 1)
+    new_fail = new_meta["metrics"]["failed"] / max(new_meta["num_requests"], 1)
+    rows.append({"metric": "failure_rate", "label": "失败率", "base": base_fail, "new": new_fail,
+                 "change": new_fail - base_fail, "ci": None,
+                 "verdict": "回退" if new_fail - base_fail > threshold else "持平"})
+    return rows
+
+
+def describe_differences(base_meta: Dict[str, Any], new_meta: Dict[str, Any]) -> List[str]:
+    notes = []
+    if base_meta.get("api") != new_meta.get("api"):
+        notes.append(f"接口不同: {base_meta.get('api')} -> {new_meta.get('api')}")
+    if base_meta["workload_id"] != new_meta["workload_id"]:
+        notes.append(f"负载不同 ({base_meta['workload_id']} -> {new_meta['workload_id']})，比较结果仅供参考")
+    if base_meta.get("server_version") != new_meta.get("server_version"):
+        notes.append(f"sglang 服务端版本: {base_meta.get('server_version')} -> {new_meta.get('server_version')}")
+    for name in TRACKED_PACKAGES:
+        old, cur = base_meta["packages"].get(name), new_meta["packages"].get(name)
+        if old != cur:
+            notes.append(f"{name}: {old} -> {cur}")
+    if base_meta.get("preset") != new_meta.get("preset"):
+        notes.append(f"预设: {base_meta.get('preset')} -> {new_meta.get('preset')}")
+    if base_meta.get("config_hash") != new_meta.get("config_hash"):
+        old_args, new_args = base_meta.get("server_args") or {}, new_meta.get("server_args") or {}
+        changed = sorted(k for k in set(old_args) | set(new_args) if old_args.get(k) != new_args.get(k))
+        shown = ", ".join(f"{k}: {old_args.get(k)} -> {new_args.get(k)}" for k in changed[:10])
+        notes.append(f"服务端配置变化 ({len(changed)} 项): {shown}" + (" ..." if len(changed) > 10 else ""))
+    return notes
+
+
+def print_comparison(base_path: str, new_path: str, base_meta: Dict[str, Any], new_meta: Dict[str, Any],
+                     rows: List[Dict[str, Any]], threshold: float):
+    print("=" * 96)
+    print(f"基准: {base_meta['run_id']} ({os.path.basename(base_path)})")
+    print(f"对比: {new_meta['run_id']} ({os.path.basename(new_path)})")
+    for note in describe_differences(base_meta, new_meta):
+        print(f"  - {note}")
+    print("-" * 96)
+    print(f"{'指标':<20}{'基准':>12}{'对比':>12}{'变化':>10}{'95% 置信区间':>24}{'结论':>8}")
+    for row in rows:
+        if row["metric"] == "failure_rate":
+            print(f"{row['label']:<20}{row['base']:>12.2%}{row['new']:>12.2%}{row['change']:>+10.2%}"
+                  f"{'':>24}{row['verdict']:>8}")
+            continue
+        ci = f"[{row['ci'][0]:+.1%}, {row['ci'][1]:+.1%}]" if row["ci"] else "-"
+        print(f"{row['label']:<20}{row['base']:>12.2f}{row['new']:>12.2f}{row['change']:>+10.1%}"
+              f"{ci:>24}{row['verdict']:>8}")
+    print("=" * 96)
+    regressions = [row["label"] for row in rows if row["verdict"] == "回退"]
+    if regressions:
+        print(f"检测到回退 (阈值 {threshold:.0%}): {', '.join(regressions)}")
+    else:
+        print(f"未检测到超过 {threshold:.0%} 的显著回退")
+
+
+def print_runs(paths: List[str]):
+    print(f"{'run_id':<48}{'负载':>14}{'请求':>7}{'吞吐 tok/s':>12}{'p99 TTFT':>10}{'sglang':>12}")
+    for path in paths:
+        meta, _ = load_run(path)
+        m = meta["metrics"]
+        version = meta.get("server_version") or meta["packages"].get("sglang") or "-"
+        print(f"{meta['run_id']:<48}{meta['workload_id']:>14}{meta['num_requests']:>7}"
+              f"{m['output_throughput']:>12.1f}{m['p99_ttft_ms']:>10.1f}{version:>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="压测结果存储与回归比较",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+示例:
+  python benchmark.py --api chat --dataset workload.jsonl          # 每次运行自动保存到 bench_results/
+  python bench_store.py list
+  python bench_store.py set-baseline latest --name sglang-0.4.6    # 升级前保存基线
+  python bench_store.py compare latest --base baseline:sglang-0.4.6 --threshold 0.05
+        """,
+    )
+    parser.add_argument("--store-dir", default=DEFAULT_STORE_DIR, help="结果目录")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("list", help="列出已保存的结果")
+
+    baseline = subparsers.add_parser("set-baseline", help="把一次运行保存为基线")
+    baseline.add_argument("run", help="run_id 前缀、文件路径或 latest")
+    baseline.add_argument("--name", default=DEFAULT_BASELINE, help="基线名称")
+
+    compare = subparsers.add_parser("compare", help="比较两次运行，出现回退时退出码为 1")
+    compare.add_argument("new", nargs="?", default="latest", help="待检查的运行 (默认最新一次)")
+    compare.add_argument("--base", default=f"baseline:{DEFAULT_BASELINE}",
+                         help="基准运行: run_id 前缀、文件路径或 baseline:<名称>")
+    compare.add_argument("--threshold", type=float, default=0.05, help="判定回退的相对变化阈值")
+    compare.add_argument("--confidence", type=float, default=0.95, help="bootstrap 置信水平")
+    compare.add_argument("--resamples", type=int, default=1000, help="bootstrap 重采样次数")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        runs = list_runs(args.store_dir)
+        if not runs:
+            print(f"{args.store_dir} 中没有压测结果")
+            return
+        print_runs(runs)
+        return
+
+    try:
+        if args.command == "set-baseline":
+            source = resolve_run(args.store_dir, args.run)
+            target_dir = os.path.join(args.store_dir, BASELINE_DIR)
+            os.makedirs(target_dir, exist_ok=True)
+            target = os.path.join(target_dir, f"{args.name}.npz")
+            shutil.copyfile(source, target)
+            print(f"基线 '{args.name}' <- {os.path.basename(source)}")
+            return
+
+        new_path = resolve_run(args.store_dir, args.new)
+        new = load_run(new_path)
+        base_path = resolve_run(args.store_dir, args.base, api=new[0].get("api"))
+        base = load_run(base_path)
+    except FileNotFoundError as e:
+        print(f"错误: {e}")
+        sys.exit(2)
+
+    rows = compare_runs(base, new, args.threshold, args.confidence, args.resamples)
+    print_comparison(base_path, new_path, base[0], new[0], rows, args.threshold)
+    if any(row["verdict"] == "回退" for row in rows):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+SGLang 异步压测工具
+以流式方式驱动 /v1/completions 与 /v1/chat/completions，
+统计请求吞吐、输出 token 吞吐以及 TTFT/TPOT/ITL 分位数
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from bench_store import DEFAULT_STORE_DIR, save_run
+from http_transport import TRANSPORT_ERRORS, AsyncTransport
+from streaming import aiter_sse_events, extract_delta_text
+
+API_ENDPOINTS = {
+    "completions": "/v1/completions",
+    "chat": "/v1/chat/completions",
+}
+
+DEFAULT_SYSTEM_PROMPT = "你是一个有用的AI助手，请简洁明了地回答用户问题，不要显示思考过程。"
+
+DEFAULT_QUESTIONS = [
+    "什么是人工智能？",
+    "什么是深度学习？",
+    "谁发明了电话？",
+    "解释一下区块链技术",
+    "机器学习和人工智能的区别？",
+    "Python 的主要特点？",
+    "什么是自然语言处理？",
+    "介绍一下量子计算的基本原理。",
+]
+
+PERCENTILES = [50, 90, 99]
+
+
+@dataclass
+class RequestResult:
+    """单个流式请求的测量结果"""
+    success: bool = False
+    ttft: float = 0.0
+    latency: float = 0.0
+    prompt_tokens: int = 0
+    output_tokens: int = 0
+    itl: List[float] = field(default_factory=list)
+    error: str = ""
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """线性插值分位数 (输入需已排序)"""
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * p / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def build_default_workload(api: str, num_prompts: int, max_tokens: int) -> List[Dict[str, Any]]:
+    """使用内置中文问题构造压测请求"""
+    workload = []
+    for i in range(num_prompts):
+        question = DEFAULT_QUESTIONS[i % len(DEFAULT_QUESTIONS)]
+        if api == "chat":
+            body = {
+                "messages": [
+                    {"role": "system", "content": DEFAULT_SYSTEM_PROMPT},
+                    {"role": "user", "content": question},
+                ]
+            }
+        else:
+            body = {"prompt": question}
+        body["max_tokens"] = max_tokens
+        workload.append(body)
+    return workload
+
+
+def load_workload(path: str, api: str, num_prompts: Optional[int], max_tokens: int) -> List[Dict[str, Any]]:
+    """从 JSONL 加载请求，每行为 chat (messages) 或 completions (prompt) 请求体，也可包在 body 中"""
+    workload = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            item = item.get("body", item)
+            body = {k: v for k, v in item.items() if k not in ("messages", "prompt")}
+            if api == "chat":
+                messages = item.get("messages") or [{"role": "user", "content": item.get("prompt", "")}]
+                body["messages"] = messages
+            else:
+                prompt = item.get("prompt")
+                if prompt is None:
+                    prompt = "\n".join(m.get("content") or "" for m in item.get("messages", []))
+                body["prompt"] = prompt
+            body.setdefault("max_tokens", max_tokens)
+            workload.append(body)
+            if num_prompts and len(workload) >= num_prompts:
+                break
+    return workload
+
+
+def prepare_payload(body: Dict[str, Any], api: str, enable_thinking: bool = False,
+                    ignore_eos: bool = False) -> Dict[str, Any]:
+    """补全流式压测所需的请求字段"""
+    payload = dict(body)
+    payload.setdefault("model", "default")
+    payload["stream"] = True
+    # 让服务器在最后一个 chunk 中返回准确的 token 用量
+    payload.setdefault("stream_options", {"include_usage": True})
+    if api == "chat":
+        payload.setdefault("chat_template_kwargs", {"enable_thinking": enable_thinking})
+    if ignore_eos:
+        payload["ignore_eos"] = True
+    return payload
+
+
+async def send_streaming_request(transport: AsyncTransport, url: str,
+                                 payload: Dict[str, Any], chat: bool) -> RequestResult:
+    """发送一个流式请求并记录首 token 时间与 token 间隔"""
+    result = RequestResult()
+    chunks = 0
+    last_time = None
+    start = time.perf_counter()
+    try:
+        async with transport.post_json(url, payload) as response:
+            if response.status != 200:
+                result.error = f"HTTP {response.status}: {await response.text()}"
+                return result
+            async for event in aiter_sse_events(response.aiter_bytes()):
+                now = time.perf_counter()
+                usage = event.get("usage")
+                if usage:
+                    result.prompt_tokens = usage.get("prompt_tokens", 0)
+                    result.output_tokens = usage.get("completion_tokens", 0)
+                if not extract_delta_text(event, chat):
+                    continue
+                if last_time is None:
+                    result.ttft = now - start
+                else:
+                    result.itl.append(now - last_time)
+                last_time = now
+                chunks += 1
+        result.latency = time.perf_counter() - start
+        if not result.output_tokens:
+            # 服务器未返回 usage 时，以内容 chunk 数近似输出 token 数
+            result.output_tokens = chunks
+        result.success = True
+    except TRANSPORT_ERRORS + (ValueError,) as e:
+        result.error = f"{type(e).__name__}: {e}"
+    return result
+
+
+async def run_benchmark(base_url: str, api: str, workload: List[Dict[str, Any]],
+                        request_rate: float = float("inf"), concurrency: Optional[int] = None,
+                        enable_thinking: bool = False, ignore_eos: bool = False,
+                        timeout: float = 600, seed: int = 0, http2: bool = False) -> Dict[str, Any]:
+    """执行一轮压测
+
+    request_rate 为开环泊松到达率 (req/s)，inf 表示一次性全部发出；
+    concurrency 限制同时在途的请求数，两者可组合使用。
+    """
+    url = f"{base_url}{API_ENDPOINTS[api]}"
+    chat = api == "chat"
+    rng = random.Random(seed)
+    semaphore = asyncio.Semaphore(concurrency) if concurrency else None
+
+    async def limited_request(transport, payload):
+        if semaphore is None:
+            return await send_streaming_request(transport, url, payload, chat)
+        async with semaphore:
+            return await send_streaming_request(transport, url, payload, chat)
+
+    # 连接池上限与并发上限一致；不限并发时不限制连接数
+    async with AsyncTransport(pool_size=concurrency or 0, timeout=timeout, http2=http2) as transport:
+        tasks = []
+        start = time.perf_counter()
+        for i, body in enumerate(workload):
+            payload = prepare_payload(body, api, enable_thinking, ignore_eos)
+            tasks.append(asyncio.create_task(limited_request(transport, payload)))
+            if request_rate != float("inf") and i < len(workload) - 1:
+                await asyncio.sleep(rng.expovariate(request_rate))
+        results = await asyncio.gather(*tasks)
+        duration = time.perf_counter() - start
+
+    metrics = summarize_results(results, duration)
+    metrics.update({"api": api, "request_rate": request_rate, "concurrency": concurrency})
+    return {"metrics": metrics, "results": results}
+
+
+def summarize_results(results: List[RequestResult], duration: float) -> Dict[str, Any]:
+    """汇总吞吐与延迟分位数 (延迟单位: 毫秒)"""
+    ok = [r for r in results if r.success]
+    ttfts = sorted(r.ttft * 1000 for r in ok if r.output_tokens > 0)
+    latencies = sorted(r.latency * 1000 for r in ok)
+    tpots = sorted((r.latency - r.ttft) * 1000 / (r.output_tokens - 1) for r in ok if r.output_tokens > 1)
+    itls = sorted(gap * 1000 for r in ok for gap in r.itl)
+    total_output = sum(r.output_tokens for r in ok)
+
+    metrics: Dict[str, Any] = {
+        "completed": len(ok),
+        "failed": len(results) - len(ok),
+        "duration_s": duration,
+        "total_input_tokens": sum(r.prompt_tokens for r in ok),
+        "total_output_tokens": total_output,
+        "request_throughput": len(ok) / duration if duration > 0 else 0.0,
+        "output_throughput": total_output / duration if duration > 0 else 0.0,
+    }
+    for name, values in (("ttft", ttfts), ("tpot", tpots), ("itl", itls), ("e2e_latency", latencies)):
+        metrics[f"mean_{name}_ms"] = sum(values) / len(values) if values else 0.0
+        for p in PERCENTILES:
+            metrics[f"p{p}_{name}_ms"] = percentile(values, p)
+    return metrics
+
+
+def print_summary(metrics: Dict[str, Any]):
+    """打印压测结果摘要"""
+    print("=" * 60)
+    print(f"压测结果 - {API_ENDPOINTS.get(metrics['api'], metrics['api'])}")
+    print("=" * 60)
+    print(f"请求到达率: {metrics['request_rate']} req/s, 并发上限: {metrics['concurrency'] or '不限'}")
+    print(f"成功请求: {metrics['completed']}, 失败请求: {metrics['failed']}")
+    print(f"总耗时: {metrics['duration_s']:.2f} 秒")
+    print(f"输入 token 总数: {metrics['total_input_tokens']}")
+    print(f"输出 token 总数: {metrics['total_output_tokens']}")
+    print(f"请求吞吐: {metrics['request_throughput']:.2f} req/s")
+    print(f"输出吞吐: {metrics['output_throughput']:.2f} tok/s")
+    print("-" * 60)
+    print(f"{'指标 (ms)':<16}{'mean':>10}" + "".join(f"{'p' + str(p):>10}" for p in PERCENTILES))
+    for name, label in (("ttft", "TTFT"), ("tpot", "TPOT"), ("itl", "ITL"), ("e2e_latency", "E2E")):
+        row = f"{label:<16}{metrics[f'mean_{name}_ms']:>10.2f}"
+        row += "".join(f"{metrics[f'p{p}_{name}_ms']:>10.2f}" for p in PERCENTILES)
+        print(row)
+    print("=" * 60)
+
+
+def add_benchmark_arguments(parser: argparse.ArgumentParser):
+    """注册压测相关命令行参数"""
+    group = parser.add_argument_group("压测配置")
+    group.add_argument("--api", choices=["completions", "chat", "both"], default="both",
+                       help="压测的接口")
+    group.add_argument("--dataset", help="请求 JSONL 文件 (每行包含 messages 或 prompt)")
+    group.add_argument("--num-prompts", type=int, default=100, help="请求总数")
+    group.add_argument("--request-rate", type=float, default=float("inf"),
+                       help="泊松到达率 (req/s)，默认 inf 表示一次性发出")
+    group.add_argument("--concurrency", type=int, help="最大在途请求数")
+    group.add_argument("--ignore-eos", action="store_true", help="忽略 EOS，固定输出长度")
+    group.add_argument("--enable-thinking", action="store_true", help="chat 请求启用思考模式")
+    group.add_argument("--request-timeout", type=float, default=600, help="单请求超时时间(秒)")
+    group.add_argument("--seed", type=int, default=0, help="到达过程随机种子")
+    group.add_argument("--http2", action="store_true", help="使用 HTTP/2 (需要 httpx[http2])")
+    group.add_argument("--output-json", help="将压测指标写入 JSON 文件")
+    group.add_argument("--store-dir", default=DEFAULT_STORE_DIR,
+                       help="结果记录目录 (逐请求时延 + 版本/配置信息，供 bench_store.py compare 使用)")
+    group.add_argument("--no-store", action="store_true", help="不保存结果记录")
+    group.add_argument("--label", help="结果记录的标签 (会加入 run_id)")
+    group.add_argument("--preset", help="结果记录中注明服务端使用的预设")
+
+
+def run_from_args(args: argparse.Namespace, base_url: str) -> List[Dict[str, Any]]:
+    """根据命令行参数执行压测并打印结果"""
+    apis = ["completions", "chat"] if args.api == "both" else [args.api]
+    all_metrics = []
+    for api in apis:
+        if args.dataset:
+            workload = load_workload(args.dataset, api, args.num_prompts, args.max_tokens)
+        else:
+            workload = build_default_workload(api, args.num_prompts, args.max_tokens)
+        print(f"\n开始压测 {API_ENDPOINTS[api]}，共 {len(workload)} 个请求...")
+        outcome = asyncio.run(run_benchmark(
+            base_url, api, workload,
+            request_rate=args.request_rate,
+            concurrency=args.concurrency,
+            enable_thinking=args.enable_thinking,
+            ignore_eos=args.ignore_eos,
+            timeout=args.request_timeout,
+            seed=args.seed,
+            http2=args.http2,
+        ))
+        metrics = outcome["metrics"]
+        print_summary(metrics)
+        failures = [r.error for r in outcome["results"] if not r.success]
+        if failures:
+            print(f"失败示例: {failures[0]}")
+        if not args.no_store:
+            settings = {"api": api, "request_rate": args.request_rate, "concurrency": args.concurrency,
+                        "ignore_eos": args.ignore_eos, "enable_thinking": args.enable_thinking, "seed": args.seed}
+            path = save_run(args.store_dir, outcome["results"], metrics, workload, base_url,
+                            label=args.label, preset=args.preset, settings=settings)
+            print(f"结果记录已保存到: {path}")
+        all_metrics.append(metrics)
+
+    if args.output_json:
+        with open(args.output_json, 'w', encoding='utf-8') as f:
+            json.dump(all_metrics, f, ensure_ascii=False, indent=2)
+        print(f"压测指标已保存到: {args.output_json}")
+    return all_metrics
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SGLang 流式压测工具")
+    parser.add_argument("--host", default="localhost", help="服务器主机地址")
+    parser.add_argument("--port", default=30000, type=int, help="服务器端口")
+    parser.add_argument("--max-tokens", default=256, type=int, help="最大生成token数")
+    add_benchmark_arguments(parser)
+    args = parser.parse_args()
+    run_from_args(args, f"http://{args.host}:{args.port}")
+
+
+if __name__ == "__main__":
+    main()
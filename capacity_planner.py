@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""
+KV 缓存与显存容量规划
+根据模型 config.json、权重精度/量化方案和 GPU 显存，在启动前估算权重占用、每 token KV 字节数、
+可缓存 token 总数以及指定上下文长度下的最大并发请求数，提前发现会 OOM 或 KV 容量过小的配置
+"""
+
+import argparse
+import copy
+import json
+import os
+import struct
+import subprocess
+import sys
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+DTYPE_BYTES = {
+    "float32": 4, "float": 4,
+    "float16": 2, "half": 2, "bfloat16": 2,
+    "float8_e4m3fn": 1, "float8_e5m2": 1,
+}
+
+KV_CACHE_DTYPE_BYTES = {"fp8_e5m2": 1, "fp8_e4m3": 1, "int8": 1}
+
+# 量化后线性层每个权重的平均比特数 (含分组 scale/zero，按 16 位计)
+TORCHAO_BITS = {
+    "int4wo-64": 4 + 32 / 64,
+    "int4wo-128": 4 + 32 / 128,
+    "int8wo": 8,
+    "int8dq": 8,
+    "fp8wo": 8,
+    "fp8dq-per_tensor": 8,
+    "fp8dq-per_row": 8,
+    "gemlite-4-64": 4 + 32 / 64,
+    "gemlite-8-64": 8 + 32 / 64,
+}
+
+QUANTIZATION_BITS = {
+    "fp8": 8,
+    "awq": 4 + 32 / 128,
+    "gptq": 4 + 32 / 128,
+    "marlin": 4 + 32 / 128,
+    "awq_marlin": 4 + 32 / 128,
+    "gptq_marlin": 4 + 32 / 128,
+    "bitsandbytes": 4 + 32 / 64,
+}
+
+# SGLang 未指定 mem_fraction_static 时的近似默认值
+DEFAULT_MEM_FRACTION_STATIC = 0.88
+GIB = 1024 ** 3
+
+
+@dataclass
+class ModelShape:
+    """从 config.json 提取的模型结构"""
+    num_layers: int
+    hidden_size: int
+    num_attention_heads: int
+    num_kv_heads: int
+    head_dim: int
+    vocab_size: int
+    intermediate_size: int
+    tie_word_embeddings: bool = False
+    num_experts: int = 0
+    moe_intermediate_size: int = 0
+    torch_dtype: str = "bfloat16"
+    checkpoint_quant_bits: Optional[float] = None
+    checkpoint_params: Optional[int] = None
+
+    @property
+    def embedding_params(self) -> int:
+        return self.vocab_size * self.hidden_size * (1 if self.tie_word_embeddings else 2)
+
+    @property
+    def estimated_params(self) -> int:
+        """按结构估算总参数量 (忽略 norm/bias)"""
+        attn = self.hidden_size * self.head_dim * (2 * self.num_attention_heads + 2 * self.num_kv_heads)
+        if self.num_experts:
+            mlp = self.num_experts * 3 * self.hidden_size * self.moe_intermediate_size
+            mlp += self.num_experts * self.hidden_size
+        else:
+            mlp = 3 * self.hidden_size * self.intermediate_size
+        return self.num_layers * (attn + mlp) + self.embedding_params
+
+    @property
+    def total_params(self) -> int:
+        return self.checkpoint_params or self.estimated_params
+
+
+@dataclass
+class CapacityPlan:
+    """容量规划结果 (均为单张 GPU)"""
+    gpu_memory_gb: float
+    tp_size: int
+    pp_size: int
+    mem_fraction_static: float
+    weight_desc: str
+    kv_cache_dtype: str
+    total_params: int
+    weight_bytes: float
+    kv_bytes_per_token: float
+    kv_pool_bytes: float
+    cacheable_tokens: int
+    context_length: Optional[int]
+    max_concurrency: Optional[int]
+    max_running_requests: Optional[int]
+    warnings: List[str] = field(default_factory=list)
+    errors: List[str] = field(default_factory=list)
+
+    @property
+    def feasible(self) -> bool:
+        return not self.errors
+
+
+def _checkpoint_quant_bits(quant_config: Optional[Dict[str, Any]]) -> Optional[float]:
+    """预量化权重 (config.json 中的 quantization_config) 的平均比特数"""
+    if not quant_config:
+        return None
+    method = str(quant_config.get("quant_method", "")).lower()
+    if method == "fp8":
+        return 8
+    bits = quant_config.get("bits") or quant_config.get("w_bit")
+    if bits:
+        group_size = quant_config.get("group_size") or quant_config.get("q_group_size") or 128
+        return bits + (32 / group_size if group_size and group_size > 0 else 0)
+    return QUANTIZATION_BITS.get(method)
+
+
+def _safetensors_params(model_path: str, dtype_bytes: int) -> Optional[int]:
+    """从 safetensors 索引或文件头读取真实参数量，无需加载权重"""
+    index_path = os.path.join(model_path, "model.safetensors.index.json")
+    if os.path.exists(index_path):
+        with open(index_path, 'r', encoding='utf-8') as f:
+            total_size = json.load(f).get("metadata", {}).get("total_size")
+        return int(total_size // dtype_bytes) if total_size else None
+
+    single_path = os.path.join(model_path, "model.safetensors")
+    if not os.path.exists(single_path):
+        return None
+    with open(single_path, 'rb') as f:
+        header_len = struct.unpack("<Q", f.read(8))[0]
+        header = json.loads(f.read(header_len))
+    params = 0
+    for name, info in header.items():
+        if name == "__metadata__":
+            continue
+        count = 1
+        for dim in info.get("shape", []):
+            count *= dim
+        params += count
+    return params
+
+
+def load_model_shape(model_path: str) -> ModelShape:
+    """读取 model_path/config.json；多模态模型取 text_config"""
+    with open(os.path.join(model_path, "config.json"), 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    text_config = config.get("text_config") or config.get("llm_config") or config
+
+    hidden_size = text_config["hidden_size"]
+    num_heads = text_config["num_attention_heads"]
+    torch_dtype = str(text_config.get("torch_dtype") or config.get("torch_dtype") or "bfloat16")
+    shape = ModelShape(
+        num_layers=text_config["num_hidden_layers"],
+        hidden_size=hidden_size,
+        num_attention_heads=num_heads,
+        num_kv_heads=text_config.get("num_key_value_heads") or num_heads,
+        head_dim=text_config.get("head_dim") or hidden_size // num_heads,
+        vocab_size=text_config.get("vocab_size", 0),
+        intermediate_size=text_config.get("intermediate_size", 4 * hidden_size),
+        tie_word_embeddings=bool(config.get("tie_word_embeddings", text_config.get("tie_word_embeddings", False))),
+        num_experts=text_config.get("num_experts") or text_config.get("n_routed_experts") or 0,
+        moe_intermediate_size=text_config.get("moe_intermediate_size") or 0,
+        torch_dtype=torch_dtype.replace("torch.", ""),
+        checkpoint_quant_bits=_checkpoint_quant_bits(config.get("quantization_config")),
+    )
+    # 预量化权重的文件大小不能直接换算为参数量
+    if shape.checkpoint_quant_bits is None:
+        shape.checkpoint_params = _safetensors_params(model_path, DTYPE_BYTES.get(shape.torch_dtype, 2))
+    return shape
+
+
+def detect_gpu_memory_gb() -> Optional[float]:
+    """通过 nvidia-smi 获取第一张 GPU 的显存 (GiB)"""
+    try:
+        output = subprocess.run(["nvidia-smi", "--query-gpu=memory.total", "--format=csv,noheader,nounits"],
+                                capture_output=True, text=True, timeout=10).stdout
+        return float(output.strip().splitlines()[0]) / 1024
+    except (OSError, subprocess.SubprocessError, IndexError, ValueError):
+        return None
+
+
+def _flag(cmd: List[str], name: str) -> Optional[str]:
+    return cmd[cmd.index(name) + 1] if name in cmd else None
+
+
+def plan_capacity(shape: ModelShape, gpu_memory_gb: float, tp_size: int = 1, pp_size: int = 1,
+                  dtype: Optional[str] = None, torchao_config: Optional[str] = None,
+                  quantization: Optional[str] = None, kv_cache_dtype: Optional[str] = None,
+                  mem_fraction_static: Optional[float] = None, context_length: Optional[int] = None,
+                  max_running_requests: Optional[int] = None) -> CapacityPlan:
+    """估算单卡显存分配
+
+    SGLang 把 GPU 显存的 mem_fraction_static 用于权重 + KV 缓存池，其余留给激活和 CUDA Graph。
+    """
+    if not dtype or dtype == "auto":
+        dtype = shape.torch_dtype
+    dtype_bytes = DTYPE_BYTES.get(dtype, 2)
+    mem_fraction = mem_fraction_static or DEFAULT_MEM_FRACTION_STATIC
+    warnings: List[str] = []
+    errors: List[str] = []
+
+    # 权重: 线性层按量化比特数，embedding / lm_head 保持原精度
+    linear_params = max(shape.total_params - shape.embedding_params, 0)
+    if torchao_config:
+        linear_bits = TORCHAO_BITS.get(torchao_config, dtype_bytes * 8)
+        weight_desc = f"{dtype} + TorchAO {torchao_config}"
+    elif quantization:
+        linear_bits = QUANTIZATION_BITS.get(quantization, dtype_bytes * 8)
+        weight_desc = f"{dtype} + {quantization}"
+    elif shape.checkpoint_quant_bits:
+        linear_bits = shape.checkpoint_quant_bits
+        weight_desc = f"预量化权重 ({linear_bits:g} bit)"
+    else:
+        linear_bits = dtype_bytes * 8
+        weight_desc = dtype
+    # 流水线并行按层切分，每张卡只持有 1/pp 的层
+    weight_bytes = (linear_params * linear_bits / 8 + shape.embedding_params * dtype_bytes) / tp_size / pp_size
+
+    # KV: 每层 K 和 V 各 kv_heads * head_dim 个元素；kv_heads 少于 tp 时每张卡复制一份
+    kv_dtype = kv_cache_dtype or "auto"
+    kv_elem_bytes = KV_CACHE_DTYPE_BYTES.get(kv_dtype, dtype_bytes)
+    kv_heads_per_gpu = max(shape.num_kv_heads // tp_size, 1)
+    layers_per_gpu = -(-shape.num_layers // pp_size)
+    kv_bytes_per_token = 2 * layers_per_gpu * kv_heads_per_gpu * shape.head_dim * kv_elem_bytes
+
+    gpu_bytes = gpu_memory_gb * GIB
+    kv_pool_bytes = gpu_bytes * mem_fraction - weight_bytes
+    cacheable_tokens = int(kv_pool_bytes // kv_bytes_per_token) if kv_pool_bytes > 0 else 0
+    max_concurrency = cacheable_tokens // context_length if context_length else None
+
+    if weight_bytes > gpu_bytes * mem_fraction:
+        errors.append(f"权重 {weight_bytes / GIB:.1f} GiB 超过静态显存 "
+                      f"{gpu_bytes * mem_fraction / GIB:.1f} GiB (mem_fraction_static={mem_fraction})，启动时会 OOM")
+    elif context_length and cacheable_tokens < context_length:
+        errors.append(f"KV 缓存只能容纳 {cacheable_tokens} token，不足一个 {context_length} token 的完整上下文")
+    elif max_concurrency is not None and max_running_requests and max_concurrency < max_running_requests:
+        warnings.append(f"满上下文时最多 {max_concurrency} 个并发请求，低于 max_running_requests="
+                        f"{max_running_requests}，长请求会排队或被抢占")
+    if mem_fraction > 0.95:
+        warnings.append(f"mem_fraction_static={mem_fraction} 过高，激活和 CUDA Graph 可能没有足够显存")
+    if mem_fraction_static is None:
+        warnings.append(f"未指定 mem_fraction_static，按 {DEFAULT_MEM_FRACTION_STATIC} 估算")
+
+    return CapacityPlan(
+        gpu_memory_gb=gpu_memory_gb,
+        tp_size=tp_size,
+        pp_size=pp_size,
+        mem_fraction_static=mem_fraction,
+        weight_desc=weight_desc,
+        kv_cache_dtype=kv_dtype,
+        total_params=shape.total_params,
+        weight_bytes=weight_bytes,
+        kv_bytes_per_token=kv_bytes_per_token,
+        kv_pool_bytes=max(kv_pool_bytes, 0),
+        cacheable_tokens=cacheable_tokens,
+        context_length=context_length,
+        max_concurrency=max_concurrency,
+        max_running_requests=max_running_requests,
+        warnings=warnings,
+        errors=errors,
+    )
+
+
+def plan_from_command(cmd: List[str], gpu_memory_gb: float,
+                      shape: Optional[ModelShape] = None) -> CapacityPlan:
+    """按 build_command 生成的启动命令规划，与实际启动参数保持一致"""
+    if shape is None:
+        shape = load_model_shape(_flag(cmd, "--model-path"))
+    mem_fraction = _flag(cmd, "--mem-fraction-static")
+    context_length = _flag(cmd, "--context-length")
+    max_running = _flag(cmd, "--max-running-requests")
+    return plan_capacity(
+        shape, gpu_memory_gb,
+        tp_size=int(_flag(cmd, "--tp-size") or 1),
+        pp_size=int(_flag(cmd, "--pp-size") or 1),
+        dtype=_flag(cmd, "--dtype"),
+        torchao_config=_flag(cmd, "--torchao-config"),
+        quantization=_flag(cmd, "--quantization"),
+        kv_cache_dtype=_flag(cmd, "--kv-cache-dtype"),
+        mem_fraction_static=float(mem_fraction) if mem_fraction else None,
+        context_length=int(context_length) if context_length else None,
+        max_running_requests=int(max_running) if max_running else None,
+    )
+
+
+def print_plan(plan: CapacityPlan, title: str = "显存容量规划"):
+    print("=" * 60)
+    print(f"{title} (单卡 {plan.gpu_memory_gb:.1f} GiB, TP={plan.tp_size}, PP={plan.pp_size})")
+    print("=" * 60)
+    print(f"参数量:          {plan.total_params / 1e9:.2f} B")
+    print(f"权重精度:        {plan.weight_desc}")
+    print(f"权重占用:        {plan.weight_bytes / GIB:.2f} GiB")
+    print(f"静态显存比例:    {plan.mem_fraction_static}")
+    print(f"KV 缓存类型:     {plan.kv_cache_dtype}")
+    print(f"每 token KV:     {plan.kv_bytes_per_token / 1024:.1f} KiB")
+    print(f"KV 缓存池:       {plan.kv_pool_bytes / GIB:.2f} GiB")
+    print(f"可缓存 token:    {plan.cacheable_tokens:,}")
+    if plan.context_length:
+        print(f"满上下文并发:    {plan.max_concurrency} (context_length={plan.context_length})")
+    for warning in plan.warnings:
+        print(f"警告: {warning}")
+    for error in plan.errors:
+        print(f"错误: {error}")
+    print("=" * 60)
+
+
+def main():
+    from launch_server import SGLangServerLauncher
+
+    parser = argparse.ArgumentParser(
+        description="SGLang 显存容量规划 - 启动前评估配置/预设是否可行",
+        epilog="未识别的参数会原样传给 launch_server.py 的参数解析 (例如 --config, --model-path, --tp)",
+    )
+    parser.add_argument("--gpu-memory-gb", type=float, help="单卡显存 GiB (默认通过 nvidia-smi 检测)")
+    parser.add_argument("--all-presets", action="store_true", help="评估配置文件中的所有量化预设")
+    args, launcher_argv = parser.parse_known_args()
+
+    gpu_memory_gb = args.gpu_memory_gb or detect_gpu_memory_gb()
+    if gpu_memory_gb is None:
+        print("错误: 无法检测 GPU 显存，请使用 --gpu-memory-gb 指定")
+        sys.exit(1)
+
+    launcher = SGLangServerLauncher()
+    launcher_args = launcher.create_parser().parse_args(launcher_argv)
+    base_config = launcher.load_config(launcher_args.config or launcher.default_config_path)
+    if args.all_presets:
+        presets = list(base_config.get('quantization_presets', {}))
+    else:
+        presets = [launcher_args.preset]
+
+    try:
+        shape = load_model_shape(launcher_args.model_path or base_config.get('model', {}).get('model_path'))
+    except (OSError, KeyError, ValueError) as e:
+        print(f"错误: 无法读取模型 config.json: {e}")
+        sys.exit(1)
+
+    infeasible = 0
+    for preset in presets:
+        config = copy.deepcopy(base_config)
+        if preset:
+            config = launcher.apply_quantization_preset(config, preset)
+        plan = plan_from_command(launcher.build_command(launcher_args, config), gpu_memory_gb, shape)
+        print_plan(plan, f"预设 {preset}" if preset else "显存容量规划")
+        infeasible += not plan.feasible
+    sys.exit(1 if infeasible else 0)
+
+
+if __name__ == "__main__":
+    main()
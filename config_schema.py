@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+服务器配置 schema
+把 server_config.yaml 中与性能相关的键映射为 sglang.launch_server 参数并做类型检查，
+再用已安装 SGLang 版本的 --help 输出核对每个参数，避免配置项被静默忽略
+"""
+
+import functools
+import hashlib
+import os
+import re
+import subprocess
+import tempfile
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+
+@dataclass(frozen=True)
+class ConfigOption:
+    """一个配置键到服务器参数的映射"""
+    section: str
+    key: str
+    flag: str
+    type: type
+    arg: Optional[str] = None  # 覆盖该键的 launch_server.py 命令行参数名
+    choices: Optional[Tuple[str, ...]] = None
+    negate: bool = False  # 布尔值为 false 时输出参数，例如 enable_radix_cache: false -> --disable-radix-cache
+    aliases: Tuple[Tuple[str, str], ...] = ()  # 兼容的其他 (section, key) 位置
+
+
+SCHEMA = [
+    # 调度
+    ConfigOption("optimization", "schedule_policy", "--schedule-policy", str, arg="schedule_policy",
+                 choices=("lpm", "random", "fcfs", "dfs-weight", "lof")),
+    ConfigOption("optimization", "schedule_conservativeness", "--schedule-conservativeness", float,
+                 arg="schedule_conservativeness"),
+    ConfigOption("optimization", "enable_mixed_chunk", "--enable-mixed-chunk", bool, arg="enable_mixed_chunk"),
+    # 前缀缓存
+    ConfigOption("attention", "disable_radix_cache", "--disable-radix-cache", bool, arg="disable_radix_cache"),
+    ConfigOption("attention", "enable_radix_cache", "--disable-radix-cache", bool, negate=True),
+    # 日志与指标
+    ConfigOption("logging", "log_level", "--log-level", str,
+                 choices=("debug", "info", "warning", "error", "critical")),
+    ConfigOption("logging", "log_stats", "--enable-metrics", bool, arg="enable_metrics"),
+    ConfigOption("logging", "show_time_cost", "--show-time-cost", bool),
+    # 模型与接口
+    ConfigOption("model", "tokenizer_path", "--tokenizer-path", str),
+    ConfigOption("model", "tokenizer_mode", "--tokenizer-mode", str, choices=("auto", "slow")),
+    ConfigOption("model", "revision", "--revision", str),
+    ConfigOption("compatibility", "chat_template", "--chat-template", str, arg="chat_template"),
+    ConfigOption("compatibility", "tool_call_parser", "--tool-call-parser", str),
+    ConfigOption("compatibility", "skip_tokenizer_init", "--skip-tokenizer-init", bool, arg="skip_tokenizer_init"),
+]
+
+
+def _lookup(config: Dict[str, Any], option: ConfigOption) -> Any:
+    for section, key in ((option.section, option.key),) + option.aliases:
+        value = (config.get(section) or {}).get(key)
+        if value is not None:
+            return value
+    return None
+
+
+def resolve_value(option: ConfigOption, args: Any, config: Dict[str, Any]) -> Any:
+    """命令行优先；布尔开关只有为 True 时才视为在命令行指定"""
+    cli_value = getattr(args, option.arg, None) if option.arg else None
+    if cli_value is not None and cli_value is not False:
+        return cli_value
+    return _lookup(config, option)
+
+
+def validate_option(option: ConfigOption, value: Any) -> Optional[str]:
+    name = f"{option.section}.{option.key}"
+    if option.type is float and isinstance(value, int) and not isinstance(value, bool):
+        value = float(value)
+    if not isinstance(value, option.type) or (option.type is not bool and isinstance(value, bool)):
+        return f"{name} 应为 {option.type.__name__}，实际为 {type(value).__name__}: {value!r}"
+    if option.choices and value not in option.choices:
+        return f"{name}={value!r} 不在可选值 {', '.join(option.choices)} 中"
+    return None
+
+
+def write_chat_template(template: str) -> str:
+    """内联 Jinja 模板写入文件 (按内容哈希命名)；内置模板名或文件路径原样返回"""
+    if "{%" not in template and "{{" not in template:
+        return template
+    directory = os.path.join(tempfile.gettempdir(), "sglang_chat_templates")
+    os.makedirs(directory, exist_ok=True)
+    digest = hashlib.sha256(template.encode("utf-8")).hexdigest()[:16]
+    path = os.path.join(directory, f"{digest}.jinja")
+    if not os.path.exists(path):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(template)
+    return path
+
+
+def build_schema_args(args: Any, config: Dict[str, Any]) -> Tuple[List[str], List[str]]:
+    """按 schema 生成服务器参数，返回 (参数列表, 错误列表)"""
+    flags: List[str] = []
+    errors: List[str] = []
+    for option in SCHEMA:
+        value = resolve_value(option, args, config)
+        if value is None:
+            continue
+        error = validate_option(option, value)
+        if error:
+            errors.append(error)
+            continue
+        if option.type is bool:
+            if value != option.negate and option.flag not in flags:
+                flags.append(option.flag)
+            continue
+        if option.key == "chat_template":
+            value = write_chat_template(value)
+        flags.extend([option.flag, str(value)])
+
+    attention = config.get("attention") or {}
+    if attention.get("enable_radix_cache") is True and attention.get("disable_radix_cache") is True:
+        errors.append("attention.enable_radix_cache 与 attention.disable_radix_cache 同时为 true")
+    return flags, errors
+
+
+def parse_help_flags(help_text: str) -> Set[str]:
+    return set(re.findall(r"(?<![\w-])--[a-zA-Z0-9][\w-]*", help_text))
+
+
+@functools.lru_cache(maxsize=None)
+def installed_server_flags(python: str = "python") -> Optional[Set[str]]:
+    """已安装 SGLang 版本支持的服务器参数；无法获取时返回 None"""
+    try:
+        result = subprocess.run([python, "-m", "sglang.launch_server", "--help"],
+                                capture_output=True, text=True, timeout=180)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    if result.returncode != 0:
+        return None
+    return parse_help_flags(result.stdout)
+
+
+def unknown_flags(cmd: List[str], supported: Set[str]) -> List[str]:
+    """启动命令中当前 SGLang 版本不认识的参数；与 argparse 一致，唯一前缀 (如 --tp) 视为可识别"""
+    unknown = []
+    for arg in cmd:
+        flag = arg.split("=", 1)[0]
+        if not arg.startswith("--") or flag in supported:
+            continue
+        if sum(1 for name in supported if name.startswith(flag)) != 1:
+            unknown.append(arg)
+    return unknown
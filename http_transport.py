@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+共享 HTTP 传输层
+同步端使用带连接池的 requests.Session，异步端默认使用 aiohttp (HTTP/1.1 keep-alive)，
+可选 httpx 以 HTTP/2 复用连接；请求与响应的 JSON 编解码统一使用 orjson
+"""
+
+import asyncio
+import threading
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+
+import aiohttp
+import orjson
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import httpx
+except ImportError:  # HTTP/2 为可选功能
+    httpx = None
+
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+# 调用方统一捕获的传输层异常
+TRANSPORT_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError, requests.exceptions.RequestException)
+if httpx is not None:
+    TRANSPORT_ERRORS = TRANSPORT_ERRORS + (httpx.HTTPError,)
+
+
+class HTTPStatusError(Exception):
+    """异步响应状态码 >= 400"""
+
+    def __init__(self, status: int, url: str = ""):
+        super().__init__(f"HTTP {status}: {url}")
+        self.status = status
+
+
+def dumps(obj: Any) -> bytes:
+    """orjson 序列化，直接输出 UTF-8 字节"""
+    return orjson.dumps(obj)
+
+
+def loads(data: Any) -> Any:
+    """orjson 反序列化，接受 bytes 或 str"""
+    return orjson.loads(data)
+
+
+class SyncTransport:
+    """同步传输 - 共享 Session 复用 TCP 连接"""
+
+    def __init__(self, pool_size: int = 32, timeout: float = 60):
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def post_json(self, url: str, payload: Dict[str, Any], timeout: Optional[float] = None,
+                  stream: bool = False) -> requests.Response:
+        return self.session.post(url, data=dumps(payload), headers=JSON_HEADERS,
+                                 timeout=timeout or self.timeout, stream=stream)
+
+    def get(self, url: str, timeout: Optional[float] = None) -> requests.Response:
+        return self.session.get(url, timeout=timeout or self.timeout)
+
+    def close(self):
+        self.session.close()
+
+
+_sync_transport: Optional[SyncTransport] = None
+_sync_lock = threading.Lock()
+
+
+def get_sync_transport() -> SyncTransport:
+    """进程内共享的同步传输实例"""
+    global _sync_transport
+    if _sync_transport is None:
+        with _sync_lock:
+            if _sync_transport is None:
+                _sync_transport = SyncTransport()
+    return _sync_transport
+
+
+def response_json(response: requests.Response) -> Any:
+    """用 orjson 解析 requests 响应体"""
+    return loads(response.content)
+
+
+class AsyncResponse:
+    """统一 aiohttp / httpx 的响应接口"""
+
+    def __init__(self, raw: Any, http2: bool):
+        self._raw = raw
+        self._http2 = http2
+
+    @property
+    def status(self) -> int:
+        return self._raw.status_code if self._http2 else self._raw.status
+
+    @property
+    def headers(self):
+        return self._raw.headers
+
+    @property
+    def content_type(self) -> str:
+        if self._http2:
+            return self._raw.headers.get("content-type", "").split(";")[0].strip()
+        return self._raw.content_type
+
+    def raise_for_status(self):
+        if self.status >= 400:
+            raise HTTPStatusError(self.status, str(self._raw.url))
+
+    async def read(self) -> bytes:
+        if self._http2:
+            return await self._raw.aread()
+        return await self._raw.read()
+
+    async def text(self) -> str:
+        return (await self.read()).decode("utf-8", errors="replace")
+
+    async def json(self) -> Any:
+        return loads(await self.read())
+
+    def aiter_bytes(self) -> AsyncIterator[bytes]:
+        """按到达顺序产出响应字节块"""
+        if self._http2:
+            return self._raw.aiter_bytes()
+        return self._raw.content.iter_any()
+
+
+class AsyncTransport:
+    """异步传输 - 连接池大小与 keep-alive 时长可调，http2=True 时改用 httpx"""
+
+    def __init__(self, pool_size: int = 100, timeout: float = 600, connect_timeout: float = 10,
+                 keepalive_timeout: float = 60, http2: bool = False):
+        if http2 and httpx is None:
+            raise ImportError("HTTP/2 需要安装 httpx[http2]: pip install 'httpx[http2]'")
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.keepalive_timeout = keepalive_timeout
+        self.http2 = http2
+        self._client: Any = None
+
+    async def start(self):
+        if self._client is not None:
+            return
+        if self.http2:
+            limits = httpx.Limits(max_connections=self.pool_size or None,
+                                  max_keepalive_connections=self.pool_size or None,
+                                  keepalive_expiry=self.keepalive_timeout)
+            self._client = httpx.AsyncClient(http2=True, limits=limits,
+                                             timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout))
+        else:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=self.keepalive_timeout)
+            timeout = aiohttp.ClientTimeout(total=self.timeout, connect=self.connect_timeout)
+            self._client = aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+    async def close(self):
+        if self._client is None:
+            return
+        if self.http2:
+            await self._client.aclose()
+        else:
+            await self._client.close()
+        self._client = None
+
+    async def __aenter__(self) -> "AsyncTransport":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    @asynccontextmanager
+    async def request(self, method: str, url: str, payload: Any = None, data: Optional[bytes] = None,
+                      headers: Optional[Dict[str, str]] = None,
+                      timeout: Optional[float] = None) -> AsyncIterator[AsyncResponse]:
+        """发送请求；payload 会用 orjson 编码为 JSON 请求体"""
+        await self.start()
+        if payload is not None:
+            data = dumps(payload)
+            headers = {**(headers or {}), **JSON_HEADERS}
+        if self.http2:
+            kwargs = {} if timeout is None else {"timeout": httpx.Timeout(timeout, connect=self.connect_timeout)}
+            async with self._client.stream(method, url, content=data, headers=headers, **kwargs) as raw:
+                yield AsyncResponse(raw, http2=True)
+        else:
+            kwargs = {} if timeout is None else {
+                "timeout": aiohttp.ClientTimeout(total=timeout, connect=self.connect_timeout)}
+            async with self._client.request(method, url, data=data, headers=headers, **kwargs) as raw:
+                yield AsyncResponse(raw, http2=False)
+
+    def post_json(self, url: str, payload: Any, timeout: Optional[float] = None):
+        return self.request("POST", url, payload=payload, timeout=timeout)
+
+    def get(self, url: str, timeout: Optional[float] = None):
+        return self.request("GET", url, timeout=timeout)
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+预分词请求客户端
+配合以 --skip-tokenizer-init 启动的服务器: 客户端套用对话模板并分词 (大批量时分摊到进程池)，
+把 input_ids 发送到原生 /generate 接口，再在客户端把 output_ids 解码为文本。
+CPU 紧张的 GPU 节点上，长中文 prompt 的分词从服务端的关键路径上移走
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Any, Dict, List, Optional
+
+from benchmark import build_default_workload, load_workload
+from http_transport import TRANSPORT_ERRORS, AsyncTransport
+
+# 进程池 worker 内的 tokenizer，每个进程只加载一次
+_worker_tokenizer: Any = None
+
+
+def load_tokenizer(model_path: str) -> Any:
+    try:
+        from transformers import AutoTokenizer
+    except ImportError:
+        raise ImportError("客户端分词需要安装 transformers: pip install transformers")
+    return AutoTokenizer.from_pretrained(model_path, trust_remote_code=True)
+
+
+def encode_conversations(tokenizer: Any, conversations: List[List[Dict[str, Any]]],
+                         enable_thinking: bool) -> List[List[int]]:
+    return [list(tokenizer.apply_chat_template(messages, tokenize=True, add_generation_prompt=True,
+                                               enable_thinking=enable_thinking))
+            for messages in conversations]
+
+
+def _init_worker(model_path: str):
+    global _worker_tokenizer
+    _worker_tokenizer = load_tokenizer(model_path)
+
+
+def _encode_chunk(conversations: List[List[Dict[str, Any]]], enable_thinking: bool) -> List[List[int]]:
+    return encode_conversations(_worker_tokenizer, conversations, enable_thinking)
+
+
+def _decode_chunk(outputs: List[List[int]]) -> List[str]:
+    return _worker_tokenizer.batch_decode(outputs, skip_special_tokens=True)
+
+
+class PreTokenizer:
+    """客户端分词与解码；条目数达到 parallel_threshold 时按 chunk_size 分块交给进程池"""
+
+    def __init__(self, model_path: str, workers: Optional[int] = None, chunk_size: int = 64,
+                 parallel_threshold: int = 256):
+        self.model_path = model_path
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.parallel_threshold = parallel_threshold
+        self.tokenizer = load_tokenizer(model_path)
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _parallel(self, count: int) -> bool:
+        return self.workers > 1 and count >= self.parallel_threshold
+
+    def _chunks(self, items: List[Any]) -> List[List[Any]]:
+        return [items[i:i + self.chunk_size] for i in range(0, len(items), self.chunk_size)]
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: 避免 fork 继承已启用并行的 fast tokenizer
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+                                             initializer=_init_worker, initargs=(self.model_path,))
+        return self._pool
+
+    def encode(self, conversations: List[List[Dict[str, Any]]], enable_thinking: bool = False) -> List[List[int]]:
+        if not self._parallel(len(conversations)):
+            return encode_conversations(self.tokenizer, conversations, enable_thinking)
+        chunks = self.pool.map(_encode_chunk, self._chunks(conversations), repeat(enable_thinking))
+        return [ids for chunk in chunks for ids in chunk]
+
+    def decode(self, outputs: List[List[int]]) -> List[str]:
+        if not self._parallel(len(outputs)):
+            return self.tokenizer.batch_decode(outputs, skip_special_tokens=True)
+        return [text for chunk in self.pool.map(_decode_chunk, self._chunks(outputs)) for text in chunk]
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def __enter__(self) -> "PreTokenizer":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def sampling_params_from_body(body: Dict[str, Any], default_max_tokens: int) -> Dict[str, Any]:
+    """把 OpenAI 风格的采样参数转换为 /generate 的 sampling_params"""
+    params = {"max_new_tokens": body.get("max_tokens", default_max_tokens)}
+    for key in ("temperature", "top_p", "top_k", "presence_penalty", "frequency_penalty", "ignore_eos"):
+        if body.get(key) is not None:
+            params[key] = body[key]
+    return params
+
+
+async def generate_from_ids(transport: AsyncTransport, base_url: str, input_ids: List[int],
+                            sampling_params: Dict[str, Any]) -> Dict[str, Any]:
+    """发送单个 input_ids 请求，返回 {"output_ids", "meta_info"} 或 {"error"}"""
+    payload = {"input_ids": input_ids, "sampling_params": sampling_params}
+    try:
+        async with transport.post_json(f"{base_url}/generate", payload) as response:
+            if response.status != 200:
+                return {"error": f"HTTP {response.status}: {await response.text()}"}
+            result = await response.json()
+    except TRANSPORT_ERRORS as e:
+        return {"error": f"{type(e).__name__}: {e}"}
+    return {"output_ids": result.get("output_ids") or [], "meta_info": result.get("meta_info") or {}}
+
+
+async def run_pretokenized(base_url: str, input_ids: List[List[int]], sampling_params: List[Dict[str, Any]],
+                           concurrency: int, timeout: float) -> List[Dict[str, Any]]:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(transport: AsyncTransport, ids: List[int], params: Dict[str, Any]) -> Dict[str, Any]:
+        async with semaphore:
+            return await generate_from_ids(transport, base_url, ids, params)
+
+    async with AsyncTransport(pool_size=concurrency, timeout=timeout) as transport:
+        return await asyncio.gather(*(one(transport, ids, params) for ids, params in zip(input_ids, sampling_params)))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="预分词客户端 - 本地分词后向 --skip-tokenizer-init 服务器发送 input_ids",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+示例:
+  python launch_server.py --skip-tokenizer-init --wait-ready
+  python input_ids_client.py --config server_config.yaml --dataset requests.jsonl --workers 8 -o results.jsonl
+        """,
+    )
+    parser.add_argument("--host", default="localhost", help="服务器主机地址")
+    parser.add_argument("--port", default=30000, type=int, help="服务器端口")
+    parser.add_argument("--config", "-c", default="server_config.yaml",
+                        help="读取 model.tokenizer_path / model.model_path")
+    parser.add_argument("--model-path", help="tokenizer 路径 (覆盖配置文件)")
+    parser.add_argument("--dataset", help="请求 JSONL 文件 (每行包含 messages 或 prompt，也可包在 body 中)")
+    parser.add_argument("--num-prompts", type=int, help="只发送前 N 个请求 (未指定数据集时默认 100)")
+    parser.add_argument("--max-tokens", type=int, default=256, help="请求未指定 max_tokens 时的默认值")
+    parser.add_argument("--enable-thinking", action="store_true", help="套用模板时启用思考模式")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="分词进程数")
+    parser.add_argument("--parallel-threshold", type=int, default=256, help="请求数达到该值时使用进程池")
+    parser.add_argument("--concurrency", type=int, default=64, help="并发请求数")
+    parser.add_argument("--request-timeout", type=float, default=600, help="单请求超时时间(秒)")
+    parser.add_argument("--output", "-o", help="结果 JSONL 文件")
+    args = parser.parse_args()
+
+    model_path = args.model_path
+    if not model_path:
+        import yaml
+        with open(args.config, 'r', encoding='utf-8') as f:
+            model = (yaml.safe_load(f) or {}).get("model") or {}
+        model_path = model.get("tokenizer_path") or model.get("model_path")
+    if not model_path:
+        parser.error("需要 --model-path 或配置文件中的 model.model_path")
+    if args.dataset:
+        workload = load_workload(args.dataset, "chat", args.num_prompts, args.max_tokens)
+    else:
+        workload = build_default_workload("chat", args.num_prompts or 100, args.max_tokens)
+
+    try:
+        tokenizer = PreTokenizer(model_path, args.workers, parallel_threshold=args.parallel_threshold)
+    except (ImportError, OSError) as e:
+        print(f"错误: 无法加载 tokenizer: {e}")
+        raise SystemExit(1)
+    with tokenizer:
+        start = time.perf_counter()
+        input_ids = tokenizer.encode([body["messages"] for body in workload], args.enable_thinking)
+        encode_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        sampling = [sampling_params_from_body(body, args.max_tokens) for body in workload]
+        results = asyncio.run(run_pretokenized(f"http://{args.host}:{args.port}", input_ids, sampling,
+                                               args.concurrency, args.request_timeout))
+        request_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        texts = tokenizer.decode([r.get("output_ids", []) for r in results])
+        decode_time = time.perf_counter() - start
+
+    ok = [r for r in results if "error" not in r]
+    prompt_tokens = sum(len(ids) for ids in input_ids)
+    completion_tokens = sum(len(r["output_ids"]) for r in ok)
+    print("=" * 60)
+    print(f"请求数: {len(results)}, 成功: {len(ok)}, 失败: {len(results) - len(ok)}")
+    print(f"本地分词: {encode_time:.3f}s ({prompt_tokens} token, 进程数 "
+          f"{tokenizer.workers if tokenizer._parallel(len(workload)) else 1})")
+    print(f"请求耗时: {request_time:.2f}s ({len(results) / max(request_time, 1e-9):.1f} req/s, "
+          f"输出 {completion_tokens / max(request_time, 1e-9):.1f} tok/s)")
+    print(f"本地解码: {decode_time:.3f}s")
+    print("=" * 60)
+    errors = [r["error"] for r in results if "error" in r]
+    if errors:
+        print(f"失败示例: {errors[0]}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            for index, (result, text) in enumerate(zip(results, texts)):
+                record: Dict[str, Any] = {"index": index}
+                if "error" in result:
+                    record["error"] = result["error"]
+                else:
+                    meta = result["meta_info"]
+                    record.update({"content": text, "finish_reason": meta.get("finish_reason"),
+                                   "prompt_tokens": meta.get("prompt_tokens", len(input_ids[index])),
+                                   "completion_tokens": len(result["output_ids"])})
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        print(f"结果已写入: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,12 +5,102 @@ SGLang 服务器启动脚本 - 支持YAML配置和量化部署
 """
 
 import argparse
+import asyncio
+import json
+import shlex
+import signal
+import socket
 import subprocess
 import sys
 import os
+import time
 import yaml
+import requests
 from pathlib import Path
-from typing import Dict, Any, Optional, List
+from typing import Callable, Dict, Any, Optional, List
+
+from config_schema import build_schema_args, installed_server_flags, unknown_flags
+from capacity_planner import detect_gpu_memory_gb, load_model_shape, plan_from_command, print_plan
+from http_transport import get_sync_transport
+from input_ids_client import load_tokenizer
+from warmup import merge_warmup_config, run_warmup
+
+# SGLang 支持的推测解码算法；EAGLE/EAGLE3/STANDALONE 需要独立的草稿模型，NEXTN 使用模型自带的 MTP 层
+SPECULATIVE_ALGORITHMS = ["EAGLE", "EAGLE3", "NEXTN", "STANDALONE"]
+DRAFT_MODEL_ALGORITHMS = {"EAGLE", "EAGLE3", "STANDALONE"}
+
+ROUTER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "router.py")
+
+def terminate_process(proc: subprocess.Popen, timeout: float = 30):
+    """先发送 SIGTERM 等待退出，超时后强制 SIGKILL"""
+    if proc.poll() is not None:
+        return
+    proc.terminate()
+    try:
+        proc.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+def sd_notify(state: str) -> bool:
+    """向 systemd (Type=notify) 发送状态；未由 systemd 管理时返回 False"""
+    address = os.environ.get("NOTIFY_SOCKET")
+    if not address:
+        return False
+    if address.startswith("@"):
+        address = "\0" + address[1:]
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.sendto(state.encode("utf-8"), address)
+        return True
+    except OSError:
+        return False
+
+class ReplicaGroup:
+    """数据并行副本组 - 每个副本独占一组GPU和端口，前端由路由进程统一负载均衡
+    
+    任何一个进程退出都视为整组故障，其余进程会被一并关闭。
+    """
+    
+    def __init__(self, replica_cmds: List[List[str]], replica_gpus: List[List[str]],
+                 router_cmd: Optional[List[str]], label: str = "副本"):
+        self.replica_cmds = replica_cmds
+        self.replica_gpus = replica_gpus
+        self.router_cmd = router_cmd
+        self.label = label
+        self.processes: List[subprocess.Popen] = []
+        self.names: List[str] = []
+        
+    def start(self, detach: bool = False):
+        """detach=True 时子进程脱离当前会话，启动器退出后继续运行"""
+        for i, (cmd, gpus) in enumerate(zip(self.replica_cmds, self.replica_gpus)):
+            env = os.environ.copy()
+            env["CUDA_VISIBLE_DEVICES"] = ",".join(gpus)
+            print(f"启动{self.label} {i}: GPU={env['CUDA_VISIBLE_DEVICES']}")
+            self.processes.append(subprocess.Popen(cmd, env=env, start_new_session=detach))
+            self.names.append(f"{self.label} {i}")
+        if self.router_cmd is None:
+            return
+        print(f"启动路由: {' '.join(self.router_cmd)}")
+        self.processes.append(subprocess.Popen(self.router_cmd, start_new_session=detach))
+        self.names.append("路由")
+        
+    def wait(self) -> int:
+        """阻塞直到任一进程退出，返回其退出码"""
+        while True:
+            for name, proc in zip(self.names, self.processes):
+                code = proc.poll()
+                if code is not None:
+                    print(f"\n{name} 已退出 (退出码 {code})，关闭整个{self.label}组")
+                    return code
+            time.sleep(1)
+            
+    def stop(self):
+        for proc in reversed(self.processes):
+            if proc.poll() is None:
+                proc.send_signal(signal.SIGTERM)
+        for proc in self.processes:
+            terminate_process(proc)
 
 class SGLangServerLauncher:
     def __init__(self):
@@ -124,7 +214,22 @@ class SGLangServerLauncher:
         parallel_config = config.get('parallel', {})
         tp_size = args.tp_size or parallel_config.get('tp_size', 1)
         if tp_size > 1:
-            cmd.extend(["--tp", str(tp_size)])
+            cmd.extend(["--tp-size", str(tp_size)])
+        
+        pp_size = self.get_pp_size(args, config)
+        if pp_size > 1:
+            cmd.extend(["--pp-size", str(pp_size)])
+        
+        # 多节点: 所有节点使用相同的命令，只有 --node-rank 不同
+        multinode = self.get_multinode_settings(args, config)
+        if multinode['nnodes'] > 1:
+            cmd.extend(["--nnodes", str(multinode['nnodes']), "--node-rank", str(multinode['node_rank'])])
+            if multinode['dist_init_addr']:
+                cmd.extend(["--dist-init-addr", multinode['dist_init_addr']])
+            # 跨节点时数据并行由 SGLang 自身调度，而不是本地多副本
+            dp_size = self.get_dp_size(args, config)
+            if dp_size > 1:
+                cmd.extend(["--dp-size", str(dp_size)])
             
         # 性能优化配置
         opt_config = config.get('optimization', {})
@@ -132,9 +237,6 @@ class SGLangServerLauncher:
         if args.enable_torch_compile or opt_config.get('enable_torch_compile'):
             cmd.append("--enable-torch-compile")
             
-        if args.enable_flashinfer or opt_config.get('enable_flashinfer'):
-            cmd.append("--enable-flashinfer")
-            
         if args.disable_cuda_graph or opt_config.get('disable_cuda_graph'):
             cmd.append("--disable-cuda-graph")
             
@@ -143,18 +245,93 @@ class SGLangServerLauncher:
         if args.enable_dp_attention or attention_config.get('enable_dp_attention'):
             cmd.append("--enable-dp-attention")
             
-        attention_backend = args.attention_backend or attention_config.get('attention_backend')
+        # 新版 SGLang 已移除 --enable-flashinfer，改为选择 FlashInfer 注意力后端；命令行显式指定的后端优先
+        attention_backend = args.attention_backend
+        if not attention_backend and (args.enable_flashinfer or opt_config.get('enable_flashinfer')):
+            if attention_config.get('attention_backend') not in (None, "flashinfer"):
+                print(f"提示: enable_flashinfer 覆盖配置中的 attention_backend: {attention_config['attention_backend']}")
+            attention_backend = "flashinfer"
+        attention_backend = attention_backend or attention_config.get('attention_backend')
         if attention_backend:
             cmd.extend(["--attention-backend", attention_backend])
         
+        # 调度、前缀缓存、日志与模板 (config_schema.SCHEMA)
+        schema_args, errors = build_schema_args(args, config)
+        if errors:
+            for error in errors:
+                print(f"错误: 配置项无效: {error}")
+            sys.exit(1)
+        cmd.extend(schema_args)
+        if "--chat-template" in cmd:
+            print("警告: 自定义聊天模板会覆盖模型自带模板，请确认它支持 system 消息与 "
+                  "chat_template_kwargs.enable_thinking")
+        
         # 分布式配置
         dist_config = config.get('distributed', {})
         dist_timeout = args.dist_timeout or dist_config.get('dist_timeout')
         if dist_timeout:
             cmd.extend(["--dist-timeout", str(dist_timeout)])
         
+        # 推测解码配置
+        cmd.extend(self.build_speculative_args(args, config))
+        
         return cmd
     
+    def validate_speculative(self, algorithm: str, draft_model_path: Optional[str], num_steps: int,
+                             eagle_topk: int, num_draft_tokens: int) -> List[str]:
+        """检查推测解码参数组合，返回错误列表"""
+        errors = []
+        if algorithm not in SPECULATIVE_ALGORITHMS:
+            errors.append(f"不支持的推测解码算法: {algorithm} (可选: {', '.join(SPECULATIVE_ALGORITHMS)})")
+        if algorithm in DRAFT_MODEL_ALGORITHMS and not draft_model_path:
+            errors.append(f"{algorithm} 需要草稿模型: 设置 speculative_decoding.draft_model_path "
+                          f"或 --speculative-draft-model-path")
+        if draft_model_path and os.path.isabs(draft_model_path) and not os.path.exists(draft_model_path):
+            errors.append(f"草稿模型路径不存在: {draft_model_path}")
+        if num_steps < 1 or eagle_topk < 1:
+            errors.append("num_steps 和 eagle_topk 必须 >= 1")
+        elif eagle_topk == 1 and num_draft_tokens != num_steps + 1:
+            # topk=1 时草稿是一条链，每步一个 token 加上根节点
+            errors.append(f"eagle_topk=1 时 num_draft_tokens 必须等于 num_steps+1 ({num_steps + 1})，"
+                          f"当前为 {num_draft_tokens}")
+        elif not 2 <= num_draft_tokens <= num_steps * eagle_topk + 1:
+            errors.append(f"num_draft_tokens 应在 2 到 num_steps*eagle_topk+1 ({num_steps * eagle_topk + 1}) 之间，"
+                          f"当前为 {num_draft_tokens}")
+        return errors
+    
+    def build_speculative_args(self, args: argparse.Namespace, config: Dict[str, Any]) -> List[str]:
+        """推测解码参数；命令行指定 --speculative-algorithm 时视为启用"""
+        spec_config = config.get('speculative_decoding') or {}
+        algorithm = args.speculative_algorithm or (spec_config.get('algorithm') if spec_config.get('enable') else None)
+        if not algorithm:
+            if spec_config.get('enable'):
+                print("错误: speculative_decoding.enable 为 true 但未设置 algorithm")
+                sys.exit(1)
+            return []
+        
+        algorithm = algorithm.upper()
+        draft_model_path = args.speculative_draft_model_path or spec_config.get('draft_model_path')
+        num_steps = args.speculative_num_steps or spec_config.get('num_steps') or 1
+        eagle_topk = args.speculative_eagle_topk or spec_config.get('eagle_topk') or 1
+        num_draft_tokens = args.speculative_num_draft_tokens or spec_config.get('num_draft_tokens') or num_steps + 1
+        
+        errors = self.validate_speculative(algorithm, draft_model_path, num_steps, eagle_topk, num_draft_tokens)
+        if errors:
+            for error in errors:
+                print(f"错误: 推测解码配置无效: {error}")
+            sys.exit(1)
+        
+        spec_args = ["--speculative-algorithm", algorithm]
+        if draft_model_path:
+            spec_args.extend(["--speculative-draft-model-path", draft_model_path])
+        spec_args.extend([
+            "--speculative-num-steps", str(num_steps),
+            "--speculative-eagle-topk", str(eagle_topk),
+            "--speculative-num-draft-tokens", str(num_draft_tokens),
+        ])
+        print(f"启用推测解码: {algorithm} (steps={num_steps}, topk={eagle_topk}, draft_tokens={num_draft_tokens})")
+        return spec_args
+    
     def create_parser(self) -> argparse.ArgumentParser:
         """创建命令行参数解析器"""
         parser = argparse.ArgumentParser(
@@ -166,6 +343,7 @@ class SGLangServerLauncher:
   2. 平衡配置 (推荐):       --preset balanced  
   3. 内存优化:             --preset memory_optimized
   4. 超低内存:             --preset ultra_low_memory
+  (也可使用配置文件 quantization_presets 中的其他预设，例如 autotune.py 生成的预设)
   5. 自定义TorchAO:        --torchao-config int4wo-64
   6. 自定义传统量化:        --quantization fp8
   
@@ -181,8 +359,8 @@ class SGLangServerLauncher:
         parser.add_argument("--config", "-c", 
                            help="YAML配置文件路径 (默认: server_config.yaml)")
         parser.add_argument("--preset", 
-                           choices=["high_performance", "balanced", "memory_optimized", "ultra_low_memory"],
-                           help="使用预定义的量化配置预设")
+                           help="使用配置文件 quantization_presets 中的预设 "
+                                "(high_performance, balanced, memory_optimized, ultra_low_memory 等)")
         
         # 基础模型配置
         parser.add_argument("--model-path", 
@@ -227,15 +405,36 @@ class SGLangServerLauncher:
         parallel_group = parser.add_argument_group("并行配置")
         parallel_group.add_argument("--tp-size", "--tp", type=int, default=1,
                                    help="张量并行度")
+        parallel_group.add_argument("--dp-size", "--dp", type=int,
+                                   help="数据并行副本数 (每个副本独占 tp-size 张GPU和一个端口)")
+        parallel_group.add_argument("--gpu-ids",
+                                   help="可用GPU编号，逗号分隔 (默认: CUDA_VISIBLE_DEVICES 或 0..dp*tp-1)")
+        parallel_group.add_argument("--replica-base-port", type=int,
+                                   help="副本起始端口 (默认: 前端端口+1)")
+        parallel_group.add_argument("--pp-size", "--pp", type=int,
+                                   help="流水线并行度")
+        parallel_group.add_argument("--router-policy", default="prefix",
+                                   choices=["prefix", "least_load", "round_robin"],
+                                   help="多副本路由策略 (prefix: 按共享前缀亲和，复用前缀缓存)")
         
         # 性能优化
         opt_group = parser.add_argument_group("性能优化")
         opt_group.add_argument("--enable-torch-compile", action="store_true",
                               help="启用torch编译加速")
         opt_group.add_argument("--enable-flashinfer", action="store_true",
-                              help="启用FlashInfer加速")
+                              help="启用FlashInfer加速 (即 --attention-backend flashinfer)")
         opt_group.add_argument("--disable-cuda-graph", action="store_true",
                               help="禁用CUDA Graph")
+        opt_group.add_argument("--enable-mixed-chunk", action="store_true",
+                              help="预填充与解码混合在同一批次")
+        
+        # 调度配置
+        sched_group = parser.add_argument_group("调度配置")
+        sched_group.add_argument("--schedule-policy",
+                                choices=["lpm", "random", "fcfs", "dfs-weight", "lof"],
+                                help="调度策略 (lpm: 最长前缀匹配优先，提高前缀缓存命中)")
+        sched_group.add_argument("--schedule-conservativeness", type=float,
+                                help="调度保守程度 (越大越保守，减少抢占)")
         
         # 注意力配置
         attn_group = parser.add_argument_group("注意力配置")
@@ -244,11 +443,72 @@ class SGLangServerLauncher:
         attn_group.add_argument("--attention-backend",
                                choices=["flashinfer", "triton", "torch_naive"],
                                help="注意力后端")
+        attn_group.add_argument("--disable-radix-cache", action="store_true",
+                               help="禁用 RadixAttention 前缀缓存")
         
         # 分布式配置
         dist_group = parser.add_argument_group("分布式配置")
         dist_group.add_argument("--dist-timeout", type=int,
                                help="分布式超时时间(秒)")
+        dist_group.add_argument("--nnodes", type=int, help="节点数")
+        dist_group.add_argument("--node-rank", type=int, help="本节点编号 (0 号节点提供 HTTP 服务)")
+        dist_group.add_argument("--dist-init-addr",
+                               help="rendezvous 地址 host:port (默认: distributed.master_addr:master_port)")
+        dist_group.add_argument("--nproc-per-node", type=int,
+                               help="每个节点的GPU数 (默认: 配置文件或 nvidia-smi 检测)")
+        dist_group.add_argument("--multinode", choices=["node", "emit", "local"], default="node",
+                               help="多节点模式: node 启动本节点；emit 输出所有节点的命令；"
+                                    "local 在本机模拟所有节点 (测试用)")
+        dist_group.add_argument("--emit-dir", help="--multinode emit 时把各节点启动脚本写入该目录")
+        
+        # 接口与监控
+        misc_group = parser.add_argument_group("接口与监控")
+        misc_group.add_argument("--chat-template",
+                               help="聊天模板: 内置模板名、模板文件路径或 Jinja 字符串")
+        misc_group.add_argument("--skip-tokenizer-init", action="store_true",
+                               help="跳过服务端分词: 只接受 /generate 的 input_ids，由客户端分词 (input_ids_client.py)")
+        misc_group.add_argument("--enable-metrics", action="store_true",
+                               help="开启 Prometheus 指标 (/metrics)")
+        misc_group.add_argument("--flag-check", choices=["off", "warn", "strict"], default="strict",
+                               help="用已安装 SGLang 的 --help 核对启动参数 (strict: 有未知参数时拒绝启动)")
+        
+        # 推测解码
+        spec_group = parser.add_argument_group("推测解码")
+        spec_group.add_argument("--speculative-algorithm", choices=SPECULATIVE_ALGORITHMS,
+                               help="启用推测解码 (覆盖配置文件 speculative_decoding)")
+        spec_group.add_argument("--speculative-draft-model-path",
+                               help="草稿模型路径 (EAGLE/EAGLE3/STANDALONE 必需)")
+        spec_group.add_argument("--speculative-num-steps", type=int,
+                               help="每轮草稿步数")
+        spec_group.add_argument("--speculative-eagle-topk", type=int,
+                               help="每步保留的候选数")
+        spec_group.add_argument("--speculative-num-draft-tokens", type=int,
+                               help="每轮送入目标模型验证的草稿 token 数")
+        
+        # 启动管理
+        ready_group = parser.add_argument_group("启动管理")
+        ready_group.add_argument("--wait-ready", action="store_true",
+                                help="托管启动: 等待服务就绪并预热后再报告就绪")
+        ready_group.add_argument("--ready-timeout", type=float, default=1200,
+                                help="等待服务就绪的超时(秒)")
+        ready_group.add_argument("--ready-endpoint", default="/health",
+                                choices=["/health", "/get_model_info", "/health_generate"],
+                                help="就绪探测接口")
+        ready_group.add_argument("--skip-warmup", action="store_true",
+                                help="跳过配置文件 warmup 段定义的预热")
+        ready_group.add_argument("--ready-file",
+                                help="就绪后写入该文件 (JSON: pid, 服务地址, 就绪时间)")
+        ready_group.add_argument("--detach", action="store_true",
+                                help="就绪后启动器退出 (退出码 0)，服务器在后台继续运行")
+        ready_group.add_argument("--server-log",
+                                help="托管模式下服务器输出写入该文件 (--detach 时默认 sglang_server.log)")
+        
+        # 容量规划
+        plan_group = parser.add_argument_group("容量规划")
+        plan_group.add_argument("--capacity-check", choices=["off", "warn", "strict"], default="warn",
+                               help="启动前估算权重与KV缓存容量 (strict: 不可行时拒绝启动)")
+        plan_group.add_argument("--gpu-memory-gb", type=float,
+                               help="单卡显存 GiB (默认通过 nvidia-smi 检测)")
         
         return parser
     
@@ -263,6 +523,7 @@ class SGLangServerLauncher:
         host, port = "0.0.0.0", "30000"
         quantization_info = "无"
         tp_size = "1"
+        speculative_info = "未启用"
         
         for i, arg in enumerate(cmd):
             if arg == "--model-path" and i+1 < len(cmd):
@@ -275,19 +536,22 @@ class SGLangServerLauncher:
                 quantization_info = f"TorchAO: {cmd[i+1]}"
             elif arg == "--quantization" and i+1 < len(cmd):
                 quantization_info = f"传统量化: {cmd[i+1]}"
-            elif arg == "--tp" and i+1 < len(cmd):
+            elif arg == "--tp-size" and i+1 < len(cmd):
                 tp_size = cmd[i+1]
+            elif arg == "--speculative-algorithm" and i+1 < len(cmd):
+                speculative_info = cmd[i+1]
         
         print(f"模型路径: {model_path}")
         print(f"服务地址: http://{host}:{port}")
         print(f"量化配置: {quantization_info}")
         print(f"张量并行: {tp_size}")
+        print(f"推测解码: {speculative_info}")
         
         # 显示优化选项
         optimizations = []
         if "--enable-torch-compile" in cmd:
             optimizations.append("Torch编译")
-        if "--enable-flashinfer" in cmd:
+        if "--attention-backend" in cmd and cmd[cmd.index("--attention-backend") + 1] == "flashinfer":
             optimizations.append("FlashInfer")
         if "--enable-dp-attention" in cmd:
             optimizations.append("数据并行注意力")
@@ -295,10 +559,356 @@ class SGLangServerLauncher:
         if optimizations:
             print(f"启用优化: {', '.join(optimizations)}")
         
+        if "--skip-tokenizer-init" in cmd:
+            print("分词方式: 客户端 (skip_tokenizer_init，只接受 input_ids；OpenAI 兼容接口与聊天模板不可用)")
+        
         print("\n执行命令:")
         print(" ".join(cmd))
         print("=" * 60)
     
+    @staticmethod
+    def local_base_url(cmd: List[str]) -> str:
+        """根据启动命令得到本机可访问的服务地址"""
+        host = cmd[cmd.index("--host") + 1]
+        port = cmd[cmd.index("--port") + 1]
+        if host in ("0.0.0.0", "::"):
+            host = "127.0.0.1"
+        return f"http://{host}:{port}"
+    
+    def wait_until_healthy(self, base_url: str, timeout: float,
+                           proc: Optional[subprocess.Popen] = None, interval: float = 2.0,
+                           endpoint: str = "/health", should_stop: Optional[Callable[[], bool]] = None) -> bool:
+        """轮询探测接口直到服务就绪；子进程提前退出、超时或 should_stop() 为真时返回 False"""
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if proc is not None and proc.poll() is not None:
+                return False
+            if should_stop is not None and should_stop():
+                return False
+            try:
+                if get_sync_transport().get(f"{base_url}{endpoint}", timeout=5).status_code == 200:
+                    return True
+            except requests.exceptions.RequestException:
+                pass
+            time.sleep(interval)
+        return False
+    
+    def wait_ready_and_warmup(self, args: argparse.Namespace, base_urls: List[str],
+                              processes: List[subprocess.Popen],
+                              should_stop: Optional[Callable[[], bool]] = None) -> bool:
+        """等待所有服务就绪并逐个预热 (每个副本有独立的前缀缓存)；should_stop() 为真时放弃并返回 False"""
+        deadline = time.time() + args.ready_timeout
+        for base_url, proc in zip(base_urls, processes):
+            print(f"\n等待服务就绪: {base_url}{args.ready_endpoint}")
+            if not self.wait_until_healthy(base_url, max(deadline - time.time(), 0), proc,
+                                           endpoint=args.ready_endpoint, should_stop=should_stop):
+                if should_stop is not None and should_stop():
+                    print(f"收到停止请求，放弃等待: {base_url}")
+                    return False
+                reason = "进程已退出" if proc.poll() is not None else f"超过 {args.ready_timeout:.0f}s 未就绪"
+                print(f"错误: 服务启动失败 ({reason}): {base_url}")
+                return False
+        
+        warmup_config = merge_warmup_config(self.config.get('warmup', {}))
+        if args.skip_warmup or not warmup_config["enabled"]:
+            return True
+        if should_stop is not None and should_stop():
+            return False
+        tokenizer = None
+        if args.skip_tokenizer_init or self.config.get('compatibility', {}).get('skip_tokenizer_init'):
+            # 服务端不分词，预热请求在本地分词后以 input_ids 发送
+            model_config = self.config.get('model', {})
+            try:
+                tokenizer = load_tokenizer(model_config.get('tokenizer_path') or args.model_path
+                                           or model_config.get('model_path'))
+            except (ImportError, OSError) as e:
+                print(f"警告: skip_tokenizer_init 模式下无法在本地加载 tokenizer ({e})，跳过预热")
+                return True
+        for base_url in base_urls:
+            print(f"\n预热: {base_url}")
+            start = time.time()
+            stats = asyncio.run(run_warmup(base_url, warmup_config, tokenizer))
+            print(f"预热完成: {stats['requests']} 个请求, 失败 {stats['failed']}, 耗时 {time.time() - start:.1f}s")
+        return True
+    
+    def signal_ready(self, args: argparse.Namespace, base_urls: List[str], pids: List[int]):
+        """报告就绪: 写入就绪文件并通知 systemd"""
+        print(f"\n服务已就绪: {', '.join(base_urls)}")
+        if args.ready_file:
+            info = {"pids": pids, "urls": base_urls, "ready_at": time.time()}
+            tmp_path = f"{args.ready_file}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(info, f, ensure_ascii=False)
+            os.replace(tmp_path, args.ready_file)
+        if sd_notify("READY=1"):
+            print("已通知 systemd: READY=1")
+    
+    def run_managed(self, args: argparse.Namespace, cmd: List[str]):
+        """托管启动单个服务器: 就绪探测 -> 预热 -> 报告就绪"""
+        base_url = self.local_base_url(cmd)
+        print("\n正在启动 SGLang 服务器 (托管模式)...")
+        log_path = args.server_log or ("sglang_server.log" if args.detach else None)
+        log_file = open(log_path, 'a', encoding='utf-8') if log_path else None
+        if log_path:
+            print(f"服务器日志: {log_path}")
+        proc = subprocess.Popen(cmd, start_new_session=args.detach, stdout=log_file,
+                                stderr=subprocess.STDOUT if log_file else None)
+        detached = False
+        try:
+            if not self.wait_ready_and_warmup(args, [base_url], [proc]):
+                sys.exit(1)
+            self.signal_ready(args, [base_url], [proc.pid])
+            if args.detach:
+                detached = True
+                print(f"启动器退出，服务器在后台运行 (PID {proc.pid})")
+                return
+            code = proc.wait()
+            if code:
+                print(f"\n服务器异常退出 (退出码 {code})")
+                sys.exit(1)
+        except KeyboardInterrupt:
+            print("\n用户中断，服务器关闭")
+        finally:
+            if not detached:
+                terminate_process(proc)
+            if log_file:
+                log_file.close()
+    
+    def check_server_flags(self, args: argparse.Namespace, cmd: List[str]):
+        """核对启动参数是否被已安装的 SGLang 版本支持"""
+        if args.flag_check == "off":
+            return
+        supported = installed_server_flags(cmd[0])
+        if supported is None:
+            print("跳过参数核对: 无法获取 sglang.launch_server --help 输出")
+            return
+        unknown = unknown_flags(cmd, supported)
+        if not unknown:
+            return
+        print(f"{'错误' if args.flag_check == 'strict' else '警告'}: 已安装的 SGLang 不支持以下参数: "
+              f"{', '.join(unknown)}")
+        if args.flag_check == "strict":
+            print("请升级 SGLang 或修改配置 (使用 --flag-check warn 可强制启动)")
+            sys.exit(1)
+    
+    def check_capacity(self, args: argparse.Namespace, cmd: List[str]):
+        """启动前估算显存容量，不可行的配置按 --capacity-check 警告或拒绝"""
+        if args.capacity_check == "off":
+            return
+        gpu_memory_gb = args.gpu_memory_gb or detect_gpu_memory_gb()
+        if gpu_memory_gb is None:
+            print("跳过容量规划: 无法检测 GPU 显存 (可使用 --gpu-memory-gb 指定)")
+            return
+        try:
+            shape = load_model_shape(cmd[cmd.index("--model-path") + 1])
+        except (OSError, KeyError, ValueError) as e:
+            print(f"跳过容量规划: 无法读取模型 config.json: {e}")
+            return
+        
+        plan = plan_from_command(cmd, gpu_memory_gb, shape)
+        print_plan(plan)
+        if not plan.feasible:
+            if args.capacity_check == "strict":
+                print("错误: 当前配置不可行，拒绝启动 (使用 --capacity-check warn 可强制启动)")
+                sys.exit(1)
+            print("警告: 当前配置可能不可行，仍继续启动")
+    
+    def get_pp_size(self, args: argparse.Namespace, config: Dict[str, Any]) -> int:
+        """流水线并行度，命令行优先"""
+        parallel_config = config.get('parallel', {})
+        return args.pp_size or parallel_config.get('pp_size') or parallel_config.get('pipeline_parallel_size') or 1
+    
+    def get_multinode_settings(self, args: argparse.Namespace, config: Dict[str, Any]) -> Dict[str, Any]:
+        """多节点配置，命令行优先于 distributed 段"""
+        dist_config = config.get('distributed', {})
+        dist_init_addr = args.dist_init_addr
+        if not dist_init_addr and dist_config.get('master_addr'):
+            dist_init_addr = f"{dist_config['master_addr']}:{dist_config.get('master_port') or 50000}"
+        return {
+            'nnodes': args.nnodes or dist_config.get('nnodes') or 1,
+            'node_rank': args.node_rank if args.node_rank is not None else (dist_config.get('node_rank') or 0),
+            'dist_init_addr': dist_init_addr,
+            'nproc_per_node': args.nproc_per_node or dist_config.get('nproc_per_node'),
+        }
+    
+    @staticmethod
+    def detect_gpu_count() -> Optional[int]:
+        """通过 nvidia-smi 统计本机GPU数"""
+        try:
+            output = subprocess.run(["nvidia-smi", "-L"], capture_output=True, text=True, timeout=10).stdout
+        except (OSError, subprocess.SubprocessError):
+            return None
+        count = sum(1 for line in output.splitlines() if line.startswith("GPU "))
+        return count or None
+    
+    def check_multinode(self, args: argparse.Namespace, cmd: List[str]) -> Dict[str, Any]:
+        """校验多节点配置: rendezvous 地址、节点编号以及 tp x pp x dp 与GPU总数一致"""
+        multinode = self.get_multinode_settings(args, self.config)
+        nnodes = multinode['nnodes']
+        tp_size = int(cmd[cmd.index("--tp-size") + 1]) if "--tp-size" in cmd else 1
+        pp_size = self.get_pp_size(args, self.config)
+        dp_size = self.get_dp_size(args, self.config)
+        world_size = tp_size * pp_size * dp_size
+        
+        errors = []
+        if not 0 <= multinode['node_rank'] < nnodes:
+            errors.append(f"node_rank={multinode['node_rank']} 超出范围 [0, {nnodes})")
+        if args.multinode != "local":
+            if not multinode['dist_init_addr']:
+                errors.append("多节点需要 rendezvous 地址: --dist-init-addr 或 distributed.master_addr/master_port")
+            elif multinode['dist_init_addr'].rsplit(":", 1)[-1] == cmd[cmd.index("--port") + 1]:
+                errors.append(f"rendezvous 端口不能与 HTTP 端口相同: {multinode['dist_init_addr']}")
+        
+        nproc_per_node = multinode['nproc_per_node'] or self.detect_gpu_count()
+        if world_size % nnodes:
+            errors.append(f"tp({tp_size}) x pp({pp_size}) x dp({dp_size}) = {world_size} 不能均分到 {nnodes} 个节点")
+        elif nproc_per_node is None:
+            print(f"警告: 无法确定每个节点的GPU数，假设为 {world_size // nnodes}")
+            nproc_per_node = world_size // nnodes
+        elif world_size != nnodes * nproc_per_node:
+            errors.append(f"tp({tp_size}) x pp({pp_size}) x dp({dp_size}) = {world_size}，"
+                          f"与 {nnodes} 节点 x {nproc_per_node} GPU = {nnodes * nproc_per_node} 不一致")
+        if "--dist-timeout" not in cmd:
+            print("警告: 未设置 dist_timeout，节点 rendezvous 将使用 PyTorch 默认超时")
+        if errors:
+            for error in errors:
+                print(f"错误: 多节点配置无效: {error}")
+            sys.exit(1)
+        
+        multinode['nproc_per_node'] = nproc_per_node
+        print(f"\n多节点: {nnodes} 节点 x {nproc_per_node} GPU, tp={tp_size} pp={pp_size} dp={dp_size}, "
+              f"rendezvous={multinode['dist_init_addr'] or '127.0.0.1 (本机模拟)'}")
+        return multinode
+    
+    def node_commands(self, cmd: List[str], nnodes: int) -> List[List[str]]:
+        return [self.replace_flag(cmd, "--node-rank", str(rank)) for rank in range(nnodes)]
+    
+    def emit_node_commands(self, args: argparse.Namespace, cmd: List[str], multinode: Dict[str, Any]):
+        """输出每个节点的启动命令，可写为脚本分发到各节点"""
+        # 内联聊天模板写在本机临时文件中，远程节点的脚本需要先还原该文件
+        setup = ""
+        template_path = cmd[cmd.index("--chat-template") + 1] if "--chat-template" in cmd else None
+        if template_path and template_path.endswith(".jinja") and os.path.exists(template_path):
+            with open(template_path, 'r', encoding='utf-8') as f:
+                template = f.read()
+            setup = (f"mkdir -p {shlex.quote(os.path.dirname(template_path))}\n"
+                     f"cat > {shlex.quote(template_path)} <<'SGLANG_CHAT_TEMPLATE'\n{template}\nSGLANG_CHAT_TEMPLATE\n")
+        for rank, node_cmd in enumerate(self.node_commands(cmd, multinode['nnodes'])):
+            command_line = " ".join(shlex.quote(arg) for arg in node_cmd)
+            print(f"\n# 节点 {rank}{' (HTTP 服务)' if rank == 0 else ''}")
+            print(command_line)
+            if args.emit_dir:
+                os.makedirs(args.emit_dir, exist_ok=True)
+                script_path = os.path.join(args.emit_dir, f"node_{rank}.sh")
+                with open(script_path, 'w', encoding='utf-8') as f:
+                    f.write(f"#!/bin/bash\n# 节点 {rank}/{multinode['nnodes']}，所有节点需在 dist_timeout 内启动\n"
+                            f"{setup}exec {command_line}\n")
+                os.chmod(script_path, 0o755)
+        if args.emit_dir:
+            print(f"\n启动脚本已写入: {args.emit_dir}/node_*.sh")
+    
+    def run_multinode_local(self, args: argparse.Namespace, cmd: List[str], multinode: Dict[str, Any]):
+        """在本机按节点划分GPU启动所有 rank，rendezvous 使用本机地址"""
+        nnodes = multinode['nnodes']
+        rendezvous_port = multinode['dist_init_addr'].rsplit(":", 1)[-1] if multinode['dist_init_addr'] else "50000"
+        cmd = list(cmd)
+        if "--dist-init-addr" in cmd:
+            cmd = self.replace_flag(cmd, "--dist-init-addr", f"127.0.0.1:{rendezvous_port}")
+        else:
+            cmd.extend(["--dist-init-addr", f"127.0.0.1:{rendezvous_port}"])
+        node_gpus = self.assign_gpus(args, nnodes, multinode['nproc_per_node'])
+        
+        group = ReplicaGroup(self.node_commands(cmd, nnodes), node_gpus, None, label="节点")
+        exit_code = 0
+        try:
+            group.start()
+            if args.wait_ready:
+                # 0 号节点就绪意味着所有节点已完成 rendezvous
+                if not self.wait_ready_and_warmup(args, [self.local_base_url(cmd)], group.processes[:1]):
+                    sys.exit(1)
+                self.signal_ready(args, [self.local_base_url(cmd)], [p.pid for p in group.processes])
+            exit_code = group.wait()
+        except KeyboardInterrupt:
+            print("\n用户中断，关闭所有节点")
+        finally:
+            group.stop()
+        if exit_code:
+            sys.exit(1)
+    
+    def get_dp_size(self, args: argparse.Namespace, config: Dict[str, Any]) -> int:
+        """数据并行副本数，命令行优先"""
+        parallel_config = config.get('parallel', {})
+        return args.dp_size or parallel_config.get('dp_size') or parallel_config.get('data_parallel_size') or 1
+    
+    def assign_gpus(self, args: argparse.Namespace, dp_size: int, tp_size: int) -> List[List[str]]:
+        """为每个副本分配连续的 tp_size 张GPU"""
+        if args.gpu_ids:
+            gpu_ids = [g.strip() for g in args.gpu_ids.split(",") if g.strip()]
+        elif os.environ.get("CUDA_VISIBLE_DEVICES"):
+            gpu_ids = [g.strip() for g in os.environ["CUDA_VISIBLE_DEVICES"].split(",") if g.strip()]
+        else:
+            gpu_ids = [str(i) for i in range(dp_size * tp_size)]
+        
+        if len(gpu_ids) < dp_size * tp_size:
+            print(f"错误: {dp_size} 个副本 x 张量并行 {tp_size} 需要 {dp_size * tp_size} 张GPU，"
+                  f"可用GPU只有 {len(gpu_ids)} 张: {','.join(gpu_ids)}")
+            sys.exit(1)
+        return [gpu_ids[i * tp_size:(i + 1) * tp_size] for i in range(dp_size)]
+    
+    @staticmethod
+    def replace_flag(cmd: List[str], flag: str, value: str) -> List[str]:
+        """替换命令中某个参数的取值"""
+        cmd = list(cmd)
+        cmd[cmd.index(flag) + 1] = value
+        return cmd
+    
+    def run_replicas(self, args: argparse.Namespace, cmd: List[str], dp_size: int):
+        """启动多个数据并行副本并在前端端口提供负载均衡"""
+        tp_size = args.tp_size or self.config.get('parallel', {}).get('tp_size', 1)
+        replica_gpus = self.assign_gpus(args, dp_size, tp_size)
+        
+        front_host = cmd[cmd.index("--host") + 1]
+        front_port = int(cmd[cmd.index("--port") + 1])
+        base_port = args.replica_base_port or front_port + 1
+        replica_ports = [base_port + i for i in range(dp_size)]
+        
+        # 副本只需本机路由可达
+        replica_cmds = []
+        for port in replica_ports:
+            replica_cmd = self.replace_flag(cmd, "--port", str(port))
+            replica_cmds.append(self.replace_flag(replica_cmd, "--host", "127.0.0.1"))
+        backends = [f"http://127.0.0.1:{port}" for port in replica_ports]
+        router_cmd = [sys.executable, ROUTER_SCRIPT, "--host", front_host, "--port", str(front_port),
+                      "--policy", args.router_policy, "--backends", *backends]
+        
+        print(f"\n数据并行: {dp_size} 个副本, 每个副本 {tp_size} 张GPU")
+        for i, (gpus, port) in enumerate(zip(replica_gpus, replica_ports)):
+            print(f"  副本 {i}: GPU {','.join(gpus)} -> 127.0.0.1:{port}")
+        print(f"  前端入口: http://{front_host}:{front_port} (策略: {args.router_policy})")
+        
+        group = ReplicaGroup(replica_cmds, replica_gpus, router_cmd)
+        exit_code = 0
+        detached = False
+        try:
+            group.start(detach=args.detach)
+            if args.wait_ready or args.detach:
+                if not self.wait_ready_and_warmup(args, backends, group.processes[:dp_size]):
+                    sys.exit(1)
+                front_url = self.local_base_url(cmd)
+                self.signal_ready(args, [front_url] + backends, [p.pid for p in group.processes])
+                if args.detach:
+                    detached = True
+                    print("启动器退出，副本与路由在后台运行")
+                    return
+            exit_code = group.wait()
+        except KeyboardInterrupt:
+            print("\n用户中断，关闭所有副本")
+        finally:
+            if not detached:
+                group.stop()
+        if exit_code:
+            sys.exit(1)
+    
     def run(self):
         """主运行函数"""
         parser = self.create_parser()
@@ -324,6 +934,34 @@ class SGLangServerLauncher:
         # 打印配置摘要
         self.print_config_summary(cmd, self.config)
         
+        # 参数核对与容量规划
+        self.check_server_flags(args, cmd)
+        self.check_capacity(args, cmd)
+        
+        # 多节点
+        if "--nnodes" in cmd:
+            multinode = self.check_multinode(args, cmd)
+            if args.multinode == "emit":
+                self.emit_node_commands(args, cmd, multinode)
+                return
+            if args.multinode == "local":
+                self.run_multinode_local(args, cmd, multinode)
+                return
+            if multinode['node_rank'] > 0 and (args.wait_ready or args.detach):
+                print("非 0 号节点不提供 HTTP 服务，忽略 --wait-ready/--detach")
+                args.wait_ready = args.detach = False
+            print(f"启动本节点 (rank {multinode['node_rank']})，其余节点需使用相同配置和各自的 --node-rank 启动")
+        
+        # 多副本数据并行
+        dp_size = self.get_dp_size(args, self.config)
+        if dp_size > 1 and "--nnodes" not in cmd:
+            self.run_replicas(args, cmd, dp_size)
+            return
+        
+        if args.wait_ready or args.detach:
+            self.run_managed(args, cmd)
+            return
+        
         # 启动服务器
         try:
             print("\n正在启动 SGLang 服务器...")
@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+/generate 微批处理客户端
+把并发到达的单个请求在 max_wait_ms 内 (或攒满 max_batch_size 个) 合并为一次批量 /generate 调用，
+再把结果分发回各个等待的调用方，减少高 QPS 下每个请求的 HTTP 与 JSON 开销。
+批量请求被判为无效 (4xx，例如其中一条超出上下文) 时逐条重发，错误只影响对应的调用方；
+超时、连接错误、408/429 与 5xx 不重发，整批失败
+"""
+
+import argparse
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from batch_runner import RETRYABLE_STATUS
+from benchmark import DEFAULT_QUESTIONS, DEFAULT_SYSTEM_PROMPT, percentile
+from http_transport import TRANSPORT_ERRORS, AsyncTransport
+from radix_sim import render_chatml
+
+
+class BatchItemError(RuntimeError):
+    """批量请求中单个条目失败；status 为服务器返回的 HTTP 状态码 (无响应时为 None)"""
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+
+@dataclass
+class _Pending:
+    kind: str  # "text" 或 "input_ids"
+    prompt: Any
+    sampling_params: Dict[str, Any]
+    future: "asyncio.Future[Dict[str, Any]]"
+    enqueued: float
+
+
+@dataclass
+class BatcherStats:
+    """批大小与排队时间统计"""
+    batches: int = 0
+    items: int = 0
+    size_flushes: int = 0  # 攒满 max_batch_size 触发
+    timeout_flushes: int = 0  # 等待 max_wait_ms 触发
+    fallbacks: int = 0  # 批量请求 4xx 后逐条重发的批次
+    errors: int = 0
+    queue_delay: float = 0.0
+    size_histogram: Dict[int, int] = field(default_factory=dict)
+
+    def record_batch(self, size: int):
+        self.batches += 1
+        self.items += size
+        self.size_histogram[size] = self.size_histogram.get(size, 0) + 1
+
+    def summary(self) -> Dict[str, Any]:
+        sizes = sorted(float(size) for size, count in self.size_histogram.items() for _ in range(count))
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+            "p50_batch_size": percentile(sizes, 50),
+            "max_batch_size": sizes[-1] if sizes else 0,
+            "size_flushes": self.size_flushes,
+            "timeout_flushes": self.timeout_flushes,
+            "fallbacks": self.fallbacks,
+            "errors": self.errors,
+            "mean_queue_delay_ms": self.queue_delay / self.items * 1000 if self.items else 0.0,
+        }
+
+
+class MicroBatcher:
+    """异步微批处理器，需在事件循环内使用 (async with)
+
+    generate() 的返回值与单个 /generate 请求的响应相同 ({"text", "meta_info", ...})，失败时抛出 BatchItemError。
+    同时在途的批量请求数受 max_inflight_batches 限制，超出时新批次在客户端排队。
+    """
+
+    def __init__(self, base_url: str, max_batch_size: int = 32, max_wait_ms: float = 5.0,
+                 max_inflight_batches: int = 8, timeout: float = 600,
+                 transport: Optional[AsyncTransport] = None):
+        if max_batch_size < 1 or max_wait_ms < 0:
+            raise ValueError("max_batch_size 必须为正数，max_wait_ms 不能为负数")
+        self.url = f"{base_url.rstrip('/')}/generate"
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.stats = BatcherStats()
+        self._owns_transport = transport is None
+        self.transport = transport if transport is not None else AsyncTransport(pool_size=max_inflight_batches,
+                                                                                timeout=timeout)
+        self._pending: List[_Pending] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._inflight: Optional[asyncio.Semaphore] = None
+        self._max_inflight = max_inflight_batches
+        self._tasks: set = set()
+
+    async def __aenter__(self) -> "MicroBatcher":
+        await self.transport.start()
+        self._inflight = asyncio.Semaphore(self._max_inflight)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        """发出剩余请求并等待所有批次完成"""
+        self._flush("timeout")
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._owns_transport:
+            await self.transport.close()
+
+    async def generate(self, text: Optional[str] = None, input_ids: Optional[List[int]] = None,
+                       sampling_params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        if (text is None) == (input_ids is None):
+            raise ValueError("text 与 input_ids 必须且只能提供一个")
+        if self._inflight is None:
+            raise RuntimeError("MicroBatcher 需要在 async with 中使用")
+        loop = asyncio.get_event_loop()
+        item = _Pending("text" if text is not None else "input_ids", text if text is not None else input_ids,
+                        dict(sampling_params or {}), loop.create_future(), time.perf_counter())
+        self._pending.append(item)
+        if len(self._pending) >= self.max_batch_size:
+            self._flush("size")
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush, "timeout")
+        return await item.future
+
+    def _flush(self, reason: str):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        if reason == "size":
+            self.stats.size_flushes += 1
+        else:
+            self.stats.timeout_flushes += 1
+        # text 与 input_ids 不能混在同一个请求中
+        for kind in ("text", "input_ids"):
+            items = [item for item in batch if item.kind == kind]
+            if items:
+                task = asyncio.ensure_future(self._send_batch(items))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+    async def _post(self, items: List[_Pending]) -> List[Dict[str, Any]]:
+        """发送一次 /generate；单条时不包成列表"""
+        kind = items[0].kind
+        if len(items) == 1:
+            payload = {kind: items[0].prompt, "sampling_params": items[0].sampling_params}
+        else:
+            payload = {kind: [item.prompt for item in items],
+                       "sampling_params": [item.sampling_params for item in items]}
+        async with self.transport.post_json(self.url, payload) as response:
+            if response.status != 200:
+                raise BatchItemError(f"HTTP {response.status}: {await response.text()}", response.status)
+            result = await response.json()
+        outputs = result if isinstance(result, list) else [result]
+        if len(outputs) != len(items):
+            raise BatchItemError(f"返回 {len(outputs)} 条结果，预期 {len(items)} 条")
+        return outputs
+
+    def _resolve(self, item: _Pending, output: Optional[Dict[str, Any]] = None, error: str = ""):
+        if item.future.done():
+            return
+        finish = ((output or {}).get("meta_info") or {}).get("finish_reason") or {}
+        if not error and isinstance(finish, dict) and finish.get("type") == "abort":
+            error = finish.get("message") or "请求被中止"
+        if error:
+            self.stats.errors += 1
+            item.future.set_exception(BatchItemError(error))
+        else:
+            item.future.set_result(output)
+
+    async def _send_batch(self, items: List[_Pending]):
+        try:
+            await self._dispatch(items)
+        except Exception as e:
+            # 兜底: 任何意外错误都要唤醒等待的调用方
+            for item in items:
+                self._resolve(item, error=f"{type(e).__name__}: {e}")
+
+    async def _dispatch(self, items: List[_Pending]):
+        async with self._inflight:
+            now = time.perf_counter()
+            self.stats.record_batch(len(items))
+            self.stats.queue_delay += sum(now - item.enqueued for item in items)
+            try:
+                outputs = await self._post(items)
+            except (BatchItemError, ValueError) + TRANSPORT_ERRORS as e:
+                if len(items) == 1 or not self._is_invalid_request(e):
+                    # 超时、连接错误、408/429 与 5xx 逐条重发只会放大服务器压力，整批失败
+                    for item in items:
+                        self._resolve(item, error=f"{type(e).__name__}: {e}")
+                    return
+            else:
+                for item, output in zip(items, outputs):
+                    self._resolve(item, output)
+                return
+        # 请求被判为无效: 逐条重发以找出出错的条目；每条各占一个批次名额，在途请求数仍受 max_inflight_batches 限制
+        self.stats.fallbacks += 1
+        await asyncio.gather(*(self._send_single(item) for item in items))
+
+    @staticmethod
+    def _is_invalid_request(error: Exception) -> bool:
+        status = getattr(error, "status", None)
+        return status is not None and 400 <= status < 500 and status not in RETRYABLE_STATUS
+
+    async def _send_single(self, item: _Pending):
+        async with self._inflight:
+            try:
+                self._resolve(item, (await self._post([item]))[0])
+            except (BatchItemError, ValueError) + TRANSPORT_ERRORS as e:
+                self._resolve(item, error=f"{type(e).__name__}: {e}")
+
+
+def chat_prompt(question: str, system_prompt: str = DEFAULT_SYSTEM_PROMPT) -> str:
+    """在客户端套用对话模板 (关闭思考)，/generate 接收的是原始 prompt"""
+    return render_chatml([{"role": "system", "content": system_prompt},
+                          {"role": "user", "content": question}], enable_thinking=False)
+
+
+async def run_load(base_url: str, num_requests: int, concurrency: int, max_tokens: int,
+                   batcher_kwargs: Optional[Dict[str, Any]], timeout: float) -> Dict[str, Any]:
+    """以固定并发发送单条请求；batcher_kwargs 为 None 时每个请求单独调用 /generate"""
+    prompts = [chat_prompt(DEFAULT_QUESTIONS[i % len(DEFAULT_QUESTIONS)]) for i in range(num_requests)]
+    sampling = {"max_new_tokens": max_tokens, "temperature": 0.7, "top_p": 0.8, "top_k": 20}
+    latencies: List[float] = []
+    failed = 0
+    queue: "asyncio.Queue[str]" = asyncio.Queue()
+    for prompt in prompts:
+        queue.put_nowait(prompt)
+
+    async with AsyncTransport(pool_size=concurrency, timeout=timeout) as transport:
+        batcher = MicroBatcher(base_url, transport=transport, timeout=timeout, **batcher_kwargs) \
+            if batcher_kwargs is not None else None
+
+        async def call(prompt: str):
+            if batcher is not None:
+                return await batcher.generate(text=prompt, sampling_params=sampling)
+            async with transport.post_json(f"{base_url}/generate",
+                                           {"text": prompt, "sampling_params": sampling}) as response:
+                if response.status != 200:
+                    raise BatchItemError(f"HTTP {response.status}")
+                return await response.json()
+
+        async def worker():
+            nonlocal failed
+            while not queue.empty():
+                prompt = queue.get_nowait()
+                start = time.perf_counter()
+                try:
+                    await call(prompt)
+                    latencies.append(time.perf_counter() - start)
+                except (BatchItemError, ValueError) + TRANSPORT_ERRORS:
+                    failed += 1
+
+        start = time.perf_counter()
+        if batcher is not None:
+            async with batcher:
+                await asyncio.gather(*(worker() for _ in range(concurrency)))
+        else:
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+        duration = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "mode": "微批" if batcher is not None else "逐条",
+        "duration": duration,
+        "completed": len(latencies),
+        "failed": failed,
+        "request_throughput": len(latencies) / duration if duration > 0 else 0.0,
+        "p50_latency": percentile(latencies, 50),
+        "p99_latency": percentile(latencies, 99),
+        "batcher": batcher.stats.summary() if batcher is not None else None,
+    }
+
+
+def print_load_result(result: Dict[str, Any]):
+    print(f"[{result['mode']}] 完成 {result['completed']}, 失败 {result['failed']}, 耗时 {result['duration']:.2f}s, "
+          f"{result['request_throughput']:.1f} req/s, 延迟 p50/p99: "
+          f"{result['p50_latency'] * 1000:.1f} / {result['p99_latency'] * 1000:.1f} ms")
+    stats = result["batcher"]
+    if stats:
+        print(f"  批次: {stats['batches']}, 平均批大小 {stats['mean_batch_size']:.1f} "
+              f"(p50 {stats['p50_batch_size']:.0f}, 最大 {stats['max_batch_size']:.0f}), "
+              f"攒满/超时触发: {stats['size_flushes']}/{stats['timeout_flushes']}, "
+              f"平均排队 {stats['mean_queue_delay_ms']:.2f} ms, 逐条重发批次 {stats['fallbacks']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="/generate 微批处理 - 对比逐条请求与合并为批量请求的吞吐和延迟",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+示例:
+  python micro_batcher.py --num-requests 2000 --concurrency 256 --max-batch-size 32 --max-wait-ms 5
+  python micro_batcher.py --no-compare --max-batch-size 64 --max-wait-ms 2
+        """,
+    )
+    parser.add_argument("--host", default="localhost", help="服务器主机地址")
+    parser.add_argument("--port", default=30000, type=int, help="服务器端口")
+    parser.add_argument("--num-requests", type=int, default=500, help="请求数")
+    parser.add_argument("--concurrency", type=int, default=128, help="并发调用方数量")
+    parser.add_argument("--max-tokens", type=int, default=64, help="每个请求的最大生成 token 数")
+    parser.add_argument("--max-batch-size", type=int, default=32, help="单个批量请求的最大条目数")
+    parser.add_argument("--max-wait-ms", type=float, default=5.0, help="第一条请求到达后最多等待多久发出批次")
+    parser.add_argument("--max-inflight-batches", type=int, default=8, help="同时在途的批量请求数")
+    parser.add_argument("--no-compare", action="store_true", help="只运行微批模式，不运行逐条请求对照")
+    parser.add_argument("--request-timeout", type=float, default=600, help="单请求超时时间(秒)")
+    args = parser.parse_args()
+
+    base_url = f"http://{args.host}:{args.port}"
+    batcher_kwargs = {"max_batch_size": args.max_batch_size, "max_wait_ms": args.max_wait_ms,
+                      "max_inflight_batches": args.max_inflight_batches}
+    print("=" * 60)
+    if not args.no_compare:
+        print_load_result(asyncio.run(run_load(base_url, args.num_requests, args.concurrency, args.max_tokens,
+                                               None, args.request_timeout)))
+    print_load_result(asyncio.run(run_load(base_url, args.num_requests, args.concurrency, args.max_tokens,
+                                           batcher_kwargs, args.request_timeout)))
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,551 @@
+#!/usr/bin/env python3
+"""
+SGLang 模拟服务器
+在没有 GPU 的机器上代替真实服务器，实现 /health、/v1/completions、
+/v1/chat/completions (含 SSE 流式与 chat_template_kwargs)、原生 /generate 与 /abort_request。
+内部按 scheduler_sim.py 的耗时模型运行连续批处理循环: max_running_requests 个槽位、超出时排队，
+prefill 耗时随 prompt 长度 (扣除前缀缓存命中) 增长，decode 每步耗时随批大小和上下文总长增长；
+可选输出 <think> 思考段。相同 prompt 与 --seed 得到相同输出
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import re
+import time
+import uuid
+from array import array
+from collections import deque
+from dataclasses import asdict
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from aiohttp import web
+
+from radix_sim import RadixTree, Tokenizer
+from scheduler_sim import CostModel, load_cost_model
+from workload_gen import EN_WORDS, ZH_PHRASES
+
+CJK_PATTERN = re.compile(r"[一-鿿]")
+THINK_START, THINK_END = "<think>\n", "\n</think>\n\n"
+ASSISTANT_PROMPT = "<|im_start|>assistant\n"
+
+
+class MockRequest:
+    """一个生成请求；输出 token 由引擎逐步放入 queue，None 表示结束"""
+
+    def __init__(self, rid: str, prompt_ids: array, output_len: int, finish_reason: str,
+                 think_tokens: int, zh: bool, seed: int):
+        self.rid = rid
+        self.prompt_ids = prompt_ids
+        self.output_len = output_len
+        self.finish_reason = finish_reason
+        self.think_tokens = min(think_tokens, output_len)
+        self.zh = zh
+        self.rng = random.Random(seed)
+        self.generated = 0
+        self.cached_tokens = 0
+        self.return_ids = False  # /generate 以 input_ids 输入时返回 output_ids
+        self.aborted = False
+        self.arrival = time.perf_counter()
+        self.queue: "asyncio.Queue[Optional[Dict[str, Any]]]" = asyncio.Queue()
+
+    @property
+    def context_len(self) -> int:
+        return len(self.prompt_ids) + self.generated
+
+    @property
+    def finished(self) -> bool:
+        return self.aborted or self.generated >= self.output_len
+
+    def next_token(self) -> Dict[str, Any]:
+        """返回 {"text", "id", "thinking"}；思考段首尾 token 为 <think> 标签"""
+        index = self.generated
+        self.generated += 1
+        thinking = index < self.think_tokens
+        if thinking and index == 0:
+            text = THINK_START
+        elif thinking and index == self.think_tokens - 1:
+            text = THINK_END
+        else:
+            word = self.rng.choice(ZH_PHRASES if self.zh else EN_WORDS)
+            text = word if self.zh else f" {word}"
+        return {"text": text, "id": self.rng.randrange(1000, 150000), "thinking": thinking}
+
+
+class MockEngine:
+    """单循环的连续批处理
+
+    每步要么对新进入的请求做一次 prefill，要么对运行中的请求各解码一个 token
+    """
+
+    def __init__(self, cost: CostModel, max_running_requests: int, max_prefill_tokens: int,
+                 cache_tokens: int, time_scale: float):
+        self.cost = cost
+        self.max_running_requests = max_running_requests
+        self.max_prefill_tokens = max_prefill_tokens
+        self.time_scale = time_scale
+        self.tree = RadixTree(cache_tokens) if cache_tokens > 0 else None
+        self.waiting: "deque[MockRequest]" = deque()
+        self.running: List[MockRequest] = []
+        self.requests: Dict[str, MockRequest] = {}
+        self.wakeup: Optional[asyncio.Event] = None
+        self.stats = {"prefill_steps": 0, "decode_steps": 0, "completed": 0, "aborted": 0,
+                      "prompt_tokens": 0, "cached_tokens": 0}
+        self._next_time = 0.0
+        self._clock = 0  # 前缀缓存 LRU 的逻辑时钟
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self.wakeup = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    def submit(self, req: MockRequest):
+        self.requests[req.rid] = req
+        self.waiting.append(req)
+        self.wakeup.set()
+
+    def abort(self, rid: str) -> bool:
+        req = self.requests.get(rid)
+        if req is None or req.finished:
+            return False
+        req.aborted = True
+        req.finish_reason = "abort"
+        self.requests.pop(rid, None)
+        self.stats["aborted"] += 1
+        req.queue.put_nowait(None)
+        return True
+
+    def flush_cache(self) -> bool:
+        if self.running or self.waiting:
+            return False
+        if self.tree is not None:
+            self.tree = RadixTree(self.tree.capacity)
+        return True
+
+    async def step_sleep(self, ms: float):
+        """按累计的目标时刻睡眠，避免逐步误差累积"""
+        loop = asyncio.get_running_loop()
+        self._next_time = max(self._next_time, loop.time()) + ms * self.time_scale / 1000
+        await asyncio.sleep(max(self._next_time - loop.time(), 0))
+
+    def admit(self) -> List[MockRequest]:
+        admitted: List[MockRequest] = []
+        budget = self.max_prefill_tokens
+        while self.waiting and len(self.running) + len(admitted) < self.max_running_requests:
+            req = self.waiting[0]
+            if req.aborted:
+                self.waiting.popleft()
+                continue
+            if admitted and len(req.prompt_ids) > budget:
+                break
+            budget -= len(req.prompt_ids)
+            admitted.append(self.waiting.popleft())
+        return admitted
+
+    def emit(self, req: MockRequest):
+        if req.aborted:
+            return
+        req.queue.put_nowait(req.next_token())
+        if req.finished:
+            self.stats["completed"] += 1
+            req.queue.put_nowait(None)
+
+    async def run(self):
+        while True:
+            if not self.waiting and not self.running:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+            admitted = self.admit()
+            if admitted:
+                chunks = []
+                for req in admitted:
+                    self._clock += 1
+                    if self.tree is not None and req.prompt_ids:
+                        hit = self.tree.insert(req.prompt_ids, self._clock)
+                        req.cached_tokens = min(hit, len(req.prompt_ids) - 1)
+                    chunks.append((len(req.prompt_ids) - req.cached_tokens, req.cached_tokens))
+                    self.stats["prompt_tokens"] += len(req.prompt_ids)
+                    self.stats["cached_tokens"] += req.cached_tokens
+                await self.step_sleep(self.cost.prefill_ms(chunks))
+                self.stats["prefill_steps"] += 1
+                for req in admitted:
+                    self.emit(req)
+                self.running.extend(admitted)
+            elif self.running:
+                await self.step_sleep(self.cost.decode_ms(len(self.running),
+                                                          sum(r.context_len for r in self.running)))
+                self.stats["decode_steps"] += 1
+                for req in self.running:
+                    self.emit(req)
+            for req in [r for r in self.running if r.finished]:
+                self.running.remove(req)
+                self.requests.pop(req.rid, None)
+
+
+def json_response(data: Any, status: int = 200) -> web.Response:
+    return web.json_response(data, status=status, dumps=lambda obj: json.dumps(obj, ensure_ascii=False))
+
+
+def error_response(message: str, status: int = 400) -> web.Response:
+    return json_response({"object": "error", "message": message, "type": "BadRequestError", "code": status},
+                         status=status)
+
+
+def sse(data: Any) -> bytes:
+    return f"data: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8")
+
+
+class MockServer:
+    def __init__(self, args: argparse.Namespace, cost: CostModel):
+        self.args = args
+        self.cost = cost
+        self.tokenizer = Tokenizer(None, args.bytes_per_token)
+        self.engine = MockEngine(cost, args.max_running_requests, args.max_prefill_tokens,
+                                 args.cache_tokens, args.time_scale)
+
+    async def on_startup(self, app: web.Application):
+        self.engine.start()
+
+    async def on_cleanup(self, app: web.Application):
+        await self.engine.stop()
+
+    def make_request(self, body: Dict[str, Any], prompt_ids: array, prompt_text: str,
+                     max_tokens: Optional[int], ignore_eos: bool, thinking: bool) -> MockRequest:
+        """输出长度由 prompt 决定: 自然长度在 --output-len 的 0.5~1.5 倍之间，受 max_tokens 截断"""
+        digest = hashlib.sha1(f"{self.args.seed}:{prompt_text}:{list(prompt_ids[-64:])}".encode("utf-8")).digest()
+        seed = int.from_bytes(digest[:8], "little")
+        rng = random.Random(seed)
+        think = self.args.think_tokens if thinking and self.args.think_tokens > 0 else 0
+        natural = think + rng.randint(max(self.args.output_len // 2, 1), max(self.args.output_len * 3 // 2, 1))
+        limit = max_tokens if max_tokens is not None else self.args.context_length - len(prompt_ids)
+        output_len = limit if ignore_eos else min(natural, limit)
+        finish_reason = "length" if ignore_eos or natural >= limit else "stop"
+        rid = str(body.get("rid") or uuid.uuid4().hex)
+        return MockRequest(rid, prompt_ids, max(output_len, 1), finish_reason, max(think, 2) if think else 0,
+                           bool(CJK_PATTERN.search(prompt_text)), seed)
+
+    def check_length(self, prompt_ids: array, max_tokens: Optional[int]) -> Optional[web.Response]:
+        total = len(prompt_ids) + (max_tokens or 0)
+        if total > self.args.context_length:
+            return error_response(
+                f"Requested token count exceeds the model's maximum context length of {self.args.context_length} "
+                f"tokens. You requested a total of {total} tokens: {len(prompt_ids)} tokens from the input "
+                f"messages and {max_tokens or 0} tokens for the completion.")
+        return None
+
+    async def tokens(self, req: MockRequest) -> AsyncIterator[Dict[str, Any]]:
+        self.engine.submit(req)
+        try:
+            while True:
+                token = await req.queue.get()
+                if token is None:
+                    return
+                yield token
+        finally:
+            # 处理出错或被取消时中止请求，释放槽位
+            self.engine.abort(req.rid)
+
+    def usage(self, req: MockRequest) -> Dict[str, Any]:
+        return {"prompt_tokens": len(req.prompt_ids), "completion_tokens": req.generated,
+                "total_tokens": len(req.prompt_ids) + req.generated,
+                "prompt_tokens_details": {"cached_tokens": req.cached_tokens}}
+
+    async def read_json(self, request: web.Request) -> Any:
+        try:
+            return await request.json()
+        except ValueError:
+            return None
+
+    # ---- OpenAI 兼容接口 ----
+
+    async def handle_openai(self, request: web.Request) -> web.StreamResponse:
+        chat = request.path == "/v1/chat/completions"
+        body = await self.read_json(request)
+        if not isinstance(body, dict):
+            return error_response("请求体必须是 JSON 对象")
+        max_tokens = body.get("max_completion_tokens", body.get("max_tokens"))
+        if chat:
+            messages = body.get("messages")
+            if not isinstance(messages, list) or not messages:
+                return error_response("messages 不能为空")
+            thinking = (body.get("chat_template_kwargs") or {}).get("enable_thinking", True)
+            prompt_ids = self.tokenizer.encode_messages(messages, thinking)
+            prompt_text = json.dumps(messages, ensure_ascii=False)
+        else:
+            prompt = body.get("prompt")
+            if prompt is None:
+                return error_response("缺少 prompt")
+            prompt_text = prompt if isinstance(prompt, str) else json.dumps(prompt)
+            # 客户端自行渲染的 Qwen3 对话模板停在 assistant 开头时，模型先输出思考段
+            thinking = prompt_text.endswith(ASSISTANT_PROMPT)
+            prompt_ids = self.tokenizer.encode_text(prompt_text)
+        error = self.check_length(prompt_ids, max_tokens)
+        if error is not None:
+            return error
+        req = self.make_request(body, prompt_ids, prompt_text, max_tokens, bool(body.get("ignore_eos")), thinking)
+        separate = chat and bool(self.args.reasoning_parser) and body.get("separate_reasoning", True)
+        model = body.get("model") or self.args.served_model_name
+        created = int(time.time())
+        object_name = "chat.completion" if chat else "text_completion"
+        response_id = f"{'chatcmpl' if chat else 'cmpl'}-{req.rid}"
+
+        if not body.get("stream"):
+            content, reasoning = [], []
+            async for token in self.tokens(req):
+                if separate and token["thinking"]:
+                    if token["text"] not in (THINK_START, THINK_END):
+                        reasoning.append(token["text"])
+                else:
+                    content.append(token["text"])
+            if chat:
+                message: Dict[str, Any] = {"role": "assistant", "content": "".join(content)}
+                if separate:
+                    message["reasoning_content"] = "".join(reasoning).strip() or None
+                choice: Dict[str, Any] = {"index": 0, "message": message, "finish_reason": req.finish_reason}
+            else:
+                choice = {"index": 0, "text": "".join(content), "logprobs": None, "finish_reason": req.finish_reason}
+            return json_response({"id": response_id, "object": object_name, "created": created,
+                                      "model": model, "choices": [choice], "usage": self.usage(req)})
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+        await response.prepare(request)
+        chunk_object = f"{object_name}.chunk" if chat else object_name
+
+        def chunk(choice: Dict[str, Any]) -> bytes:
+            return sse({"id": response_id, "object": chunk_object, "created": created, "model": model,
+                        "choices": [{"index": 0, **choice}]})
+
+        try:
+            if chat:
+                await response.write(chunk({"delta": {"role": "assistant", "content": ""}, "finish_reason": None}))
+            async for token in self.tokens(req):
+                if separate and token["thinking"]:
+                    if token["text"] in (THINK_START, THINK_END):
+                        continue
+                    delta = {"reasoning_content": token["text"]}
+                else:
+                    delta = {"content": token["text"]}
+                choice = {"delta": delta} if chat else {"text": delta["content"] if "content" in delta else ""}
+                await response.write(chunk({**choice, "finish_reason": None}))
+            await response.write(chunk({"delta": {}, "finish_reason": req.finish_reason} if chat
+                                       else {"text": "", "finish_reason": req.finish_reason}))
+            if (body.get("stream_options") or {}).get("include_usage"):
+                await response.write(sse({"id": response_id, "object": chunk_object, "created": created,
+                                          "model": model, "choices": [], "usage": self.usage(req)}))
+            await response.write(b"data: [DONE]\n\n")
+            await response.write_eof()
+        except ConnectionResetError:
+            # 客户端断开: 中止请求，释放槽位
+            self.engine.abort(req.rid)
+        return response
+
+    # ---- 原生接口 ----
+
+    def generate_inputs(self, body: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """把 /generate 的单个或批量输入展开为逐条 {prompt_ids, prompt_text, sampling_params, rid}"""
+        batch = isinstance(body.get("text"), list) or (
+            isinstance(body.get("input_ids"), list) and body["input_ids"] and isinstance(body["input_ids"][0], list))
+        texts = body.get("text") if batch else [body.get("text")]
+        input_ids = body.get("input_ids") if batch else [body.get("input_ids")]
+        count = len(texts if texts is not None and texts[0] is not None else input_ids)
+        sampling = body.get("sampling_params") or {}
+        rids = body.get("rid")
+        items = []
+        for i in range(count):
+            ids = input_ids[i] if input_ids and input_ids[i] is not None else None
+            text = texts[i] if texts and texts[i] is not None else None
+            if ids is None:
+                if text is None:
+                    raise ValueError("需要 text 或 input_ids")
+                if self.args.skip_tokenizer_init:
+                    raise ValueError("服务器以 --skip-tokenizer-init 启动，只接受 input_ids")
+                ids = self.tokenizer.encode_text(text)
+            items.append({
+                "prompt_ids": array('I', ids),
+                "prompt_text": text if text is not None else "",
+                "sampling_params": sampling[i] if isinstance(sampling, list) else sampling,
+                "rid": rids[i] if isinstance(rids, list) else rids,
+            })
+        return items
+
+    def meta_info(self, req: MockRequest) -> Dict[str, Any]:
+        if not req.finished:
+            finish: Optional[Dict[str, Any]] = None
+        elif req.finish_reason == "abort":
+            finish = {"type": "abort", "message": "Abort request"}
+        elif req.finish_reason == "length":
+            finish = {"type": "length", "length": req.generated}
+        else:
+            finish = {"type": "stop", "matched": None}
+        return {"id": req.rid, "prompt_tokens": len(req.prompt_ids), "completion_tokens": req.generated,
+                "cached_tokens": req.cached_tokens, "finish_reason": finish,
+                "e2e_latency": time.perf_counter() - req.arrival}
+
+    def generate_output(self, req: MockRequest, tokens: List[Dict[str, Any]]) -> Dict[str, Any]:
+        output: Dict[str, Any] = {"text": "" if self.args.skip_tokenizer_init else "".join(t["text"] for t in tokens),
+                                  "meta_info": self.meta_info(req)}
+        if req.return_ids:
+            output["output_ids"] = [t["id"] for t in tokens]
+        return output
+
+    async def collect(self, req: MockRequest) -> Dict[str, Any]:
+        tokens = [token async for token in self.tokens(req)]
+        return self.generate_output(req, tokens)
+
+    async def handle_generate(self, request: web.Request) -> web.StreamResponse:
+        body = await self.read_json(request)
+        if not isinstance(body, dict):
+            return error_response("请求体必须是 JSON 对象")
+        try:
+            items = self.generate_inputs(body)
+        except (ValueError, TypeError, IndexError) as e:
+            return error_response(str(e))
+        reqs = []
+        for item in items:
+            sampling = item["sampling_params"] or {}
+            max_new_tokens = sampling.get("max_new_tokens", 128)
+            error = self.check_length(item["prompt_ids"], max_new_tokens)
+            if error is not None:
+                return error
+            req = self.make_request({"rid": item["rid"]}, item["prompt_ids"], item["prompt_text"],
+                                    max_new_tokens, bool(sampling.get("ignore_eos")), False)
+            req.return_ids = self.args.skip_tokenizer_init or not item["prompt_text"]
+            reqs.append(req)
+        batch = isinstance(body.get("text"), list) or (
+            isinstance(body.get("input_ids"), list) and body["input_ids"] and isinstance(body["input_ids"][0], list))
+
+        if not body.get("stream"):
+            outputs = await asyncio.gather(*(self.collect(req) for req in reqs))
+            return json_response(outputs if batch else outputs[0])
+        if batch:
+            return error_response("模拟服务器的 /generate 流式输出只支持单个请求")
+
+        req = reqs[0]
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+        await response.prepare(request)
+        tokens: List[Dict[str, Any]] = []
+        try:
+            async for token in self.tokens(req):
+                tokens.append(token)
+                # 与 SGLang 一致: 每个事件携带到目前为止的完整输出
+                await response.write(sse(self.generate_output(req, tokens)))
+            await response.write(b"data: [DONE]\n\n")
+            await response.write_eof()
+        except ConnectionResetError:
+            self.engine.abort(req.rid)
+        return response
+
+    async def handle_abort(self, request: web.Request) -> web.Response:
+        body = await self.read_json(request) or {}
+        self.engine.abort(str(body.get("rid", "")))
+        return web.Response()
+
+    async def handle_flush_cache(self, request: web.Request) -> web.Response:
+        if self.engine.flush_cache():
+            return web.Response(text="Cache flushed.")
+        return web.Response(text="Cache not flushed. Please check for pending requests.", status=400)
+
+    # ---- 状态接口 ----
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        return web.Response()
+
+    async def handle_model_info(self, request: web.Request) -> web.Response:
+        name = self.args.served_model_name
+        return json_response({"model_path": name, "tokenizer_path": None if self.args.skip_tokenizer_init else name,
+                              "is_generation": True})
+
+    async def handle_models(self, request: web.Request) -> web.Response:
+        return json_response({"object": "list", "data": [
+            {"id": self.args.served_model_name, "object": "model", "owned_by": "sglang",
+             "max_model_len": self.args.context_length}]})
+
+    async def handle_server_info(self, request: web.Request) -> web.Response:
+        engine = self.engine
+        info = {k: v for k, v in vars(self.args).items() if k not in ("cost", "cost_model")}
+        info.update(asdict(self.cost))
+        info.update({
+            "version": "mock",
+            "internal_states": [{
+                "num_running_reqs": len(engine.running), "num_waiting_reqs": len(engine.waiting),
+                "cache_hit_rate": engine.stats["cached_tokens"] / engine.stats["prompt_tokens"]
+                if engine.stats["prompt_tokens"] else 0.0,
+                **engine.stats,
+            }],
+        })
+        return json_response(info)
+
+    def create_app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.on_startup.append(self.on_startup)
+        app.on_cleanup.append(self.on_cleanup)
+        app.router.add_get("/health", self.handle_health)
+        app.router.add_get("/health_generate", self.handle_health)
+        app.router.add_get("/get_model_info", self.handle_model_info)
+        app.router.add_get("/get_server_info", self.handle_server_info)
+        app.router.add_get("/v1/models", self.handle_models)
+        app.router.add_post("/v1/completions", self.handle_openai)
+        app.router.add_post("/v1/chat/completions", self.handle_openai)
+        app.router.add_post("/generate", self.handle_generate)
+        app.router.add_post("/abort_request", self.handle_abort)
+        app.router.add_route("*", "/flush_cache", self.handle_flush_cache)
+        return app
+
+
+def create_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="SGLang 模拟服务器 (CPU 上运行，按耗时模型模拟连续批处理)",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+示例:
+  python mock_server.py --port 30000 --max-running-requests 32 --think-tokens 64 --reasoning-parser qwen3
+  python mock_server.py --port 30001 --cost decode_base_ms=12 --time-scale 0.1   # 十倍速
+  python benchmark.py --port 30000 --api chat --num-prompts 200 --concurrency 64
+        """,
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址")
+    parser.add_argument("--port", default=30000, type=int, help="监听端口")
+    parser.add_argument("--served-model-name", default="default", help="/v1/models 返回的模型名")
+    parser.add_argument("--max-running-requests", type=int, default=64, help="同时运行的请求槽位，超出时排队")
+    parser.add_argument("--max-prefill-tokens", type=int, default=16384, help="单次 prefill 步的 token 上限")
+    parser.add_argument("--context-length", type=int, default=32768, help="prompt + max_tokens 上限，超出返回 400")
+    parser.add_argument("--cache-tokens", type=int, default=200000,
+                        help="前缀缓存容量 (token)，命中部分不计入 prefill 耗时；0 关闭")
+    parser.add_argument("--output-len", type=int, default=200,
+                        help="未设置 ignore_eos 时的自然输出长度中位数 (实际在 0.5~1.5 倍之间，由 prompt 决定)")
+    parser.add_argument("--think-tokens", type=int, default=0,
+                        help="思考模式请求 (enable_thinking 的 chat 或停在 assistant 开头的 prompt) 的思考段 token 数")
+    parser.add_argument("--reasoning-parser",
+                        help="设置后思考段放入 reasoning_content (与 SGLang --reasoning-parser 行为一致)")
+    parser.add_argument("--skip-tokenizer-init", action="store_true",
+                        help="/generate 只接受 input_ids 并返回 output_ids")
+    parser.add_argument("--bytes-per-token", type=int, default=3, choices=[1, 2, 3, 4],
+                        help="prompt token 数按 UTF-8 字节近似")
+    parser.add_argument("--cost-model", help="耗时模型 YAML/JSON 文件 (字段见 scheduler_sim.py 中的 CostModel)")
+    parser.add_argument("--cost", action="append", default=[], metavar="KEY=VALUE", help="覆盖耗时模型参数")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="所有耗时乘以该系数，0 表示不等待")
+    parser.add_argument("--seed", type=int, default=0, help="输出内容的随机种子")
+    return parser
+
+
+def main():
+    parser = create_parser()
+    args = parser.parse_args()
+    try:
+        cost = load_cost_model(args.cost_model, args.cost)
+    except ValueError as e:
+        parser.error(str(e))
+    server = MockServer(args, cost)
+    print(f"模拟服务器启动: http://{args.host}:{args.port} (槽位: {args.max_running_requests}, "
+          f"前缀缓存: {args.cache_tokens or '关闭'}, 思考段: {args.think_tokens or '无'} token)")
+    web.run_app(server.create_app(), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,573 @@
+#!/usr/bin/env python3
+"""
+离线前缀缓存 (RadixAttention) 命中率模拟
+按请求日志的顺序把每个请求的 token 序列插入基数树，树中缓存的 token 数超过容量时按 LRU 逐出叶子，
+统计不同容量下的前缀命中率、节省的 prefill token 数和逐出量，
+再结合容量规划把缓存容量换算为 KV 显存和 mem_fraction_static，并给出 context_length 建议
+"""
+
+import argparse
+import copy
+import heapq
+import json
+import math
+import os
+import sys
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from capacity_planner import GIB, detect_gpu_memory_gb, load_model_shape, plan_from_command
+
+DEFAULT_CAPACITIES = ["64k", "256k", "1m", "4m", "inf"]
+
+
+class RadixTree:
+    """数组化的基数树
+
+    节点字段存放在并行数组中，边上的 token 存放在同一个缓冲区里 (节点只记录起点和长度)，
+    只有内部节点才分配子节点字典，百万级请求回放时内存和分配开销都可控。
+    last_access 使用请求序号作为逻辑时钟；capacity 为 None 表示不限容量 (不逐出)。
+    lock_ref 大于 0 的节点正被运行中的请求引用 (从节点到根整条路径)，不会被逐出。
+    """
+
+    def __init__(self, capacity: Optional[int] = None):
+        self.capacity = capacity
+        self.buffer = array('I')
+        self.parent = array('q', [-1])
+        self.edge_start = array('q', [0])
+        self.edge_len = array('q', [0])
+        self.last_access = array('q', [0])
+        self.lock_ref = array('q', [0])
+        self.children: List[Optional[Dict[int, int]]] = [{}]
+        self.free: List[int] = []
+        self.leaf_heap: List[Tuple[int, int]] = []  # (last_access, node)，惰性删除过期项
+        self.size = 0  # 树中缓存的 token 数
+        self.protected_size = 0  # 其中被锁定的 token 数
+        self.peak_size = 0
+        self.evicted_tokens = 0
+        self.evicted_nodes = 0
+        self.version = 0  # 树结构 (节点增删/拆分) 每次变化时递增
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self.parent) - len(self.free)
+
+    def _new_node(self, parent: int, start: int, length: int, now: int) -> int:
+        if self.free:
+            node = self.free.pop()
+            self.parent[node] = parent
+            self.edge_start[node] = start
+            self.edge_len[node] = length
+            self.last_access[node] = now
+            self.lock_ref[node] = 0
+            self.children[node] = None
+            return node
+        self.parent.append(parent)
+        self.edge_start.append(start)
+        self.edge_len.append(length)
+        self.last_access.append(now)
+        self.lock_ref.append(0)
+        self.children.append(None)
+        return len(self.parent) - 1
+
+    def _common_prefix(self, start: int, seq: array, pos: int, limit: int) -> int:
+        """边上 token 与 seq[pos:] 的公共前缀长度 (首个 token 已知相同)；切片比较在 C 层完成"""
+        buffer = self.buffer
+        if buffer[start:start + limit] == seq[pos:pos + limit]:
+            return limit
+        lo, hi = 1, limit - 1
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if buffer[start:start + mid] == seq[pos:pos + mid]:
+                lo = mid
+            else:
+                hi = mid - 1
+        return lo
+
+    def _split(self, node: int, length: int) -> int:
+        """在边的第 length 个 token 处拆分，返回新的中间节点"""
+        parent = self.parent[node]
+        start = self.edge_start[node]
+        mid = self._new_node(parent, start, length, self.last_access[node])
+        self.lock_ref[mid] = self.lock_ref[node]
+        self.children[parent][self.buffer[start]] = mid
+        self.edge_start[node] = start + length
+        self.edge_len[node] -= length
+        self.parent[node] = mid
+        self.children[mid] = {self.buffer[start + length]: node}
+        return mid
+
+    def match_prefix(self, seq: array) -> Tuple[int, int]:
+        """只读匹配，返回 (命中长度, 最后一个完整匹配的节点)"""
+        node, pos, n = 0, 0, len(seq)
+        while pos < n:
+            children = self.children[node]
+            child = children.get(seq[pos]) if children else None
+            if child is None:
+                break
+            length = self.edge_len[child]
+            matched = self._common_prefix(self.edge_start[child], seq, pos, min(length, n - pos))
+            pos += matched
+            if matched < length:
+                break
+            node = child
+        return pos, node
+
+    def evict_to(self, capacity: int):
+        """调整容量并立即逐出 (容量随运行中请求占用的 KV 变化时使用)"""
+        self.capacity = capacity
+        if self.size > capacity:
+            self._evict()
+
+    @property
+    def evictable_size(self) -> int:
+        return self.size - self.protected_size
+
+    def inc_lock_ref(self, node: int):
+        while node:
+            if self.lock_ref[node] == 0:
+                self.protected_size += self.edge_len[node]
+            self.lock_ref[node] += 1
+            node = self.parent[node]
+
+    def dec_lock_ref(self, node: int):
+        """解锁路径；重新变为可逐出的叶子放回 LRU 堆"""
+        while node:
+            self.lock_ref[node] -= 1
+            if self.lock_ref[node] == 0:
+                self.protected_size -= self.edge_len[node]
+                if not self.children[node]:
+                    heapq.heappush(self.leaf_heap, (self.last_access[node], node))
+            node = self.parent[node]
+
+    def insert(self, seq: array, now: int) -> int:
+        """插入 token 序列并返回命中的前缀长度"""
+        return self.insert_node(seq, now)[0]
+
+    def insert_node(self, seq: array, now: int, evict: bool = True) -> Tuple[int, int]:
+        """插入 token 序列，返回 (命中长度, 序列末尾所在节点)；evict=False 时由调用方锁定后再逐出"""
+        self.version += 1
+        node, pos, n = 0, 0, len(seq)
+        while pos < n:
+            children = self.children[node]
+            child = children.get(seq[pos]) if children else None
+            if child is None:
+                break
+            length = self.edge_len[child]
+            matched = self._common_prefix(self.edge_start[child], seq, pos, min(length, n - pos))
+            if matched < length:
+                child = self._split(child, matched)
+            self.last_access[child] = now
+            node = child
+            pos += matched
+            if matched < length:
+                break
+        hit = pos
+
+        if pos < n:
+            start = len(self.buffer)
+            self.buffer.extend(seq[pos:])
+            leaf = self._new_node(node, start, n - pos, now)
+            if self.children[node] is None:
+                self.children[node] = {}
+            self.children[node][seq[pos]] = leaf
+            self.size += n - pos
+            node = leaf
+        if self.capacity is not None:
+            if node and not self.children[node]:
+                heapq.heappush(self.leaf_heap, (now, node))
+            if evict and self.size > self.capacity:
+                self._evict()
+        self.peak_size = max(self.peak_size, self.size)
+        return hit, node
+
+    def _evict(self):
+        heap = self.leaf_heap
+        while self.size > self.capacity and heap:
+            stamp, node = heapq.heappop(heap)
+            if (self.parent[node] < 0 or self.children[node] or self.lock_ref[node]
+                    or self.last_access[node] != stamp):
+                continue
+            parent = self.parent[node]
+            length = self.edge_len[node]
+            del self.children[parent][self.buffer[self.edge_start[node]]]
+            self.parent[node] = -1
+            self.children[node] = None
+            self.free.append(node)
+            self.size -= length
+            self.version += 1
+            self.evicted_tokens += length
+            self.evicted_nodes += 1
+            if parent and not self.children[parent]:
+                heapq.heappush(heap, (self.last_access[parent], parent))
+        if len(self.buffer) > 2 * self.size + (1 << 20):
+            self._compact()
+
+    def _compact(self):
+        """逐出只释放节点，缓冲区中的 token 在此统一回收"""
+        buffer = array('I')
+        for node in range(1, len(self.parent)):
+            if self.parent[node] >= 0:
+                start, length = self.edge_start[node], self.edge_len[node]
+                self.edge_start[node] = len(buffer)
+                buffer.extend(self.buffer[start:start + length])
+        self.buffer = buffer
+
+
+class TokenizedLog:
+    """所有请求的 token 拼接在一个数组中，offsets[i]:offsets[i+1] 为第 i 个请求"""
+
+    def __init__(self):
+        self.tokens = array('I')
+        self.offsets = array('Q', [0])
+        self.max_tokens = array('I')
+
+    def __len__(self) -> int:
+        return len(self.max_tokens)
+
+    def append(self, tokens, max_tokens: int):
+        self.tokens.extend(tokens)
+        self.offsets.append(len(self.tokens))
+        self.max_tokens.append(max_tokens)
+
+    def prompt_length(self, index: int) -> int:
+        return self.offsets[index + 1] - self.offsets[index]
+
+
+def _content_text(content: Any) -> str:
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return "" if content is None else str(content)
+
+
+def chatml_segments(messages: List[Dict[str, Any]], enable_thinking: bool = True) -> List[str]:
+    """按消息切分的 Qwen3 对话模板近似渲染，最后一段为生成提示
+
+    片段都以特殊 token 开头，分词不会跨片段合并，各片段 token 数之和等于整体 token 数。
+    与 Qwen3 模板一致，最后一条 user 消息之前的 assistant 历史去掉思考段
+    """
+    last_user = max((i for i, m in enumerate(messages) if m.get("role") == "user"), default=-1)
+    segments = []
+    for i, m in enumerate(messages):
+        role = m.get("role", "user")
+        content = _content_text(m.get("content"))
+        if role == "assistant" and i < last_user and "</think>" in content:
+            content = content.split("</think>")[-1].lstrip("\n")
+        segments.append(f"<|im_start|>{role}\n{content}<|im_end|>\n")
+    segments.append("<|im_start|>assistant\n" if enable_thinking else "<|im_start|>assistant\n<think>\n\n</think>\n\n")
+    return segments
+
+
+def render_chatml(messages: List[Dict[str, Any]], enable_thinking: bool = True) -> str:
+    """Qwen3 对话模板的近似渲染 (无法加载 tokenizer 时使用)"""
+    return "".join(chatml_segments(messages, enable_thinking))
+
+
+def approximate_tokens(text: str, bytes_per_token: int) -> array:
+    """按 UTF-8 字节定长切块近似 token: 相同前缀得到相同的块序列，分叉位置精确到块"""
+    data = text.encode("utf-8")
+    data += b"\0" * (-len(data) % bytes_per_token)
+    return array('I', (int.from_bytes(data[i:i + bytes_per_token], "little")
+                       for i in range(0, len(data), bytes_per_token)))
+
+
+class Tokenizer:
+    """优先使用模型自带 tokenizer 与对话模板，不可用时退化为字节近似"""
+
+    def __init__(self, model_path: Optional[str], bytes_per_token: int):
+        self.bytes_per_token = bytes_per_token
+        self.hf_tokenizer = None
+        if model_path:
+            try:
+                from transformers import AutoTokenizer
+                self.hf_tokenizer = AutoTokenizer.from_pretrained(model_path, trust_remote_code=True)
+            except Exception as e:
+                print(f"警告: 无法加载 tokenizer ({e})，改用 {bytes_per_token} 字节/token 近似")
+
+    @property
+    def description(self) -> str:
+        if self.hf_tokenizer is not None:
+            return f"tokenizer ({self.hf_tokenizer.name_or_path})"
+        return f"字节近似 ({self.bytes_per_token} 字节/token)"
+
+    def encode_messages(self, messages: List[Dict[str, Any]], enable_thinking: bool):
+        if self.hf_tokenizer is not None:
+            return self.hf_tokenizer.apply_chat_template(messages, tokenize=True, add_generation_prompt=True,
+                                                         enable_thinking=enable_thinking)
+        return approximate_tokens(render_chatml(messages, enable_thinking), self.bytes_per_token)
+
+    def encode_text(self, text: str):
+        if self.hf_tokenizer is not None:
+            return self.hf_tokenizer.encode(text, add_special_tokens=False)
+        return approximate_tokens(text, self.bytes_per_token)
+
+
+def tokenize_request(item: Dict[str, Any], tokenizer: Tokenizer):
+    """支持 batch_runner 输入格式 (可带 body)、chat messages、completions prompt 和 /generate 的 text/input_ids"""
+    body = item.get("body", item)
+    if body.get("input_ids") is not None:
+        return body["input_ids"]
+    if body.get("messages") is not None:
+        enable_thinking = (body.get("chat_template_kwargs") or {}).get("enable_thinking", True)
+        return tokenizer.encode_messages(body["messages"], enable_thinking)
+    prompt = body.get("prompt", body.get("text", ""))
+    if isinstance(prompt, list):
+        prompt = "".join(map(str, prompt))
+    return tokenizer.encode_text(str(prompt))
+
+
+def request_max_tokens(item: Dict[str, Any], default: int) -> int:
+    body = item.get("body", item)
+    sampling = body.get("sampling_params") or {}
+    value = body.get("max_tokens") or body.get("max_completion_tokens") or sampling.get("max_new_tokens")
+    return int(value) if value else default
+
+
+def load_log(path: str, tokenizer: Tokenizer, default_max_tokens: int,
+             max_requests: Optional[int] = None) -> TokenizedLog:
+    log = TokenizedLog()
+    skipped = 0
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+                tokens = tokenize_request(item, tokenizer)
+            except (ValueError, TypeError, AttributeError):
+                skipped += 1
+                continue
+            log.append(tokens, request_max_tokens(item, default_max_tokens))
+            if max_requests and len(log) >= max_requests:
+                break
+    if skipped:
+        print(f"警告: 跳过 {skipped} 行无法解析的请求")
+    return log
+
+
+def simulate(log: TokenizedLog, capacity: Optional[int]) -> Dict[str, Any]:
+    """按日志顺序回放；完全命中时 SGLang 仍需重算最后一个 token，因此命中长度最多为 n-1"""
+    tree = RadixTree(capacity)
+    tokens, offsets = log.tokens, log.offsets
+    total = cached = hit_requests = 0
+    start = time.perf_counter()
+    for i in range(len(log)):
+        seq = tokens[offsets[i]:offsets[i + 1]]
+        hit = min(tree.insert(seq, i + 1), max(len(seq) - 1, 0))
+        total += len(seq)
+        cached += hit
+        hit_requests += hit > 0
+    return {
+        "capacity_tokens": capacity,
+        "requests": len(log),
+        "prompt_tokens": total,
+        "cached_tokens": cached,
+        "prefill_tokens": total - cached,
+        "token_hit_rate": cached / total if total else 0.0,
+        "request_hit_rate": hit_requests / len(log) if len(log) else 0.0,
+        "evicted_tokens": tree.evicted_tokens,
+        "evicted_nodes": tree.evicted_nodes,
+        "churn": tree.evicted_tokens / total if total else 0.0,
+        "peak_cached_tokens": tree.peak_size,
+        "tree_nodes": tree.num_nodes,
+        "elapsed_s": time.perf_counter() - start,
+    }
+
+
+# 并行模拟时由 fork 出的子进程直接继承，避免序列化整份日志
+_SHARED_LOG: Optional[TokenizedLog] = None
+
+
+def _simulate_shared(capacity: Optional[int]) -> Dict[str, Any]:
+    return simulate(_SHARED_LOG, capacity)
+
+
+def simulate_capacities(log: TokenizedLog, capacities: List[Optional[int]], workers: int) -> List[Dict[str, Any]]:
+    global _SHARED_LOG
+    if workers <= 1 or len(capacities) <= 1:
+        return [simulate(log, capacity) for capacity in capacities]
+    _SHARED_LOG = log
+    import multiprocessing
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("fork")) as pool:
+        return list(pool.map(_simulate_shared, capacities))
+
+
+def parse_capacity(value: str) -> Optional[int]:
+    """支持 inf 以及 k/m 后缀，例如 256k、1.5m"""
+    text = value.strip().lower()
+    if text in ("inf", "none", "unlimited"):
+        return None
+    scale = {"k": 1000, "m": 1000 ** 2}.get(text[-1:], 1)
+    if scale != 1:
+        text = text[:-1]
+    try:
+        capacity = int(float(text) * scale)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"无效的容量: {value}")
+    if capacity <= 0:
+        raise argparse.ArgumentTypeError(f"容量必须为正数: {value}")
+    return capacity
+
+
+def percentile(values: List[int], q: float) -> int:
+    if not values:
+        return 0
+    ordered = sorted(values)
+    return ordered[min(int(math.ceil(q / 100 * len(ordered))) - 1, len(ordered) - 1) if q > 0 else 0]
+
+
+def length_stats(log: TokenizedLog) -> Dict[str, Any]:
+    """prompt 与 prompt+max_tokens 的长度分布，用于选择 context_length"""
+    prompts = [log.prompt_length(i) for i in range(len(log))]
+    totals = [p + m for p, m in zip(prompts, log.max_tokens)]
+    stats = {}
+    for name, values in (("prompt", prompts), ("prompt_plus_max_tokens", totals)):
+        stats[name] = {f"p{q:g}": percentile(values, q) for q in (50, 90, 99, 99.9)}
+        stats[name]["max"] = max(values) if values else 0
+    # 覆盖 99.9% 请求并按 1024 向上取整
+    stats["suggested_context_length"] = -(-stats["prompt_plus_max_tokens"]["p99.9"] // 1024) * 1024
+    return stats
+
+
+def _fmt_tokens(value: Optional[int]) -> str:
+    if value is None:
+        return "inf"
+    if value >= 1000 ** 2:
+        return f"{value / 1000 ** 2:.2f}M"
+    if value >= 1000:
+        return f"{value / 1000:.1f}k"
+    return str(value)
+
+
+def print_report(results: List[Dict[str, Any]], lengths: Dict[str, Any], plan: Optional[Any]):
+    print("\n" + "=" * 100)
+    header = f"{'容量(token)':>12}{'token命中率':>12}{'请求命中率':>12}{'节省prefill':>14}{'逐出token':>12}{'逐出/输入':>10}"
+    if plan is not None:
+        header += f"{'KV显存GiB':>11}{'mem_fraction':>14}"
+    print(header)
+    print("=" * 100)
+    for r in results:
+        row = (f"{_fmt_tokens(r['capacity_tokens']):>12}{r['token_hit_rate']:>12.1%}{r['request_hit_rate']:>12.1%}"
+               f"{_fmt_tokens(r['cached_tokens']):>14}{_fmt_tokens(r['evicted_tokens']):>12}{r['churn']:>10.2f}")
+        if plan is not None and "kv_gib" in r:
+            row += f"{r['kv_gib']:>11.2f}{r['mem_fraction_static']:>14.3f}"
+        if r.get("label"):
+            row += f"  <- {r['label']}"
+        print(row)
+    print("=" * 100)
+
+    unlimited = next((r for r in results if r["capacity_tokens"] is None), None)
+    if unlimited:
+        print(f"不限容量时缓存的 token 总量 (工作集上界): {_fmt_tokens(unlimited['peak_cached_tokens'])}")
+        ceiling = unlimited["token_hit_rate"]
+        enough = [r for r in results if r["capacity_tokens"] is not None and r["token_hit_rate"] >= 0.95 * ceiling]
+        if enough and ceiling > 0:
+            best = min(enough, key=lambda r: r["capacity_tokens"])
+            print(f"达到上限命中率 {ceiling:.1%} 的 95% 所需最小容量: {_fmt_tokens(best['capacity_tokens'])} token")
+
+    prompt, total = lengths["prompt"], lengths["prompt_plus_max_tokens"]
+    print(f"prompt 长度:            p50={prompt['p50']} p99={prompt['p99']} max={prompt['max']}")
+    print(f"prompt + max_tokens:    p50={total['p50']} p99={total['p99']} p99.9={total['p99.9']} max={total['max']}")
+    print(f"建议 context_length:    {lengths['suggested_context_length']} (覆盖 99.9% 请求)")
+    if plan is not None:
+        print("注: 缓存容量之外还需为运行中请求的 KV 预留空间，mem_fraction_static 超过 0.95 的容量不可行")
+
+
+def load_plan(launcher_argv: List[str], gpu_memory_gb: Optional[float]):
+    """按 launch_server.py 的配置/预设做容量规划；失败时返回 None (只输出命中率)"""
+    from launch_server import SGLangServerLauncher
+
+    launcher = SGLangServerLauncher()
+    launcher_args = launcher.create_parser().parse_args(launcher_argv)
+    config = launcher.load_config(launcher_args.config or launcher.default_config_path)
+    if launcher_args.preset:
+        config = launcher.apply_quantization_preset(copy.deepcopy(config), launcher_args.preset)
+    model_path = launcher_args.model_path or config.get('model', {}).get('model_path')
+    gpu_memory_gb = gpu_memory_gb or detect_gpu_memory_gb()
+    if gpu_memory_gb is None:
+        print("提示: 无法检测 GPU 显存 (可用 --gpu-memory-gb 指定)，不换算 KV 显存")
+        return model_path, None
+    try:
+        shape = load_model_shape(model_path)
+    except (OSError, KeyError, ValueError, TypeError) as e:
+        print(f"提示: 无法读取模型 config.json ({e})，不换算 KV 显存")
+        return model_path, None
+    return model_path, plan_from_command(launcher.build_command(launcher_args, config), gpu_memory_gb, shape)
+
+
+def attach_memory(results: List[Dict[str, Any]], plan: Any):
+    """把缓存容量换算为单卡 KV 显存，以及放下权重 + 该容量所需的 mem_fraction_static"""
+    gpu_bytes = plan.gpu_memory_gb * GIB
+    for r in results:
+        if r["capacity_tokens"] is None:
+            continue
+        kv_bytes = r["capacity_tokens"] * plan.kv_bytes_per_token
+        r["kv_gib"] = kv_bytes / GIB
+        r["mem_fraction_static"] = (plan.weight_bytes + kv_bytes) / gpu_bytes
+        if r["capacity_tokens"] == plan.cacheable_tokens:
+            r["label"] = "当前配置"
+        elif r["mem_fraction_static"] > 0.95:
+            r["label"] = "显存不足"
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="离线模拟前缀缓存命中率 - 评估 radix cache 收益与所需 KV 容量",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+未识别的参数会原样传给 launch_server.py 的参数解析 (例如 --config, --preset, --model-path)，
+用于加载 tokenizer 并把缓存容量换算为显存，例如:
+  python radix_sim.py --input requests.jsonl --capacities 256k 1m 4m inf --preset balanced --gpu-memory-gb 24
+        """
+    )
+    parser.add_argument("--input", "-i", required=True, help="请求日志 JSONL (messages / prompt / text / input_ids)")
+    parser.add_argument("--capacities", nargs="+", type=parse_capacity, default=None,
+                        help=f"缓存容量 (token)，支持 k/m 后缀和 inf，默认 {' '.join(DEFAULT_CAPACITIES)} 及当前配置的容量")
+    parser.add_argument("--approximate", action="store_true", help="不加载 tokenizer，直接按字节近似")
+    parser.add_argument("--bytes-per-token", type=int, default=3, choices=[1, 2, 3, 4],
+                        help="字节近似时每个 token 的 UTF-8 字节数 (中文约 3，英文约 4)")
+    parser.add_argument("--max-requests", type=int, help="只回放前 N 个请求")
+    parser.add_argument("--default-max-tokens", type=int, default=2048, help="请求未指定 max_tokens 时的假设值")
+    parser.add_argument("--gpu-memory-gb", type=float, help="单卡显存 GiB (默认通过 nvidia-smi 检测)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="并行模拟的进程数")
+    parser.add_argument("--output", "-o", help="结果写入 JSON 文件")
+    args, launcher_argv = parser.parse_known_args()
+
+    model_path, plan = load_plan(launcher_argv, args.gpu_memory_gb)
+    tokenizer = Tokenizer(None if args.approximate else model_path, args.bytes_per_token)
+
+    start = time.perf_counter()
+    try:
+        log = load_log(args.input, tokenizer, args.default_max_tokens, args.max_requests)
+    except OSError as e:
+        print(f"错误: 无法读取请求日志: {e}")
+        sys.exit(1)
+    if not len(log):
+        print("错误: 请求日志为空")
+        sys.exit(1)
+    print(f"已加载 {len(log)} 个请求 / {len(log.tokens):,} 个 prompt token，"
+          f"{tokenizer.description}，耗时 {time.perf_counter() - start:.1f}s")
+
+    capacities = args.capacities or [parse_capacity(c) for c in DEFAULT_CAPACITIES]
+    if plan is not None and args.capacities is None and plan.cacheable_tokens > 0:
+        capacities.append(plan.cacheable_tokens)
+    capacities = sorted(set(capacities), key=lambda c: math.inf if c is None else c)
+
+    results = simulate_capacities(log, capacities, args.workers)
+    if plan is not None:
+        attach_memory(results, plan)
+    lengths = length_stats(log)
+    print_report(results, lengths, plan)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({"input": args.input, "tokenizer": tokenizer.description, "requests": len(log),
+                       "results": results, "lengths": lengths}, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+请求级精确匹配响应缓存
+以请求参数的规范化哈希为键，内存 LRU + TTL，可选 SQLite 磁盘存储供多进程共享
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import orjson
+
+# 不影响生成结果的字段不参与缓存键计算
+NON_SEMANTIC_FIELDS = {"stream", "stream_options", "user", "timeout"}
+
+
+def request_cache_key(request: Dict[str, Any]) -> str:
+    """计算请求的规范化哈希 (键顺序、空白无关)"""
+    canonical = {k: v for k, v in request.items() if k not in NON_SEMANTIC_FIELDS and v is not None}
+    return hashlib.sha256(orjson.dumps(canonical, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+
+def is_deterministic(request: Dict[str, Any]) -> bool:
+    """贪心解码 (temperature=0 或 top_k=1) 时同一请求的输出是确定的"""
+    temperature = request.get("temperature", 1.0)
+    return temperature == 0 or request.get("top_k") == 1
+
+
+class LRUCache:
+    """带过期时间的内存 LRU 缓存 (线程安全)"""
+
+    def __init__(self, capacity: int = 1024, ttl: Optional[float] = 3600):
+        self.capacity = capacity
+        self.ttl = ttl
+        self._data: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at and expires_at < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def put(self, key: str, value: Any, expires_at: Optional[float] = None):
+        if expires_at is None:
+            expires_at = time.time() + self.ttl if self.ttl else 0.0
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.capacity:
+                self._data.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SQLiteStore:
+    """SQLite 磁盘存储 - WAL 模式下可被多个进程同时读写"""
+
+    def __init__(self, path: str, ttl: Optional[float] = 3600):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS response_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 连接不能跨线程共享，每个线程持有自己的连接
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[Tuple[float, Any]]:
+        row = self._conn().execute(
+            "SELECT value, expires_at FROM response_cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at and expires_at < time.time():
+            return None
+        return expires_at, orjson.loads(value)
+
+    def put(self, key: str, value: Any):
+        expires_at = time.time() + self.ttl if self.ttl else 0.0
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO response_cache (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, orjson.dumps(value).decode("utf-8"), expires_at),
+        )
+        conn.commit()
+
+    def purge_expired(self) -> int:
+        """删除已过期的条目，返回删除数量"""
+        conn = self._conn()
+        cursor = conn.execute(
+            "DELETE FROM response_cache WHERE expires_at > 0 AND expires_at < ?", (time.time(),)
+        )
+        conn.commit()
+        return cursor.rowcount
+
+
+class ResponseCache:
+    """响应缓存
+
+    默认只缓存确定性请求；cache_sampled=True 时调用方显式接受对采样请求复用同一结果
+    (例如 FAQ 类问题)。先查内存 LRU，再查磁盘，磁盘命中会回填内存。
+    """
+
+    def __init__(self, capacity: int = 1024, ttl: Optional[float] = 3600,
+                 disk_path: Optional[str] = None, cache_sampled: bool = False):
+        self.memory = LRUCache(capacity, ttl)
+        self.disk = SQLiteStore(disk_path, ttl) if disk_path else None
+        self.cache_sampled = cache_sampled
+        self._lock = threading.Lock()
+        self.metrics = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "bypassed": 0, "stores": 0}
+
+    def _count(self, name: str):
+        with self._lock:
+            self.metrics[name] += 1
+
+    def cacheable(self, request: Dict[str, Any]) -> bool:
+        return self.cache_sampled or is_deterministic(request)
+
+    def get(self, request: Dict[str, Any]) -> Optional[Any]:
+        if not self.cacheable(request):
+            self._count("bypassed")
+            return None
+        key = request_cache_key(request)
+        value = self.memory.get(key)
+        if value is not None:
+            self._count("memory_hits")
+            return value
+        if self.disk is not None:
+            item = self.disk.get(key)
+            if item is not None:
+                expires_at, value = item
+                self.memory.put(key, value, expires_at)
+                self._count("disk_hits")
+                return value
+        self._count("misses")
+        return None
+
+    def put(self, request: Dict[str, Any], value: Any):
+        if not self.cacheable(request):
+            return
+        key = request_cache_key(request)
+        self.memory.put(key, value)
+        if self.disk is not None:
+            self.disk.put(key, value)
+        self._count("stores")
+
+    def get_or_compute(self, request: Dict[str, Any], compute: Callable[[], Any]) -> Any:
+        """命中则直接返回，否则调用 compute 并缓存结果；compute 抛出的异常不会被缓存"""
+        value = self.get(request)
+        if value is None:
+            value = compute()
+            self.put(request, value)
+        return value
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.metrics)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        stats["memory_entries"] = len(self.memory)
+        return stats
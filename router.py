@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+"""
+SGLang 多副本路由
+OpenAI 兼容的透传代理，把请求负载均衡到多个 SGLang 服务器副本，支持流式响应。
+prefix 策略按系统提示词/对话前缀做一致性哈希，让共享前缀的请求落在同一副本以复用 RadixAttention 缓存。
+"""
+
+import argparse
+import asyncio
+import hashlib
+import ipaddress
+import itertools
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web
+
+from http_transport import TRANSPORT_ERRORS, AsyncTransport
+from traffic_trace import PREFIX_CHARS, TraceRecorder
+
+# 逐跳头部不能透传给下游；传输层会自动解压，content-encoding 也不再透传
+HOP_BY_HOP_HEADERS = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "te", "trailers", "transfer-encoding", "upgrade", "content-length", "host",
+    "content-encoding",
+}
+
+
+class Backend:
+    """单个后端副本及其运行统计"""
+
+    def __init__(self, url: str, recent_prefix_capacity: int = 4096):
+        self.url = url.rstrip("/")
+        self.healthy = True
+        self.inflight = 0
+        self.total_requests = 0
+        self.failed_requests = 0
+        # 前缀亲和统计: 命中表示该前缀最近已路由到本副本，大概率复用其前缀缓存
+        self.prefix_hits = 0
+        self.prefix_misses = 0
+        self.fallback_routes = 0
+        self.recent_prefixes: "OrderedDict[str, None]" = OrderedDict()
+        self.recent_prefix_capacity = recent_prefix_capacity
+
+    def record_prefix(self, key: str):
+        if key in self.recent_prefixes:
+            self.prefix_hits += 1
+            self.recent_prefixes.move_to_end(key)
+            return
+        self.prefix_misses += 1
+        self.recent_prefixes[key] = None
+        if len(self.recent_prefixes) > self.recent_prefix_capacity:
+            self.recent_prefixes.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        routed = self.prefix_hits + self.prefix_misses
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "inflight": self.inflight,
+            "total_requests": self.total_requests,
+            "failed_requests": self.failed_requests,
+            "prefix_hits": self.prefix_hits,
+            "prefix_misses": self.prefix_misses,
+            "prefix_hit_rate": self.prefix_hits / routed if routed else 0.0,
+            "fallback_routes": self.fallback_routes,
+            "tracked_prefixes": len(self.recent_prefixes),
+        }
+
+
+class RoutingPolicy:
+    """路由策略基类"""
+
+    name = "base"
+
+    def select(self, backends: List[Backend], body: Optional[Dict[str, Any]]) -> Backend:
+        raise NotImplementedError
+
+
+class RoundRobinPolicy(RoutingPolicy):
+    """轮询"""
+
+    name = "round_robin"
+
+    def __init__(self):
+        self._counter = itertools.count()
+
+    def select(self, backends, body):
+        return backends[next(self._counter) % len(backends)]
+
+
+class LeastLoadPolicy(RoutingPolicy):
+    """选择在途请求最少的副本"""
+
+    name = "least_load"
+
+    def select(self, backends, body):
+        return min(backends, key=lambda b: b.inflight)
+
+
+def _content_text(content: Any) -> str:
+    if isinstance(content, str):
+        return content
+    return json.dumps(content, ensure_ascii=False, sort_keys=True)
+
+
+def prefix_key(body: Optional[Dict[str, Any]], prefix_chars: int) -> Optional[str]:
+    """提取请求的共享前缀
+
+    chat 请求取全部系统提示词；没有系统提示词时取首条消息 (多轮对话中保持不变)。
+    completions / 原生 /generate 请求取 prompt/text 的开头。
+    """
+    if not body:
+        return None
+    messages = body.get("messages")
+    if isinstance(messages, list) and messages:
+        system = [m for m in messages if isinstance(m, dict) and m.get("role") == "system"]
+        head = system or messages[:1]
+        text = "".join(f"<|{m.get('role')}|>{_content_text(m.get('content'))}"
+                       for m in head if isinstance(m, dict))
+    else:
+        prompt = body.get("prompt", body.get("text"))
+        if prompt is None:
+            return None
+        text = prompt if isinstance(prompt, str) else _content_text(prompt)
+    return text[:prefix_chars] if text else None
+
+
+class PrefixAffinityPolicy(RoutingPolicy):
+    """前缀亲和 + 负载回退
+
+    使用最高随机权重 (rendezvous) 哈希为每个前缀确定副本优先级，副本增减时只迁移少量前缀。
+    首选副本的在途请求数比最空闲副本多出 max_imbalance 以上时，按优先级顺延到负载可接受的副本。
+    """
+
+    name = "prefix"
+
+    def __init__(self, prefix_chars: int = 4096, max_imbalance: int = 16):
+        self.prefix_chars = prefix_chars
+        self.max_imbalance = max_imbalance
+        self._fallback = LeastLoadPolicy()
+
+    @staticmethod
+    def _score(key: str, backend: Backend) -> int:
+        digest = hashlib.blake2b(f"{backend.url}|{key}".encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, "big")
+
+    def select(self, backends, body):
+        key = prefix_key(body, self.prefix_chars)
+        if key is None:
+            return self._fallback.select(backends, body)
+
+        ranked = sorted(backends, key=lambda b: self._score(key, b), reverse=True)
+        least = min(b.inflight for b in backends)
+        chosen = next((b for b in ranked if b.inflight - least <= self.max_imbalance), None)
+        if chosen is None:
+            chosen = self._fallback.select(backends, body)
+        if chosen is not ranked[0]:
+            ranked[0].fallback_routes += 1
+        chosen.record_prefix(key)
+        return chosen
+
+
+POLICIES = {
+    RoundRobinPolicy.name: RoundRobinPolicy,
+    LeastLoadPolicy.name: LeastLoadPolicy,
+    PrefixAffinityPolicy.name: PrefixAffinityPolicy,
+}
+
+
+def create_policy(name: str, prefix_chars: int = 4096, max_imbalance: int = 16) -> RoutingPolicy:
+    if name == PrefixAffinityPolicy.name:
+        return PrefixAffinityPolicy(prefix_chars, max_imbalance)
+    return POLICIES[name]()
+
+
+class Router:
+    """透传代理 - 所有路径原样转发到选中的后端"""
+
+    def __init__(self, backend_urls: List[str], policy: RoutingPolicy,
+                 health_interval: float = 5.0, request_timeout: float = 600, http2: bool = False,
+                 recorder: Optional[TraceRecorder] = None):
+        self.backends = [Backend(url) for url in backend_urls]
+        # 已移出路由但仍有在途请求的后端，排空后丢弃
+        self.draining: List[Backend] = []
+        self.policy = policy
+        self.health_interval = health_interval
+        self.transport = AsyncTransport(pool_size=0, timeout=request_timeout, http2=http2)
+        self.recorder = recorder
+        self._health_task: Optional[asyncio.Task] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self.start_time = time.time()
+
+    def healthy_backends(self) -> List[Backend]:
+        healthy = [b for b in self.backends if b.healthy]
+        # 全部标记为不健康时仍尝试转发，避免健康检查误判导致整体不可用
+        return healthy or self.backends
+
+    def select_backend(self, body: Optional[Dict[str, Any]]) -> Optional[Backend]:
+        backends = self.healthy_backends()
+        return self.policy.select(backends, body) if backends else None
+
+    def set_backends(self, backend_urls: List[str]):
+        """原子替换后端列表；被移除的后端继续完成在途请求 (蓝绿切换)"""
+        current = {b.url: b for b in self.backends + self.draining}
+        new_backends = [current.get(url.rstrip("/")) or Backend(url) for url in backend_urls]
+        kept = {b.url for b in new_backends}
+        self.draining = [b for b in current.values() if b.url not in kept and b.inflight > 0]
+        self.backends = new_backends
+
+    async def on_startup(self, app: web.Application):
+        await self.transport.start()
+        self._health_task = asyncio.create_task(self.health_loop())
+        if self.recorder is not None:
+            self._flush_task = asyncio.create_task(self.recorder.flush_loop())
+
+    async def on_cleanup(self, app: web.Application):
+        if self._health_task:
+            self._health_task.cancel()
+        if self._flush_task:
+            self._flush_task.cancel()
+        await self.transport.close()
+        if self.recorder is not None:
+            self.recorder.close()
+
+    async def health_loop(self):
+        """定期探测后端 /health"""
+        while True:
+            for backend in self.backends:
+                try:
+                    async with self.transport.get(f"{backend.url}/health", timeout=5) as response:
+                        backend.healthy = response.status == 200
+                except TRANSPORT_ERRORS:
+                    backend.healthy = False
+            # 有副本不健康 (例如仍在加载权重) 时加快探测，恢复后尽快接流量
+            all_healthy = all(b.healthy for b in self.backends)
+            await asyncio.sleep(self.health_interval if all_healthy else min(self.health_interval, 1.0))
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        if any(b.healthy for b in self.backends):
+            return web.Response(text="OK")
+        return web.Response(status=503, text="no healthy backend")
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats())
+
+    def stats(self) -> Dict[str, Any]:
+        self.draining = [b for b in self.draining if b.inflight > 0]
+        return {
+            "policy": self.policy.name,
+            "uptime_s": time.time() - self.start_time,
+            "backends": [b.stats() for b in self.backends],
+            "draining": [b.stats() for b in self.draining],
+        }
+
+    async def handle_set_backends(self, request: web.Request) -> web.Response:
+        """管理接口: 替换后端列表，只接受本机请求"""
+        if not ipaddress.ip_address(request.remote or "0.0.0.0").is_loopback:
+            return web.json_response({"error": "管理接口只允许本机访问"}, status=403)
+        try:
+            body = await request.json()
+            backend_urls = body["backends"]
+        except (ValueError, KeyError, TypeError):
+            backend_urls = None
+        # 字符串会被逐字符当作后端地址，必须是字符串列表
+        if not isinstance(backend_urls, list) or not all(isinstance(url, str) and url for url in backend_urls):
+            return web.json_response({"error": "请求体格式: {\"backends\": [url, ...]}"}, status=400)
+        self.set_backends(backend_urls)
+        print(f"后端切换为: {', '.join(backend_urls) or '(无)'}")
+        return web.json_response(self.stats())
+
+    async def handle_proxy(self, request: web.Request) -> web.StreamResponse:
+        raw_body = await request.read()
+        body = None
+        if raw_body and request.content_type == "application/json":
+            try:
+                body = await request.json()
+            except ValueError:
+                body = None
+
+        backend = self.select_backend(body if isinstance(body, dict) else None)
+        if backend is None:
+            return web.json_response({"error": "没有可用的后端"}, status=503)
+        headers = {k: v for k, v in request.headers.items() if k.lower() not in HOP_BY_HOP_HEADERS}
+        url = f"{backend.url}{request.rel_url}"
+        tap = None
+        if self.recorder is not None and request.method == "POST":
+            tap = self.recorder.open_request(request.path, body,
+                                             prefix_key(body if isinstance(body, dict) else None, PREFIX_CHARS))
+            if tap is not None:
+                raw_body = tap.forward_body(raw_body)
+
+        backend.inflight += 1
+        backend.total_requests += 1
+        response = None
+        try:
+            async with self.transport.request(request.method, url, data=raw_body or None,
+                                              headers=headers) as upstream:
+                response_headers = {k: v for k, v in upstream.headers.items()
+                                    if k.lower() not in HOP_BY_HOP_HEADERS}
+                if upstream.status >= 500:
+                    backend.failed_requests += 1
+                if upstream.content_type != "text/event-stream":
+                    content = await upstream.read()
+                    if tap is not None:
+                        tap.finish(upstream.status, content)
+                    return web.Response(status=upstream.status, body=content, headers=response_headers)
+                # 流式响应逐块转发，不做缓冲
+                response = web.StreamResponse(status=upstream.status, headers=response_headers)
+                await response.prepare(request)
+                async for chunk in upstream.aiter_bytes():
+                    if tap is not None:
+                        chunk = tap.feed(chunk)
+                    if chunk:
+                        await response.write(chunk)
+                if tap is not None and tap.strip_usage:
+                    await response.write(tap.tail())
+                await response.write_eof()
+                if tap is not None:
+                    tap.finish(upstream.status)
+                return response
+        except ConnectionResetError:
+            # 客户端提前断开，关闭上游连接即可让后端中止生成
+            if tap is not None:
+                tap.finish(499)
+            return response
+        except TRANSPORT_ERRORS as e:
+            backend.failed_requests += 1
+            if tap is not None:
+                tap.finish(502)
+            if response is not None:
+                return response
+            backend.healthy = False
+            return web.json_response({"error": f"后端 {backend.url} 请求失败: {e}"}, status=502)
+        finally:
+            backend.inflight -= 1
+
+    def create_app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.on_startup.append(self.on_startup)
+        app.on_cleanup.append(self.on_cleanup)
+        app.router.add_get("/health", self.handle_health)
+        app.router.add_get("/router/stats", self.handle_stats)
+        app.router.add_post("/router/backends", self.handle_set_backends)
+        app.router.add_route("*", "/{path:.*}", self.handle_proxy)
+        return app
+
+
+def create_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="SGLang 多副本路由 - OpenAI 兼容透传代理")
+    parser.add_argument("--backends", nargs="*", default=[],
+                        help="后端地址列表，例如 http://127.0.0.1:30001 http://127.0.0.1:30002 "
+                             "(可为空，之后由本机通过 POST /router/backends 设置)")
+    parser.add_argument("--host", default="0.0.0.0", help="监听地址")
+    parser.add_argument("--port", default=30000, type=int, help="监听端口")
+    parser.add_argument("--policy", choices=sorted(POLICIES), default=PrefixAffinityPolicy.name,
+                        help="路由策略")
+    parser.add_argument("--prefix-chars", type=int, default=4096,
+                        help="prefix 策略参与哈希的前缀字符数")
+    parser.add_argument("--max-imbalance", type=int, default=16,
+                        help="prefix 策略允许首选副本比最空闲副本多出的在途请求数")
+    parser.add_argument("--health-interval", type=float, default=5.0, help="健康检查间隔(秒)")
+    parser.add_argument("--request-timeout", type=float, default=600, help="转发超时时间(秒)")
+    parser.add_argument("--http2", action="store_true",
+                        help="以 HTTP/2 连接后端 (后端前需有支持 h2 的代理，需要 httpx[http2])")
+    parser.add_argument("--record-trace",
+                        help="把生成请求的到达时间、token 数、采样参数和时延追加到轨迹文件 (.gz 结尾时压缩)")
+    parser.add_argument("--record-bodies", action="store_true",
+                        help="轨迹中同时保存完整请求体 (用于精确回放与 radix_sim.py，注意数据敏感性)")
+    return parser
+
+
+def main():
+    args = create_parser().parse_args()
+    policy = create_policy(args.policy, args.prefix_chars, args.max_imbalance)
+    recorder = TraceRecorder(args.record_trace, args.record_bodies) if args.record_trace else None
+    router = Router(args.backends, policy,
+                    health_interval=args.health_interval, request_timeout=args.request_timeout,
+                    http2=args.http2, recorder=recorder)
+    print(f"路由启动: http://{args.host}:{args.port} -> {', '.join(args.backends) or '(无)'} (策略: {args.policy})")
+    web.run_app(router.create_app(), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,596 @@
+#!/usr/bin/env python3
+"""
+调度离散事件模拟
+按负载轨迹 (到达时间、prompt/输出长度、共享前缀) 和简单的 prefill/decode 步耗时模型，
+模拟 SGLang 连续批处理在不同 schedule_policy、chunked_prefill_size、max_running_requests 下的行为，
+预测吞吐、TTFT 与排队时延；在笔记本上即可运行，用来缩小 autotune.py 的搜索空间
+"""
+
+import argparse
+import json
+import random
+import sys
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, fields
+from typing import Any, Dict, List, Optional, Tuple
+
+import yaml
+
+from autotune import DEFAULT_OBJECTIVES, generate_candidates, pareto_front
+from benchmark import RequestResult, percentile, summarize_results
+from radix_sim import RadixTree, Tokenizer, load_plan, request_max_tokens, tokenize_request
+
+POLICIES = ["lpm", "fcfs", "dfs-weight", "lof", "random"]
+# SGLang 等待队列超过该长度时 lpm / dfs-weight 退化为 fcfs，避免前缀匹配开销
+LPM_QUEUE_LIMIT = 128
+# 估算输出 KV 占用时 max_tokens 的截断值与初始 new_token_ratio
+CLIP_MAX_NEW_TOKENS = 4096
+INIT_NEW_TOKEN_RATIO = 0.7
+
+
+@dataclass
+class CostModel:
+    """单步耗时模型 (毫秒)，默认值大致对应单张 A100 上的 Qwen3-14B BF16
+
+    prefill: base + per_token * 新 token 数 + attention * Σ(新 token 数 x 平均上下文长度)
+    decode:  base + per_seq * 批大小 + per_kv_token * 批内上下文 token 总数
+    """
+    prefill_base_ms: float = 5.0
+    prefill_per_token_ms: float = 0.14
+    prefill_attention_ms: float = 4e-6
+    decode_base_ms: float = 19.0
+    decode_per_seq_ms: float = 0.05
+    decode_per_kv_token_ms: float = 1.1e-4
+
+    def prefill_ms(self, chunks: List[Tuple[int, int]]) -> float:
+        """chunks: (新 token 数, 已有上下文长度)"""
+        new_tokens = sum(n for n, _ in chunks)
+        attention = sum(n * (start + n / 2) for n, start in chunks)
+        return self.prefill_base_ms + self.prefill_per_token_ms * new_tokens + self.prefill_attention_ms * attention
+
+    def decode_ms(self, batch_size: int, kv_tokens: int) -> float:
+        return self.decode_base_ms + self.decode_per_seq_ms * batch_size + self.decode_per_kv_token_ms * kv_tokens
+
+
+def load_cost_model(path: Optional[str], overrides: List[str]) -> CostModel:
+    """从 YAML/JSON 文件加载，再用 key=value 覆盖"""
+    values: Dict[str, Any] = {}
+    if path:
+        with open(path, 'r', encoding='utf-8') as f:
+            values.update(yaml.safe_load(f) or {})
+    for item in overrides:
+        key, _, value = item.partition("=")
+        values[key.strip()] = value
+    names = {f.name for f in fields(CostModel)}
+    unknown = sorted(set(values) - names)
+    if unknown:
+        raise ValueError(f"未知的耗时模型参数: {', '.join(unknown)} (可选: {', '.join(sorted(names))})")
+    return CostModel(**{k: float(v) for k, v in values.items()})
+
+
+@dataclass
+class TraceRequest:
+    arrival: float
+    tokens: array
+    max_tokens: int
+    output_len: int
+
+
+class SyntheticPrompts:
+    """按 prefix_id / prefix_len / prompt_len 生成 token: 同一 prefix_id 共享前缀，其余 token 各不相同"""
+
+    UNIQUE_BASE = 1 << 31
+
+    def __init__(self):
+        self.prefix_base: Dict[Any, int] = {}
+        self.next_prefix_base = 1
+        self.next_unique = self.UNIQUE_BASE
+
+    def tokens(self, prompt_len: int, prefix_id: Any = None, prefix_len: int = 0) -> array:
+        tokens = array('I')
+        if prefix_id is not None and prefix_len > 0:
+            prefix_len = min(prefix_len, prompt_len)
+            if prefix_id not in self.prefix_base:
+                self.prefix_base[prefix_id] = self.next_prefix_base
+                self.next_prefix_base += prefix_len
+            base = self.prefix_base[prefix_id]
+            tokens.extend(range(base, base + prefix_len))
+        unique = prompt_len - len(tokens)
+        tokens.extend(range(self.next_unique, self.next_unique + unique))
+        self.next_unique += unique
+        return tokens
+
+
+def load_trace(path: str, tokenizer: Tokenizer, default_max_tokens: int, request_rate: float,
+               time_scale: float, seed: int, max_requests: Optional[int] = None) -> List[TraceRequest]:
+    """读取负载轨迹
+
+    每行可以是 radix_sim.py 支持的请求格式 (messages / prompt / text / input_ids)，
+    也可以只给出长度: {"prompt_len": 1200, "prefix_id": "sys-a", "prefix_len": 800, "output_len": 300}；
+    arrival_time (秒) 缺失时按 --request-rate 生成泊松到达
+    """
+    synthetic = SyntheticPrompts()
+    rng = random.Random(seed)
+    trace: List[TraceRequest] = []
+    clock = 0.0
+    skipped = 0
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            if "prompt_len" in item:
+                tokens = synthetic.tokens(int(item["prompt_len"]), item.get("prefix_id"),
+                                          int(item.get("prefix_len", 0)))
+            else:
+                tokens = array('I', tokenize_request(item, tokenizer))
+            if not tokens:
+                # 例如录制时后端未返回 prompt_tokens 的轨迹行
+                skipped += 1
+                continue
+            max_tokens = request_max_tokens(item, default_max_tokens)
+            output_len = int(item.get("output_len") or item.get("output_tokens") or max_tokens)
+            arrival = item.get("arrival_time", item.get("timestamp"))
+            if arrival is None:
+                clock += rng.expovariate(request_rate) if request_rate != float("inf") else 0.0
+                arrival = clock
+            trace.append(TraceRequest(float(arrival), tokens, max_tokens, max(min(output_len, max_tokens), 1)))
+            if max_requests and len(trace) >= max_requests:
+                break
+    if skipped:
+        print(f"警告: 跳过 {skipped} 行没有 prompt 的请求")
+    if trace:
+        start = min(r.arrival for r in trace)
+        for r in trace:
+            r.arrival = (r.arrival - start) / time_scale
+    trace.sort(key=lambda r: r.arrival)
+    return trace
+
+
+class SimRequest:
+    __slots__ = ("index", "trace", "cached", "prefilled", "generated", "node", "admit_time",
+                 "first_token_time", "finish_time", "first_cached")
+
+    def __init__(self, index: int, trace: TraceRequest):
+        self.index = index
+        self.trace = trace
+        self.cached = 0  # 本次调度命中的前缀长度
+        self.prefilled = 0  # 已计算 KV 的位置 (含命中前缀)
+        self.generated = 0
+        self.node = 0  # 在基数树中锁定的节点
+        self.admit_time: Optional[float] = None
+        self.first_token_time: Optional[float] = None
+        self.finish_time: Optional[float] = None
+        self.first_cached = 0
+
+    @property
+    def context_len(self) -> int:
+        """需要 KV 的长度: prompt + 被撤回前已生成的 token (重新调度时一起重算)"""
+        return len(self.trace.tokens) + (self.generated if self.first_token_time is not None else 0)
+
+    def reserved_output(self, ratio: float) -> float:
+        return (min(self.trace.max_tokens, CLIP_MAX_NEW_TOKENS) - self.generated) * ratio
+
+
+class SchedulerSimulator:
+    """连续批处理模拟
+
+    每一步先尝试组 prefill 批 (含未完成的分块请求)，没有可调度的 prefill 时执行 decode；
+    KV 池由基数树 (prompt，运行中请求的前缀被锁定) 和运行中请求的输出 token 共享，
+    decode 时 KV 不足会撤回最晚调度的请求。未开启 mixed chunk 时 prefill 步会阻塞 decode。
+    """
+
+    def __init__(self, trace: List[TraceRequest], policy: str, chunked_prefill_size: int,
+                 max_running_requests: int, kv_tokens: int, cost: CostModel,
+                 max_prefill_tokens: int = 16384, schedule_conservativeness: float = 1.0,
+                 enable_mixed_chunk: bool = False, seed: int = 0):
+        self.requests = [SimRequest(i, r) for i, r in enumerate(trace)]
+        self.policy = policy
+        self.chunked_prefill_size = chunked_prefill_size
+        self.max_running_requests = max_running_requests
+        self.kv_tokens = kv_tokens
+        self.cost = cost
+        self.max_prefill_tokens = max_prefill_tokens
+        self.new_token_ratio = min(INIT_NEW_TOKEN_RATIO * schedule_conservativeness, 1.0)
+        self.enable_mixed_chunk = enable_mixed_chunk
+        self.rng = random.Random(seed)
+
+        self.tree = RadixTree(kv_tokens)
+        self.pending = deque(self.requests)
+        self.waiting: List[SimRequest] = []
+        self.running: List[SimRequest] = []
+        self.chunked: Optional[SimRequest] = None
+        self.match_cache: Dict[int, Tuple[int, int, int]] = {}
+        self.failed: List[SimRequest] = []
+        self.now = 0.0
+        self.clock = 0  # 基数树的逻辑时钟
+        self.stats = {"prefill_steps": 0, "decode_steps": 0, "decode_batch_sum": 0,
+                      "prefill_tokens": 0, "retractions": 0}
+
+    # ---------- KV 记账 ----------
+
+    def output_tokens_in_use(self) -> int:
+        return sum(r.generated for r in self.running)
+
+    def chunk_tokens_in_use(self) -> int:
+        return self.chunked.prefilled - self.chunked.cached if self.chunked else 0
+
+    def free_for_admission(self) -> float:
+        """可用于新请求的 KV: 总量 - 锁定前缀 - 输出 token - 运行中请求预留的后续输出"""
+        reserved = sum(r.reserved_output(self.new_token_ratio) for r in self.running)
+        return (self.kv_tokens - self.tree.protected_size - self.output_tokens_in_use()
+                - self.chunk_tokens_in_use() - reserved)
+
+    def fit_tree(self):
+        self.tree.evict_to(max(self.kv_tokens - self.output_tokens_in_use() - self.chunk_tokens_in_use(), 0))
+
+    # ---------- 调度 ----------
+
+    def match(self, req: SimRequest) -> Tuple[int, int]:
+        """前缀匹配结果按基数树版本缓存，树结构不变时不重复匹配"""
+        cached = self.match_cache.get(req.index)
+        if cached is None or cached[0] != self.tree.version:
+            hit, node = self.tree.match_prefix(req.trace.tokens)
+            cached = self.match_cache[req.index] = (self.tree.version, min(hit, req.context_len - 1), node)
+        return cached[1], cached[2]
+
+    def order_waiting(self) -> List[SimRequest]:
+        policy = self.policy
+        if policy in ("lpm", "dfs-weight") and len(self.waiting) > LPM_QUEUE_LIMIT:
+            policy = "fcfs"
+        if policy == "fcfs":
+            return list(self.waiting)
+        if policy == "lof":
+            return sorted(self.waiting, key=lambda r: -r.trace.max_tokens)
+        if policy == "random":
+            order = list(self.waiting)
+            self.rng.shuffle(order)
+            return order
+        matches = {r.index: self.match(r) for r in self.waiting}
+        if policy == "lpm":
+            return sorted(self.waiting, key=lambda r: -matches[r.index][0])
+        return self.dfs_weight_order(matches)
+
+    def dfs_weight_order(self, matches: Dict[int, Tuple[int, int]]) -> List[SimRequest]:
+        """按子树内等待请求数从大到小深度优先遍历，让共享前缀的请求连续调度"""
+        reqs_at: Dict[int, List[SimRequest]] = {}
+        weight: Dict[int, int] = {}
+        for req in self.waiting:
+            node = matches[req.index][1]
+            reqs_at.setdefault(node, []).append(req)
+            while True:
+                weight[node] = weight.get(node, 0) + 1
+                if node == 0:
+                    break
+                node = self.tree.parent[node]
+        order: List[SimRequest] = []
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            order.extend(reqs_at.get(node, []))
+            children = [c for c in (self.tree.children[node] or {}).values() if c in weight]
+            stack.extend(sorted(children, key=lambda c: weight[c]))
+        return order
+
+    def get_prefill_batch(self) -> List[Tuple[SimRequest, int]]:
+        """返回 (请求, 本步计算的新 token 数)"""
+        chunk_limit = self.chunked_prefill_size if self.chunked_prefill_size > 0 else None
+        budget = chunk_limit or self.max_prefill_tokens
+        batch: List[Tuple[SimRequest, int]] = []
+        if self.chunked is not None:
+            req = self.chunked
+            n = min(req.context_len - req.prefilled, budget)
+            batch.append((req, n))
+            budget -= n
+            if req.prefilled + n < req.context_len:
+                return batch
+            self.chunked = None
+
+        slots = self.max_running_requests - len(self.running) - len(batch)
+        if not self.waiting or slots <= 0 or budget <= 0:
+            return batch
+        available = self.free_for_admission()
+        for req in self.order_waiting():
+            if slots <= 0 or budget <= 0:
+                break
+            cached, node = self.match(req)
+            new_tokens = req.context_len - cached
+            need = new_tokens + req.reserved_output(self.new_token_ratio)
+            if need > available:
+                break
+            if new_tokens > budget and (batch or chunk_limit):
+                if not chunk_limit:
+                    break
+                # 分块: 本步只计算 budget 个 token，剩余部分在后续步骤继续
+                self.chunked = req
+            self.waiting.remove(req)
+            self.match_cache.pop(req.index, None)
+            req.cached = req.prefilled = cached
+            req.node = node
+            self.tree.inc_lock_ref(node)
+            if req.admit_time is None:
+                req.admit_time = self.now
+                req.first_cached = cached
+            n = min(new_tokens, budget)
+            batch.append((req, n))
+            budget -= n
+            available -= need
+            slots -= 1
+            if self.chunked is req:
+                break
+        return batch
+
+    def finish_prefill(self, batch: List[Tuple[SimRequest, int]]):
+        for req, n in batch:
+            req.prefilled += n
+            self.stats["prefill_tokens"] += n
+            if req.prefilled < req.context_len:
+                continue
+            self.clock += 1
+            # 先锁定新节点再逐出，避免刚插入的前缀被自己挤掉
+            _, node = self.tree.insert_node(req.trace.tokens, self.clock, evict=False)
+            self.tree.inc_lock_ref(node)
+            self.tree.dec_lock_ref(req.node)
+            req.node = node
+            self.fit_tree()
+            if req.first_token_time is None:
+                req.first_token_time = self.now
+                req.generated = 1
+            if req.generated >= req.trace.output_len:
+                self.finish(req)
+            else:
+                self.running.append(req)
+
+    def finish(self, req: SimRequest):
+        req.finish_time = self.now
+        self.tree.dec_lock_ref(req.node)
+
+    def retract(self):
+        """KV 不足: 撤回最晚调度的请求，放回等待队列头部，之后连同已生成的 token 重新 prefill"""
+        req = max(self.running, key=lambda r: r.admit_time)
+        self.running.remove(req)
+        self.tree.dec_lock_ref(req.node)
+        req.prefilled = req.cached = 0
+        self.waiting.insert(0, req)
+        self.stats["retractions"] += 1
+
+    def decode(self, steps: int):
+        for req in self.running:
+            req.generated += steps
+        finished = [r for r in self.running if r.generated >= r.trace.output_len]
+        if finished:
+            self.running = [r for r in self.running if r.generated < r.trace.output_len]
+            for req in finished:
+                self.finish(req)
+        self.stats["decode_steps"] += steps
+
+    def decode_steps(self) -> int:
+        """连续 decode 直到有请求完成、新请求到达或 KV 用尽，返回步数 (时间已推进)"""
+        while len(self.running) > 1:
+            self.fit_tree()
+            if self.tree.size + self.output_tokens_in_use() + len(self.running) <= self.kv_tokens:
+                break
+            self.retract()
+        batch = len(self.running)
+        free = self.kv_tokens - self.tree.protected_size - self.output_tokens_in_use()
+        max_steps = max(min(min(r.trace.output_len - r.generated for r in self.running), free // batch), 1)
+        kv = sum(len(r.trace.tokens) + r.generated for r in self.running)
+        can_admit = batch < self.max_running_requests
+        steps = 0
+        while steps < max_steps:
+            self.now += self.cost.decode_ms(batch, kv + steps * batch) / 1000
+            steps += 1
+            if can_admit and self.pending and self.pending[0].trace.arrival <= self.now:
+                break
+        self.stats["decode_batch_sum"] += batch * steps
+        return steps
+
+    def run(self) -> Dict[str, Any]:
+        while self.pending or self.waiting or self.running or self.chunked:
+            while self.pending and self.pending[0].trace.arrival <= self.now:
+                self.waiting.append(self.pending.popleft())
+            batch = self.get_prefill_batch()
+            if batch:
+                step_ms = self.cost.prefill_ms([(n, req.prefilled) for req, n in batch])
+                decoding = self.enable_mixed_chunk and bool(self.running)
+                if decoding:
+                    kv = sum(len(r.trace.tokens) + r.generated for r in self.running)
+                    step_ms += self.cost.decode_ms(len(self.running), kv) - self.cost.decode_base_ms
+                    self.stats["decode_batch_sum"] += len(self.running)
+                self.now += step_ms / 1000
+                self.stats["prefill_steps"] += 1
+                if decoding:
+                    self.decode(1)
+                self.finish_prefill(batch)
+            elif self.running:
+                self.decode(self.decode_steps())
+            elif self.pending:
+                self.now = max(self.now, self.pending[0].trace.arrival)
+            else:
+                # 单个请求就超过 KV 容量，无法调度
+                self.failed.append(self.waiting.pop(0))
+        return self.summarize()
+
+    def summarize(self) -> Dict[str, Any]:
+        results = []
+        queue_ms = []
+        for req in self.requests:
+            ok = req.finish_time is not None
+            results.append(RequestResult(
+                success=ok,
+                ttft=(req.first_token_time - req.trace.arrival) if ok else 0.0,
+                latency=(req.finish_time - req.trace.arrival) if ok else 0.0,
+                prompt_tokens=len(req.trace.tokens),
+                output_tokens=req.trace.output_len if ok else 0,
+            ))
+            if ok:
+                queue_ms.append((req.admit_time - req.trace.arrival) * 1000)
+        start = self.requests[0].trace.arrival if self.requests else 0.0
+        metrics = summarize_results(results, self.now - start)
+        for key in [k for k in metrics if "_itl_" in k]:
+            del metrics[key]
+        queue_ms.sort()
+        prompt_tokens = sum(len(r.trace.tokens) for r in self.requests)
+        metrics.update({
+            "mean_queue_ms": sum(queue_ms) / len(queue_ms) if queue_ms else 0.0,
+            "p99_queue_ms": percentile(queue_ms, 99),
+            "cache_hit_rate": sum(r.first_cached for r in self.requests) / prompt_tokens if prompt_tokens else 0.0,
+            "mean_decode_batch": (self.stats["decode_batch_sum"] / self.stats["decode_steps"]
+                                  if self.stats["decode_steps"] else 0.0),
+            **self.stats,
+        })
+        return metrics
+
+
+# 并行模拟时由 fork 出的子进程直接继承，避免序列化整份轨迹
+_SHARED_TRACE: List[TraceRequest] = []
+
+
+def simulate_candidate(candidate: Dict[str, Any], settings: Dict[str, Any]) -> Dict[str, Any]:
+    simulator = SchedulerSimulator(
+        _SHARED_TRACE,
+        policy=candidate["schedule_policy"],
+        chunked_prefill_size=candidate["chunked_prefill_size"],
+        max_running_requests=candidate["max_running_requests"],
+        kv_tokens=settings["kv_tokens"],
+        cost=CostModel(**settings["cost"]),
+        max_prefill_tokens=settings["max_prefill_tokens"],
+        schedule_conservativeness=settings["schedule_conservativeness"],
+        enable_mixed_chunk=settings["enable_mixed_chunk"],
+        seed=settings["seed"],
+    )
+    return {"params": candidate, "metrics": simulator.run(), "status": "ok"}
+
+
+def simulate_all(trace: List[TraceRequest], candidates: List[Dict[str, Any]], settings: Dict[str, Any],
+                 workers: int) -> List[Dict[str, Any]]:
+    global _SHARED_TRACE
+    _SHARED_TRACE = trace
+    if workers <= 1 or len(candidates) <= 1:
+        return [simulate_candidate(c, settings) for c in candidates]
+    import multiprocessing
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("fork")) as pool:
+        return list(pool.map(simulate_candidate, candidates, [settings] * len(candidates)))
+
+
+def print_results(trials: List[Dict[str, Any]], front: List[Dict[str, Any]]):
+    front_ids = {id(t) for t in front}
+    print("\n" + "=" * 112)
+    print(f"{'策略':<12}{'chunk':>7}{'running':>9}{'吞吐tok/s':>11}{'req/s':>8}{'p50 TTFT':>10}{'p99 TTFT':>10}"
+          f"{'p99 TPOT':>10}{'平均排队':>10}{'命中率':>8}{'撤回':>6}{'批大小':>8}")
+    print("=" * 112)
+    for trial in sorted(trials, key=lambda t: -t["metrics"]["output_throughput"]):
+        p, m = trial["params"], trial["metrics"]
+        mark = " *" if id(trial) in front_ids else ""
+        print(f"{p['schedule_policy']:<12}{p['chunked_prefill_size']:>7}{p['max_running_requests']:>9}"
+              f"{m['output_throughput']:>11.1f}{m['request_throughput']:>8.2f}{m['p50_ttft_ms']:>10.0f}"
+              f"{m['p99_ttft_ms']:>10.0f}{m['p99_tpot_ms']:>10.1f}{m['mean_queue_ms']:>10.0f}"
+              f"{m['cache_hit_rate']:>8.1%}{m['retractions']:>6}{m['mean_decode_batch']:>8.1f}{mark}")
+    print("=" * 112)
+    print("* 帕累托最优 (吞吐 / p99 TTFT / p99 TPOT)；时延单位 ms")
+
+
+def suggest_sweep(front: List[Dict[str, Any]]):
+    """把帕累托解转换为 autotune.py 的扫描参数，只在真机上验证这些候选"""
+    chunks = sorted({t["params"]["chunked_prefill_size"] for t in front})
+    running = sorted({t["params"]["max_running_requests"] for t in front})
+    policies = sorted({t["params"]["schedule_policy"] for t in front})
+    print(f"建议 schedule_policy: {', '.join(policies)}")
+    print("建议的 autotune.py 扫描参数:")
+    print(f"  --sweep-chunked-prefill-size {' '.join(map(str, chunks))} "
+          f"--sweep-max-running-requests {' '.join(map(str, running))}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="SGLang 调度离散事件模拟 - 比较 schedule_policy / chunked_prefill_size / max_running_requests",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+未识别的参数会原样传给 launch_server.py 的参数解析 (例如 --config, --preset, --model-path)，
+用于加载 tokenizer 并在未指定 --kv-tokens 时按容量规划估算 KV 池大小，例如:
+  python scheduler_sim.py --trace trace.jsonl --request-rate 4 --kv-tokens 200000 \\
+      --policies lpm fcfs dfs-weight --chunk-sizes 512 2048 8192 --max-running 16 32 64
+        """
+    )
+    parser.add_argument("--trace", "-t", required=True, help="负载轨迹 JSONL")
+    parser.add_argument("--policies", nargs="+", default=["lpm", "fcfs", "dfs-weight"], choices=POLICIES)
+    parser.add_argument("--chunk-sizes", nargs="+", type=int, default=[512, 1024, 2048, 4096],
+                        help="chunked_prefill_size 候选 (-1 表示不分块)")
+    parser.add_argument("--max-running", nargs="+", type=int, default=[16, 32, 64],
+                        help="max_running_requests 候选")
+    parser.add_argument("--kv-tokens", type=int, help="KV 池 token 数 (默认按当前配置的容量规划估算)")
+    parser.add_argument("--gpu-memory-gb", type=float, help="容量规划使用的单卡显存 GiB")
+    parser.add_argument("--max-prefill-tokens", type=int, default=16384, help="不分块时单个 prefill 批的 token 上限")
+    parser.add_argument("--schedule-conservativeness", type=float, default=1.0)
+    parser.add_argument("--enable-mixed-chunk", action="store_true", help="prefill 步同时执行 decode")
+    parser.add_argument("--cost-model", help="耗时模型 YAML/JSON (字段见 CostModel)")
+    parser.add_argument("--cost", action="append", default=[], metavar="KEY=VALUE",
+                        help="覆盖单个耗时模型参数，例如 --cost decode_base_ms=12")
+    parser.add_argument("--request-rate", type=float, default=float("inf"),
+                        help="轨迹没有 arrival_time 时的泊松到达率 (req/s)，默认同时到达")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="到达时间压缩倍数 (2 表示负载加倍)")
+    parser.add_argument("--default-max-tokens", type=int, default=512, help="请求未指定 max_tokens 时的值")
+    parser.add_argument("--approximate", action="store_true", help="不加载 tokenizer，按字节近似")
+    parser.add_argument("--bytes-per-token", type=int, default=3, choices=[1, 2, 3, 4])
+    parser.add_argument("--max-requests", type=int, help="只使用轨迹中的前 N 个请求")
+    parser.add_argument("--max-trials", type=int, help="候选组合超过该数量时随机抽样")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=1, help="并行模拟的进程数")
+    parser.add_argument("--output", "-o", help="结果写入 JSON 文件")
+    args, launcher_argv = parser.parse_known_args()
+
+    try:
+        cost = load_cost_model(args.cost_model, args.cost)
+    except (OSError, ValueError, TypeError) as e:
+        print(f"错误: 耗时模型无效: {e}")
+        sys.exit(1)
+
+    model_path, plan = load_plan(launcher_argv, args.gpu_memory_gb)
+    kv_tokens = args.kv_tokens or (plan.cacheable_tokens if plan is not None else None)
+    if not kv_tokens:
+        print("错误: 无法估算 KV 池大小，请使用 --kv-tokens 指定")
+        sys.exit(1)
+
+    tokenizer = Tokenizer(None if args.approximate else model_path, args.bytes_per_token)
+    try:
+        trace = load_trace(args.trace, tokenizer, args.default_max_tokens, args.request_rate,
+                           args.time_scale, args.seed, args.max_requests)
+    except (OSError, ValueError) as e:
+        print(f"错误: 无法读取负载轨迹: {e}")
+        sys.exit(1)
+    if not trace:
+        print("错误: 负载轨迹为空")
+        sys.exit(1)
+    print(f"已加载 {len(trace)} 个请求，跨度 {trace[-1].arrival:.1f}s，KV 池 {kv_tokens:,} token")
+
+    space = {
+        "schedule_policy": args.policies,
+        "chunked_prefill_size": args.chunk_sizes,
+        "max_running_requests": args.max_running,
+    }
+    candidates = generate_candidates(space, args.max_trials, args.seed)
+    settings = {
+        "kv_tokens": kv_tokens,
+        "cost": asdict(cost),
+        "max_prefill_tokens": args.max_prefill_tokens,
+        "schedule_conservativeness": args.schedule_conservativeness,
+        "enable_mixed_chunk": args.enable_mixed_chunk,
+        "seed": args.seed,
+    }
+    trials = simulate_all(trace, candidates, settings, args.workers)
+    front = pareto_front(trials, DEFAULT_OBJECTIVES)
+    print_results(trials, front)
+    suggest_sweep(front)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({"trace": args.trace, "kv_tokens": kv_tokens, "cost_model": asdict(cost),
+                       "trials": trials}, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
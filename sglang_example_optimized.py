@@ -4,10 +4,20 @@ SGLang 统一测试示例 - 最终优化版本
 整合 SGLang Python API 和 OpenAI SDK 的最佳实践
 """
 
+import asyncio
 import sglang as sgl
-import requests
-import json
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
+
+from http_transport import AsyncTransport, get_sync_transport, response_json
+from micro_batcher import MicroBatcher
+from radix_sim import render_chatml
+from response_cache import ResponseCache
+from streaming import StreamStats, aiter_sse_events, extract_delta_text, iter_sse_events
+from think_filter import contains_think_marker
+from thinking_budget import ThinkBudgetResult, astream_with_budget
+
+SERVER_URL = "http://localhost:30000"
+CHAT_COMPLETIONS_URL = f"{SERVER_URL}/v1/chat/completions"
 
 # OpenAI SDK 客户端配置
 openai_client = OpenAI(
@@ -15,6 +25,22 @@ openai_client = OpenAI(
     base_url="http://localhost:30000/v1",
 )
 
+# 异步客户端，供流式生成器使用
+async_openai_client = AsyncOpenAI(
+    api_key="EMPTY",
+    base_url="http://localhost:30000/v1",
+)
+
+# 禁用思考过程的推荐采样参数
+CLEAN_SAMPLING_PARAMS = {
+    "top_p": 0.8,
+    "presence_penalty": 1.5,
+}
+CLEAN_EXTRA_BODY = {
+    "top_k": 20,
+    "chat_template_kwargs": {"enable_thinking": False},  # 关键参数
+}
+
 def safe_get_content(response) -> str:
     """安全获取响应内容"""
     content = response.choices[0].message.content
@@ -27,77 +53,102 @@ def simple_qa(s, question):
     s += sgl.user(question)  # type: ignore
     s += sgl.assistant(sgl.gen("answer", temperature=0.7, top_p=0.8, presence_penalty=1.5, stop=["<think>", "</think>", "思考:", "用户:", "ASSISTANT:"]))
 
-def openai_chat_clean(messages, max_tokens=200):
-    """OpenAI SDK 清洁调用 - 使用 enable_thinking: False"""
-    try:
+def openai_chat_cached(messages, max_tokens, temperature, cache=None):
+    """OpenAI SDK 调用，可选经过响应缓存；失败结果不会被缓存"""
+    def create():
         response = openai_client.chat.completions.create(
             model="default",
             messages=messages,
             max_tokens=max_tokens,
-            temperature=0.7,
-            top_p=0.8,
-            presence_penalty=1.5,
-            extra_body={
-                "top_k": 20,
-                "chat_template_kwargs": {"enable_thinking": False},  # 关键参数
-            },
+            temperature=temperature,
+            extra_body=CLEAN_EXTRA_BODY,
+            **CLEAN_SAMPLING_PARAMS,
         )
         return safe_get_content(response)
+    
+    try:
+        if cache is None:
+            return create()
+        return cache.get_or_compute(clean_chat_payload(messages, max_tokens, temperature), create)
     except Exception as e:
         return f"Exception: {e}"
 
-def chat_api_clean(messages, max_tokens=200):
-    """传统 requests 调用 - 使用 enable_thinking: False"""
-    url = "http://localhost:30000/v1/chat/completions"
-    
+def openai_chat_clean(messages, max_tokens=200, cache=None):
+    """OpenAI SDK 清洁调用 - 使用 enable_thinking: False"""
+    return openai_chat_cached(messages, max_tokens, 0.7, cache)
+
+def clean_chat_payload(messages, max_tokens=200, temperature=0.7, stream=False):
+    """构造原始 HTTP 请求体 - extra_body 是 OpenAI SDK 的概念，直接请求时需展开到顶层"""
     payload = {
         "model": "default",
         "messages": messages,
         "max_tokens": max_tokens,
-        "temperature": 0.7,
-        "top_p": 0.8,
-        "presence_penalty": 1.5,
-        "extra_body": {
-            "top_k": 20,
-            "chat_template_kwargs": {
-                "enable_thinking": False  # 关键参数：禁用思考过程
-            }
-        }
+        "temperature": temperature,
+        **CLEAN_SAMPLING_PARAMS,
+        **CLEAN_EXTRA_BODY,
     }
+    if stream:
+        payload["stream"] = True
+        payload["stream_options"] = {"include_usage": True}
+    return payload
+
+def chat_api_clean(messages, max_tokens=200, cache=None):
+    """传统 requests 调用 (共享连接池) - 使用 enable_thinking: False"""
+    url = CHAT_COMPLETIONS_URL
+    payload = clean_chat_payload(messages, max_tokens)
+    
+    if cache is not None:
+        cached = cache.get(payload)
+        if cached is not None:
+            return cached
     
     try:
-        response = requests.post(url, json=payload, timeout=30)
+        response = get_sync_transport().post_json(url, payload, timeout=30)
         if response.status_code == 200:
-            result = response.json()
+            result = response_json(response)
             content = result["choices"][0]["message"]["content"]
-            return content if content is not None else ""
+            content = content if content is not None else ""
+            if cache is not None:
+                cache.put(payload, content)
+            return content
         else:
             return f"Error: {response.status_code}"
     except Exception as e:
         return f"Exception: {e}"
 
-def openai_structured_generation(topic):
-    """OpenAI SDK 结构化生成 - 推荐方式"""
+async def generate_api_batched(messages, batcher: MicroBatcher, max_tokens=200, temperature=0.7):
+    """原生 /generate 调用 - 并发调用经 MicroBatcher 合并为批量请求 (客户端套用模板，关闭思考)"""
+    sampling_params = {
+        "max_new_tokens": max_tokens,
+        "temperature": temperature,
+        **CLEAN_SAMPLING_PARAMS,
+        "top_k": CLEAN_EXTRA_BODY["top_k"],
+    }
     try:
-        response = openai_client.chat.completions.create(
-            model="default",
-            messages=[
-                {"role": "system", "content": "你是一个有用的助手，请按照指定格式提供信息，不要显示思考过程。"},
-                {"role": "user", "content": f"请简要介绍{topic}，包括定义和主要特点。请分别用'定义：'和'特点：'开头，每部分用一段话说明。"}
-            ],
-            max_tokens=300,
-            temperature=0.5,
-            top_p=0.8,
-            presence_penalty=1.5,
-            extra_body={
-                "top_k": 20,
-                "chat_template_kwargs": {"enable_thinking": False},
-            },
-        )
-        return safe_get_content(response)
+        output = await batcher.generate(text=render_chatml(messages, enable_thinking=False),
+                                        sampling_params=sampling_params)
+        return output.get("text") or ""
     except Exception as e:
         return f"Exception: {e}"
 
+def structured_messages(topic):
+    """结构化生成的对话消息"""
+    return [
+        {"role": "system", "content": "你是一个有用的助手，请按照指定格式提供信息，不要显示思考过程。"},
+        {"role": "user", "content": f"请简要介绍{topic}，包括定义和主要特点。请分别用'定义：'和'特点：'开头，每部分用一段话说明。"}
+    ]
+
+def code_messages(task):
+    """代码生成的对话消息"""
+    return [
+        {"role": "system", "content": "你是一个编程专家，请直接提供代码，不要显示思考过程和解释。请用 Python 编写。"},
+        {"role": "user", "content": f"请编写代码：{task}"}
+    ]
+
+def openai_structured_generation(topic, cache=None):
+    """OpenAI SDK 结构化生成 - 推荐方式"""
+    return openai_chat_cached(structured_messages(topic), 300, 0.5, cache)
+
 @sgl.function
 def structured_generation(s, topic):
     """结构化生成示例 - SGLang API（备选方案）"""
@@ -115,27 +166,147 @@ def creative_writing(s, prompt):
     s += sgl.user(prompt)  # type: ignore
     s += sgl.assistant(sgl.gen("content", temperature=0.8, top_p=0.9, presence_penalty=1.5, stop=["<think>", "</think>", "---", "END"]))
 
-def openai_code_generation(task):
+def openai_code_generation(task, cache=None):
     """OpenAI SDK 代码生成 - 推荐方式"""
+    return openai_chat_cached(code_messages(task), 300, 0.3, cache)
+
+# ==================== 流式生成器 ====================
+# 逐段产出增量文本，首 token 到达即可展示；传入 StreamStats 可获取 TTFT 等统计。
+# 与阻塞版本不同，流式生成器出错时直接抛出异常，由调用方处理。
+
+def openai_chat_stream(messages, max_tokens=200, temperature=0.7, stats=None):
+    """OpenAI SDK 流式调用 - 同步生成器"""
+    stats = stats if stats is not None else StreamStats()
+    stats.start()
+    stream = openai_client.chat.completions.create(
+        model="default",
+        messages=messages,
+        max_tokens=max_tokens,
+        temperature=temperature,
+        stream=True,
+        stream_options={"include_usage": True},
+        extra_body=CLEAN_EXTRA_BODY,
+        **CLEAN_SAMPLING_PARAMS,
+    )
+    completion_tokens = None
+    for chunk in stream:
+        if chunk.usage:
+            completion_tokens = chunk.usage.completion_tokens
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            stats.record_delta()
+            yield delta
+    stats.finish(completion_tokens)
+
+async def openai_chat_astream(messages, max_tokens=200, temperature=0.7, stats=None):
+    """OpenAI SDK 流式调用 - 异步生成器"""
+    stats = stats if stats is not None else StreamStats()
+    stats.start()
+    stream = await async_openai_client.chat.completions.create(
+        model="default",
+        messages=messages,
+        max_tokens=max_tokens,
+        temperature=temperature,
+        stream=True,
+        stream_options={"include_usage": True},
+        extra_body=CLEAN_EXTRA_BODY,
+        **CLEAN_SAMPLING_PARAMS,
+    )
+    completion_tokens = None
+    async for chunk in stream:
+        if chunk.usage:
+            completion_tokens = chunk.usage.completion_tokens
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            stats.record_delta()
+            yield delta
+    stats.finish(completion_tokens)
+
+def chat_api_stream(messages, max_tokens=200, stats=None):
+    """传统 requests 流式调用 - 同步生成器，按原始字节解析 SSE"""
+    stats = stats if stats is not None else StreamStats()
+    stats.start()
+    payload = clean_chat_payload(messages, max_tokens, stream=True)
+    completion_tokens = None
+    with get_sync_transport().post_json(CHAT_COMPLETIONS_URL, payload, timeout=30, stream=True) as response:
+        response.raise_for_status()
+        # chunk_size=None 按到达顺序交付原始字节，多字节中文由 SSEDecoder 负责拼接
+        for event in iter_sse_events(response.iter_content(chunk_size=None)):
+            if event.get("usage"):
+                completion_tokens = event["usage"].get("completion_tokens")
+            delta = extract_delta_text(event)
+            if delta:
+                stats.record_delta()
+                yield delta
+    stats.finish(completion_tokens)
+
+async def chat_api_astream(messages, max_tokens=200, stats=None, transport=None):
+    """异步 HTTP 流式调用 - 异步生成器，可传入共享 AsyncTransport 复用连接"""
+    stats = stats if stats is not None else StreamStats()
+    stats.start()
+    payload = clean_chat_payload(messages, max_tokens, stream=True)
+    owns_transport = transport is None
+    if owns_transport:
+        transport = AsyncTransport(timeout=30)
+    completion_tokens = None
     try:
-        response = openai_client.chat.completions.create(
-            model="default",
-            messages=[
-                {"role": "system", "content": "你是一个编程专家，请直接提供代码，不要显示思考过程和解释。请用 Python 编写。"},
-                {"role": "user", "content": f"请编写代码：{task}"}
-            ],
-            max_tokens=300,
-            temperature=0.3,
-            top_p=0.8,
-            presence_penalty=1.5,
-            extra_body={
-                "top_k": 20,
-                "chat_template_kwargs": {"enable_thinking": False},
-            },
-        )
-        return safe_get_content(response)
-    except Exception as e:
-        return f"Exception: {e}"
+        async with transport.post_json(CHAT_COMPLETIONS_URL, payload) as response:
+            response.raise_for_status()
+            async for event in aiter_sse_events(response.aiter_bytes()):
+                if event.get("usage"):
+                    completion_tokens = event["usage"].get("completion_tokens")
+                delta = extract_delta_text(event)
+                if delta:
+                    stats.record_delta()
+                    yield delta
+    finally:
+        if owns_transport:
+            await transport.close()
+    stats.finish(completion_tokens)
+
+async def chat_api_thinking_astream(messages, think_budget=256, max_answer_tokens=256, result=None, transport=None):
+    """思考模式流式调用 - 产出 ("think" / "answer", 增量文本)，思考段超出预算后截断并直接作答
+
+    传入 ThinkBudgetResult 可获取思考与答案 token 数
+    """
+    result = result if result is not None else ThinkBudgetResult()
+    owns_transport = transport is None
+    if owns_transport:
+        transport = AsyncTransport(timeout=60)
+    try:
+        async for phase, delta in astream_with_budget(transport, SERVER_URL, messages, think_budget,
+                                                      max_answer_tokens, result=result):
+            yield phase, delta
+    finally:
+        if owns_transport:
+            await transport.close()
+
+def openai_structured_generation_stream(topic, stats=None):
+    """结构化生成 - 同步流式版本"""
+    yield from openai_chat_stream(structured_messages(topic), max_tokens=300, temperature=0.5, stats=stats)
+
+async def openai_structured_generation_astream(topic, stats=None):
+    """结构化生成 - 异步流式版本"""
+    async for delta in openai_chat_astream(structured_messages(topic), max_tokens=300, temperature=0.5, stats=stats):
+        yield delta
+
+def openai_code_generation_stream(task, stats=None):
+    """代码生成 - 同步流式版本"""
+    yield from openai_chat_stream(code_messages(task), max_tokens=300, temperature=0.3, stats=stats)
+
+async def openai_code_generation_astream(task, stats=None):
+    """代码生成 - 异步流式版本"""
+    async for delta in openai_chat_astream(code_messages(task), max_tokens=300, temperature=0.3, stats=stats):
+        yield delta
+
+async def collect_stream(agen, stats):
+    """消费异步流并返回完整文本与统计"""
+    parts = [delta async for delta in agen]
+    return "".join(parts), stats
 
 @sgl.function
 def code_generation(s, task):
@@ -272,7 +443,7 @@ def main():
             print(f"    答: {result[:80]}..." if len(result) > 80 else f"    答: {result}")
             
             # 检查是否包含思考过程标记
-            has_thinking = any(marker in result for marker in ["<think>", "</think>", "思考:", "用户问", "ASSISTANT:"])
+            has_thinking = contains_think_marker(result)
             print(f"    {'⚠️  包含思考标记' if has_thinking else '✅ 干净输出'}")
         except Exception as e:
             print(f"    ❌ 失败: {e}")
@@ -299,10 +470,10 @@ def main():
             "presence_penalty": 1.5,
         }
         
-        response = requests.post("http://localhost:30000/v1/chat/completions", 
-                               json=payload_without_enable_thinking, timeout=30)
+        response = get_sync_transport().post_json(CHAT_COMPLETIONS_URL,
+                                                  payload_without_enable_thinking, timeout=30)
         if response.status_code == 200:
-            result = response.json()
+            result = response_json(response)
             content = result["choices"][0]["message"]["content"]
             result1 = content if content is not None else ""
         else:
@@ -326,6 +497,56 @@ def main():
     except Exception as e:
         print(f"    ❌ 失败: {e}")
     
+    # 示例9: 流式输出
+    print("\n9. 🌊 流式输出测试（同步生成器）")
+    print("-" * 50)
+    try:
+        stats = StreamStats()
+        print("    回答: ", end="", flush=True)
+        for delta in chat_api_stream([
+            {"role": "system", "content": "你是一个有用的AI助手，请简洁明了地回答用户问题，不要显示思考过程。"},
+            {"role": "user", "content": "什么是强化学习？请简洁回答。"}
+        ], stats=stats):
+            print(delta, end="", flush=True)
+        print()
+        print(f"    ⏱️  TTFT: {(stats.ttft or 0) * 1000:.0f} ms, 总耗时: {stats.latency:.2f} 秒, 输出 token: {stats.completion_tokens}")
+    except Exception as e:
+        print(f"\n    ❌ 失败: {e}")
+    
+    # 示例10: 异步流式并发
+    print("\n10. 🌊 流式输出测试（异步生成器并发）")
+    print("-" * 50)
+    try:
+        async def run_streams():
+            tasks = []
+            for topic in ["深度学习", "区块链"]:
+                stats = StreamStats()
+                tasks.append(collect_stream(openai_structured_generation_astream(topic, stats=stats), stats))
+            stats = StreamStats()
+            tasks.append(collect_stream(openai_code_generation_astream("实现二分查找", stats=stats), stats))
+            return await asyncio.gather(*tasks)
+        
+        for text, stats in asyncio.run(run_streams()):
+            print(f"    结果: {text[:60]}..." if len(text) > 60 else f"    结果: {text}")
+            print(f"    ⏱️  TTFT: {(stats.ttft or 0) * 1000:.0f} ms, 总耗时: {stats.latency:.2f} 秒")
+    except Exception as e:
+        print(f"    ❌ 失败: {e}")
+    
+    # 示例11: 响应缓存
+    print("\n11. 🗄️ 响应缓存测试（重复 FAQ 问题）")
+    print("-" * 50)
+    # 采样请求默认不缓存；FAQ 场景显式允许复用同一回答
+    faq_cache = ResponseCache(capacity=256, ttl=600, cache_sampled=True)
+    faq_questions = ["什么是深度学习？", "谁发明了电话？", "什么是深度学习？", "谁发明了电话？"]
+    for q in faq_questions:
+        openai_chat_clean([
+            {"role": "system", "content": "你是一个有用的AI助手，请简洁明了地回答用户问题，不要显示思考过程。"},
+            {"role": "user", "content": q}
+        ], cache=faq_cache)
+    cache_stats = faq_cache.stats()
+    print(f"    请求数: {len(faq_questions)}, 命中: {cache_stats['memory_hits'] + cache_stats['disk_hits']}, "
+          f"未命中: {cache_stats['misses']}, 命中率: {cache_stats['hit_rate']:.0%}")
+    
     print("\n" + "=" * 80)
     print("🎉 统一测试完成")
     print("🏆 最佳实践总结：")
@@ -336,6 +557,8 @@ def main():
     print("   5. 🛠️  SGLang API 添加 stop 序列: ['<think>', '</think>', '思考:', '用户:', 'ASSISTANT:']")
     print("   6. 🎯 OpenAI SDK 在 extra_body 中使用 chat_template_kwargs")
     print("   7. ✨ OpenAI SDK 提供更好的类型安全性和易用性")
+    print("   8. 🌊 交互场景使用 *_stream / *_astream 流式生成器，首 token 即可展示")
+    print("   9. 🗄️  重复请求传入 ResponseCache，命中时不占用 GPU")
     print("=" * 80)
 
 if __name__ == "__main__":
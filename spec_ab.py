@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+推测解码 A/B 压测
+用同一配置/预设分别启动关闭和开启推测解码的服务器，运行相同负载，
+对比单请求解码速度 (1000 / TPOT)、总输出吞吐与平均接受长度
+"""
+
+import argparse
+import copy
+import sys
+from typing import Any, Dict, List, Optional
+
+import requests
+
+from autotune import AutoTuner, add_trial_arguments
+from http_transport import get_sync_transport, response_json
+
+SPECULATIVE_ARGS = [
+    "speculative_algorithm", "speculative_draft_model_path", "speculative_num_steps",
+    "speculative_eagle_topk", "speculative_num_draft_tokens",
+]
+
+
+def server_accept_length(base_url: str) -> Optional[float]:
+    """读取 /get_server_info 中服务端统计的平均接受长度 (较新版本 SGLang 提供)"""
+    try:
+        info = response_json(get_sync_transport().get(f"{base_url}/get_server_info", timeout=10))
+    except (requests.exceptions.RequestException, ValueError):
+        return None
+    states = info.get("internal_states") or [info]
+    values = [s["avg_spec_accept_length"] for s in states
+              if isinstance(s, dict) and s.get("avg_spec_accept_length") is not None]
+    return sum(values) / len(values) if values else None
+
+
+def probe_accept_length(base_url: str, prompts: List[str], max_tokens: int) -> Optional[float]:
+    """用原生 /generate 的 meta_info 估算: 输出 token 数 / 验证轮数"""
+    tokens, verify_rounds = 0, 0
+    for prompt in prompts:
+        payload = {"text": prompt, "sampling_params": {"max_new_tokens": max_tokens, "temperature": 0}}
+        try:
+            response = get_sync_transport().post_json(f"{base_url}/generate", payload, timeout=300)
+            meta = response_json(response).get("meta_info", {})
+        except (requests.exceptions.RequestException, ValueError, AttributeError):
+            continue
+        if meta.get("spec_verify_ct"):
+            tokens += meta.get("completion_tokens", 0)
+            verify_rounds += meta["spec_verify_ct"]
+    return tokens / verify_rounds if verify_rounds else None
+
+
+def prompt_text(item: Dict[str, Any]) -> str:
+    if "messages" in item:
+        return "\n".join(str(m.get("content", "")) for m in item["messages"])
+    return str(item.get("prompt", ""))
+
+
+class SpeculativeAB(AutoTuner):
+    """baseline: 关闭推测解码；speculative: 按配置文件/命令行开启"""
+
+    tuned_params = {}
+
+    def build_trial_command(self, candidate: Dict[str, Any]) -> List[str]:
+        config = copy.deepcopy(self.base_config)
+        launcher_args = copy.copy(self.launcher_args)
+        config.setdefault('speculative_decoding', {})['enable'] = candidate["speculative"]
+        if not candidate["speculative"]:
+            for name in SPECULATIVE_ARGS:
+                setattr(launcher_args, name, None)
+        return self.launcher.build_command(launcher_args, config)
+
+    def collect_extra_metrics(self, base_url: str, trial: Dict[str, Any]):
+        metrics = trial["metrics"]
+        metrics["decode_tokens_per_s"] = 1000 / metrics["mean_tpot_ms"] if metrics["mean_tpot_ms"] else 0.0
+        if not trial["params"]["speculative"]:
+            metrics["accept_length"] = 1.0
+            return
+        accept_length = server_accept_length(base_url)
+        if accept_length is None and self.args.accept_probes:
+            prompts = [prompt_text(item) for item in self.load_trial_workload()[:self.args.accept_probes]]
+            accept_length = probe_accept_length(base_url, prompts, self.args.max_tokens)
+        metrics["accept_length"] = accept_length
+
+
+def _fmt(value: Optional[float]) -> str:
+    return "N/A" if value is None else f"{value:.2f}"
+
+
+def print_comparison(trials: List[Dict[str, Any]]):
+    by_mode = {t["params"]["speculative"]: t["metrics"] for t in trials if t.get("metrics")}
+    rows = [
+        ("单请求解码速度 (tok/s)", "decode_tokens_per_s"),
+        ("总输出吞吐 (tok/s)", "output_throughput"),
+        ("平均 TPOT (ms)", "mean_tpot_ms"),
+        ("p99 TPOT (ms)", "p99_tpot_ms"),
+        ("p99 TTFT (ms)", "p99_ttft_ms"),
+        ("平均接受长度", "accept_length"),
+    ]
+    print("\n" + "=" * 72)
+    print(f"{'指标':<24}{'baseline':>14}{'speculative':>14}{'变化':>14}")
+    print("=" * 72)
+    base, spec = by_mode.get(False, {}), by_mode.get(True, {})
+    for label, key in rows:
+        a, b = base.get(key), spec.get(key)
+        change = f"{b / a:.2f}x" if a and b is not None else "-"
+        print(f"{label:<24}{_fmt(a):>14}{_fmt(b):>14}{change:>14}")
+    print("=" * 72)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="推测解码 A/B 压测",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+未识别的参数会原样传给 launch_server.py，例如:
+  python spec_ab.py --concurrency 8 --max-tokens 512 --preset balanced \\
+      --speculative-algorithm EAGLE3 --speculative-draft-model-path /path/to/eagle3-draft \\
+      --speculative-num-steps 3 --speculative-num-draft-tokens 4
+        """
+    )
+    add_trial_arguments(parser, log_dir="spec_ab_logs", results="spec_ab_results.jsonl")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--accept-probes", type=int, default=8,
+                        help="服务端未提供接受长度统计时，用于 /generate 探测的请求数 (0 表示不探测)")
+    args, launcher_argv = parser.parse_known_args()
+
+    ab = SpeculativeAB(args, launcher_argv)
+    # 先校验推测解码配置 (无效时直接退出)，避免跑完 baseline 才发现
+    ab.build_trial_command({"speculative": True})
+
+    trials = ab.run([{"speculative": False}, {"speculative": True}])
+    print_comparison(trials)
+    if any(t.get("status") != "ok" for t in trials):
+        print("存在失败的试验，请检查日志目录: " + args.log_dir)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+SSE 流式响应解析工具
+增量解析 OpenAI 兼容接口的 Server-Sent Events 字节流
+"""
+
+import codecs
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, Optional
+
+import orjson
+
+DONE_MARKER = "[DONE]"
+
+
+@dataclass
+class StreamStats:
+    """单次流式调用的统计信息 (时间单位: 秒)"""
+    start_time: float = 0.0
+    ttft: Optional[float] = None
+    latency: float = 0.0
+    chunks: int = 0
+    completion_tokens: int = 0
+
+    def start(self):
+        self.start_time = time.perf_counter()
+
+    def record_delta(self):
+        """收到一段非空增量文本时调用"""
+        if self.ttft is None:
+            self.ttft = time.perf_counter() - self.start_time
+        self.chunks += 1
+
+    def finish(self, completion_tokens: Optional[int] = None):
+        self.latency = time.perf_counter() - self.start_time
+        self.completion_tokens = completion_tokens or self.chunks
+
+
+class SSEDecoder:
+    """增量 SSE 解码器 - 逐块喂入原始字节，返回完整事件的 data 字段"""
+
+    def __init__(self):
+        # 增量解码器会缓存被 chunk 边界截断的多字节 UTF-8 字符
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._data_lines: List[str] = []
+
+    def feed(self, chunk: bytes) -> List[str]:
+        """喂入一个字节块，返回已完整接收的事件数据"""
+        self._buffer += self._decoder.decode(chunk)
+        if "\n" not in self._buffer:
+            return []
+        lines = self._buffer.split("\n")
+        self._buffer = lines.pop()
+        return self._consume_lines(lines)
+
+    def flush(self) -> List[str]:
+        """流结束时调用，返回缓冲区中剩余的事件"""
+        self._buffer += self._decoder.decode(b"", final=True)
+        lines = self._buffer.split("\n") if self._buffer else []
+        self._buffer = ""
+        events = self._consume_lines(lines)
+        if self._data_lines:
+            events.append("\n".join(self._data_lines))
+            self._data_lines = []
+        return events
+
+    def _consume_lines(self, lines: List[str]) -> List[str]:
+        events = []
+        for line in lines:
+            line = line.rstrip("\r")
+            if not line:
+                # 空行表示一个事件结束
+                if self._data_lines:
+                    events.append("\n".join(self._data_lines))
+                    self._data_lines = []
+            elif line.startswith("data:"):
+                data = line[5:]
+                self._data_lines.append(data[1:] if data.startswith(" ") else data)
+            # 注释行 (":") 以及 event/id/retry 字段对本项目无意义，直接忽略
+        return events
+
+
+def parse_event(data: str) -> Optional[Dict[str, Any]]:
+    """解析单个事件的 JSON 数据，[DONE] 返回 None"""
+    if data.strip() == DONE_MARKER:
+        return None
+    return orjson.loads(data)
+
+
+def extract_delta_text(event: Dict[str, Any], chat: bool = True) -> str:
+    """从流式 chunk 中取出本次增量文本"""
+    choices = event.get("choices") or []
+    if not choices:
+        return ""
+    choice = choices[0]
+    if not chat:
+        return choice.get("text") or ""
+    delta = choice.get("delta") or {}
+    # 启用 reasoning parser 时思考内容单独放在 reasoning_content 中
+    return (delta.get("reasoning_content") or "") + (delta.get("content") or "")
+
+
+def iter_sse_events(chunks: Iterable[bytes]) -> Iterator[Dict[str, Any]]:
+    """同步迭代 SSE 字节流，逐个产出已解析的事件"""
+    decoder = SSEDecoder()
+    for chunk in chunks:
+        for data in decoder.feed(chunk):
+            event = parse_event(data)
+            if event is None:
+                return
+            yield event
+    for data in decoder.flush():
+        event = parse_event(data)
+        if event is None:
+            return
+        yield event
+
+
+async def aiter_sse_events(chunks: AsyncIterator[bytes]) -> AsyncIterator[Dict[str, Any]]:
+    """异步迭代 SSE 字节流，逐个产出已解析的事件"""
+    decoder = SSEDecoder()
+    async for chunk in chunks:
+        for data in decoder.feed(chunk):
+            event = parse_event(data)
+            if event is None:
+                return
+            yield event
+    for data in decoder.flush():
+        event = parse_event(data)
+        if event is None:
+            return
+        yield event
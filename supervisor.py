@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+SGLang 服务守护进程
+在前端端口运行 router.py，后端 SGLang 实例崩溃时按指数退避自动重启；
+配置变更时蓝绿切换: 用新配置启动第二个实例，就绪并预热后切换流量，旧实例排空在途请求后关闭；
+收到 SIGTERM 时先停止接收新请求并排空在途请求再退出
+"""
+
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+import requests
+
+from http_transport import get_sync_transport, response_json
+from launch_server import ROUTER_SCRIPT, SGLangServerLauncher, terminate_process
+
+
+class Instance:
+    """一个 SGLang 服务器实例 (蓝/绿槽位之一)"""
+
+    def __init__(self, slot: int, port: int, gpus: Optional[str]):
+        self.slot = slot
+        self.port = port
+        self.gpus = gpus
+        self.base_url = f"http://127.0.0.1:{port}"
+        self.proc: Optional[subprocess.Popen] = None
+        self.started_at = 0.0
+
+    @property
+    def name(self) -> str:
+        return "蓝" if self.slot == 0 else "绿"
+
+    def alive(self) -> bool:
+        return self.proc is not None and self.proc.poll() is None
+
+
+class Supervisor:
+    """守护 SGLang 实例与前端路由"""
+
+    def __init__(self, args: argparse.Namespace, launcher_argv: List[str]):
+        self.args = args
+        self.launcher = SGLangServerLauncher()
+        self.launcher_args = self.launcher.create_parser().parse_args(launcher_argv)
+        self.config_path = self.launcher_args.config or self.launcher.default_config_path
+
+        self.front_host = self.launcher_args.host
+        self.front_port = self.launcher_args.port
+        self.admin_url = f"http://127.0.0.1:{self.front_port}"
+        base_port = args.instance_base_port or self.front_port + 1
+        gpu_sets = args.gpu_sets.split(";") if args.gpu_sets else [None]
+        # 两个槽位交替使用；只给出一组GPU时蓝绿实例共享同一组GPU
+        self.slots = [Instance(i, base_port + i, gpu_sets[i % len(gpu_sets)]) for i in range(2)]
+
+        self.active: Optional[Instance] = None
+        self.router_proc: Optional[subprocess.Popen] = None
+        self.stop_requested = False
+        self.reload_requested = False
+        self.consecutive_failures = 0
+        self.config_mtime = self._config_mtime()
+
+    def _config_mtime(self) -> float:
+        try:
+            return os.path.getmtime(self.config_path)
+        except OSError:
+            return 0.0
+
+    def handle_signal(self, signum, frame):
+        if signum == signal.SIGHUP:
+            print("\n收到 SIGHUP，准备蓝绿重启")
+            self.reload_requested = True
+        else:
+            print(f"\n收到信号 {signum}，准备排空并退出")
+            self.stop_requested = True
+
+    def build_instance_command(self, instance: Instance) -> List[str]:
+        """每次都重新读取配置文件，使配置变更在下一个实例生效"""
+        config = self.launcher.load_config(self.config_path)
+        if self.launcher_args.preset:
+            config = self.launcher.apply_quantization_preset(config, self.launcher_args.preset)
+        self.launcher.config = config
+        cmd = self.launcher.build_command(self.launcher_args, config)
+        cmd = self.launcher.replace_flag(cmd, "--host", "127.0.0.1")
+        return self.launcher.replace_flag(cmd, "--port", str(instance.port))
+
+    def start_instance(self, instance: Instance) -> bool:
+        """启动实例并等待就绪、预热；失败时清理进程"""
+        cmd = self.build_instance_command(instance)
+        self.launcher.check_server_flags(self.launcher_args, cmd)
+        self.launcher.check_capacity(self.launcher_args, cmd)
+        env = os.environ.copy()
+        if instance.gpus:
+            env["CUDA_VISIBLE_DEVICES"] = instance.gpus
+        print(f"\n启动{instance.name}实例: {instance.base_url}" + (f" (GPU {instance.gpus})" if instance.gpus else ""))
+        # 独立进程组: 终端 Ctrl+C 只通知守护进程，由其负责排空后再关闭实例
+        instance.proc = subprocess.Popen(cmd, env=env, start_new_session=True)
+        instance.started_at = time.time()
+        # 启动期间收到 SIGTERM/SIGINT 时立即放弃等待，关闭启动到一半的实例
+        if self.launcher.wait_ready_and_warmup(self.launcher_args, [instance.base_url], [instance.proc],
+                                               should_stop=lambda: self.stop_requested):
+            return True
+        terminate_process(instance.proc)
+        return False
+
+    def start_router(self, backends: List[str]):
+        router_cmd = [sys.executable, ROUTER_SCRIPT, "--host", self.front_host, "--port", str(self.front_port),
+                      "--policy", self.launcher_args.router_policy, "--backends", *backends]
+        print(f"启动路由: {' '.join(router_cmd)}")
+        self.router_proc = subprocess.Popen(router_cmd, start_new_session=True)
+        self.launcher.wait_until_healthy(self.admin_url, 30, self.router_proc, interval=0.5,
+                                         endpoint="/router/stats")
+
+    def set_router_backends(self, backends: List[str]) -> bool:
+        try:
+            response = get_sync_transport().post_json(f"{self.admin_url}/router/backends",
+                                                      {"backends": backends}, timeout=10)
+            return response.status_code == 200
+        except requests.exceptions.RequestException as e:
+            print(f"警告: 切换路由后端失败: {e}")
+            return False
+
+    def router_stats(self) -> Optional[Dict[str, Any]]:
+        try:
+            return response_json(get_sync_transport().get(f"{self.admin_url}/router/stats", timeout=5))
+        except (requests.exceptions.RequestException, ValueError):
+            return None
+
+    def wait_drained(self, url: str, timeout: float):
+        """等待某个后端的在途请求完成"""
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            stats = self.router_stats()
+            if stats is None:
+                return
+            inflight = sum(b["inflight"] for b in stats["backends"] + stats["draining"] if b["url"] == url)
+            if inflight == 0:
+                return
+            print(f"  排空中: {url} 仍有 {inflight} 个在途请求")
+            time.sleep(1)
+        print(f"警告: {url} 排空超时 ({timeout:.0f}s)，强制关闭")
+
+    def backoff_delay(self) -> float:
+        return min(self.args.backoff_initial * (2 ** (self.consecutive_failures - 1)), self.args.backoff_max)
+
+    def restart_after_crash(self):
+        """原槽位重启；实例稳定运行一段时间后清零失败计数"""
+        instance = self.active
+        if time.time() - instance.started_at >= self.args.stable_seconds:
+            self.consecutive_failures = 0
+        self.consecutive_failures += 1
+        if self.args.max_restarts and self.consecutive_failures > self.args.max_restarts:
+            print(f"错误: 连续重启失败 {self.args.max_restarts} 次，放弃")
+            self.stop_requested = True
+            return
+
+        # 没有可用实例时直接返回 503，便于上游负载均衡摘除本节点
+        self.set_router_backends([])
+        delay = self.backoff_delay()
+        print(f"\n{instance.name}实例已退出 (退出码 {instance.proc.returncode})，{delay:.0f}s 后第 "
+              f"{self.consecutive_failures} 次重启")
+        deadline = time.time() + delay
+        while time.time() < deadline and not self.stop_requested:
+            time.sleep(0.5)
+        if self.stop_requested:
+            return
+        if self.start_instance(instance):
+            self.set_router_backends([instance.base_url])
+            print(f"{instance.name}实例已恢复")
+
+    def rolling_restart(self):
+        """蓝绿切换: 新实例就绪后切流量，再排空并关闭旧实例"""
+        old = self.active
+        new = self.slots[1 - old.slot]
+        if not self.start_instance(new):
+            print(f"警告: {new.name}实例启动失败，继续使用{old.name}实例")
+            return
+        self.set_router_backends([new.base_url])
+        self.active = new
+        print(f"流量已切换到{new.name}实例，排空{old.name}实例")
+        self.wait_drained(old.base_url, self.args.drain_timeout)
+        terminate_process(old.proc, timeout=60)
+        print(f"{old.name}实例已关闭，蓝绿切换完成")
+
+    def shutdown(self):
+        """停止接收新请求，排空在途请求后关闭所有进程"""
+        if self.active is not None and self.active.alive() and self.router_proc is not None:
+            self.set_router_backends([])
+            self.wait_drained(self.active.base_url, self.args.drain_timeout)
+        for instance in self.slots:
+            if instance.proc is not None:
+                terminate_process(instance.proc, timeout=60)
+        if self.router_proc is not None:
+            terminate_process(self.router_proc)
+        print("守护进程已退出")
+
+    def run(self) -> int:
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+            signal.signal(signum, self.handle_signal)
+
+        try:
+            self.active = self.slots[0]
+            while not self.start_instance(self.active):
+                self.consecutive_failures += 1
+                if self.stop_requested or (self.args.max_restarts
+                                           and self.consecutive_failures > self.args.max_restarts):
+                    return 1
+                time.sleep(self.backoff_delay())
+            self.start_router([self.active.base_url])
+            self.launcher.signal_ready(self.launcher_args, [self.admin_url], [os.getpid()])
+
+            while not self.stop_requested:
+                time.sleep(1)
+                if self.router_proc.poll() is not None:
+                    print(f"\n路由已退出 (退出码 {self.router_proc.returncode})，重新启动")
+                    self.start_router([self.active.base_url])
+                if not self.active.alive():
+                    self.restart_after_crash()
+                    continue
+                if self.args.watch_config and self._config_mtime() != self.config_mtime:
+                    print(f"\n检测到配置文件变更: {self.config_path}")
+                    self.reload_requested = True
+                if self.reload_requested:
+                    self.reload_requested = False
+                    self.config_mtime = self._config_mtime()
+                    self.rolling_restart()
+            return 0
+        finally:
+            self.shutdown()
+
+
+def create_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="SGLang 服务守护进程 - 崩溃重启与蓝绿无中断重启",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+未识别的参数会原样传给 launch_server.py，例如:
+  python supervisor.py --gpu-sets "0;1" --watch-config --config server_config.yaml --preset balanced
+
+蓝绿重启: kill -HUP <pid>，或使用 --watch-config 在配置文件变更时自动触发。
+只给出一组GPU时两个实例共享显存，mem_fraction_static 需足够低以容纳两份权重和KV缓存。
+        """
+    )
+    parser.add_argument("--gpu-sets",
+                        help="蓝/绿实例使用的GPU，分号分隔，例如 \"0;1\" 或 \"0,1;2,3\"")
+    parser.add_argument("--instance-base-port", type=int, help="实例起始端口 (默认: 前端端口+1)")
+    parser.add_argument("--watch-config", action="store_true", help="配置文件修改后自动蓝绿重启")
+    parser.add_argument("--drain-timeout", type=float, default=120, help="排空在途请求的超时(秒)")
+    parser.add_argument("--backoff-initial", type=float, default=5, help="崩溃重启的初始等待(秒)")
+    parser.add_argument("--backoff-max", type=float, default=300, help="崩溃重启的最大等待(秒)")
+    parser.add_argument("--stable-seconds", type=float, default=600,
+                        help="实例稳定运行超过该时长后清零连续失败计数")
+    parser.add_argument("--max-restarts", type=int, default=0, help="连续重启次数上限 (0 表示不限)")
+    return parser
+
+
+def main():
+    args, launcher_argv = create_parser().parse_known_args()
+    sys.exit(Supervisor(args, launcher_argv).run())
+
+
+if __name__ == "__main__":
+    main()
@@ -5,10 +5,12 @@ SGLang 客户端测试脚本
 """
 
 import requests
-import json
 import argparse
 import time
 
+from benchmark import add_benchmark_arguments, run_from_args
+from http_transport import get_sync_transport, response_json
+
 def test_completions_api(base_url, prompt, max_tokens=100):
     """测试 completions API"""
     url = f"{base_url}/v1/completions"
@@ -22,21 +24,17 @@ def test_completions_api(base_url, prompt, max_tokens=100):
         "stream": False
     }
     
-    headers = {
-        "Content-Type": "application/json"
-    }
-    
     try:
         print(f"发送请求到: {url}")
         print(f"提示词: {prompt}")
         print("-" * 50)
         
         start_time = time.time()
-        response = requests.post(url, json=payload, headers=headers, timeout=60)
+        response = get_sync_transport().post_json(url, payload, timeout=60)
         end_time = time.time()
         
         if response.status_code == 200:
-            result = response.json()
+            result = response_json(response)
             generated_text = result["choices"][0]["text"]
             
             print(f"生成结果:")
@@ -69,21 +67,17 @@ def test_chat_completions_api(base_url, message, max_tokens=100):
         "stream": False
     }
     
-    headers = {
-        "Content-Type": "application/json"
-    }
-    
     try:
         print(f"发送聊天请求到: {url}")
         print(f"用户消息: {message}")
         print("-" * 50)
         
         start_time = time.time()
-        response = requests.post(url, json=payload, headers=headers, timeout=60)
+        response = get_sync_transport().post_json(url, payload, timeout=60)
         end_time = time.time()
         
         if response.status_code == 200:
-            result = response.json()
+            result = response_json(response)
             generated_text = result["choices"][0]["message"]["content"]
             
             print(f"AI回复:")
@@ -105,7 +99,7 @@ def check_server_health(base_url):
     """检查服务器健康状态"""
     try:
         url = f"{base_url}/health"
-        response = requests.get(url, timeout=10)
+        response = get_sync_transport().get(url, timeout=10)
         return response.status_code == 200
     except:
         return False
@@ -116,6 +110,9 @@ def main():
     parser.add_argument("--port", default=30000, type=int, help="服务器端口")
     parser.add_argument("--prompt", default="你好，请介绍一下自己。", help="测试提示词")
     parser.add_argument("--max-tokens", default=100, type=int, help="最大生成token数")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="压测模式: 并发流式请求，统计吞吐与 TTFT/TPOT/ITL 分位数")
+    add_benchmark_arguments(parser)
     
     args = parser.parse_args()
     
@@ -133,6 +130,11 @@ def main():
         print("✗ 服务器无法访问，请确保服务器已启动")
         return
     
+    if args.benchmark:
+        print("\n2. 压测模式...")
+        run_from_args(args, base_url)
+        return
+    
     print("\n2. 测试 completions API...")
     test_completions_api(base_url, args.prompt, args.max_tokens)
     
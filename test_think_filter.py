@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+think_filter 单元测试 (无需服务器)
+运行: python -m pytest -q test_think_filter.py
+"""
+
+import random
+
+import pytest
+
+from think_filter import THINK_MARKERS, MarkerMatcher, ThinkFilter
+
+
+def run_filter(text, mode, sizes):
+    """按给定的 chunk 长度序列切分文本逐段喂入，返回 (输出, 触发的标记)"""
+    think_filter = ThinkFilter(mode)
+    out, pos, i = [], 0, 0
+    while pos < len(text):
+        size = sizes[i % len(sizes)]
+        out.append(think_filter.feed(text[pos:pos + size]))
+        pos += size
+        i += 1
+    out.append(think_filter.flush())
+    return "".join(out), think_filter.triggered
+
+
+def all_splits(text, mode):
+    """固定 chunk 长度 1..len(text) 以及随机切分下的所有结果"""
+    results = {run_filter(text, mode, [size]) for size in range(1, len(text) + 1)}
+    rng = random.Random(0)
+    for _ in range(50):
+        results.add(run_filter(text, mode, [rng.randint(1, 5) for _ in range(len(text))]))
+    return results
+
+
+def test_matcher_reports_overlapping_markers():
+    matcher = MarkerMatcher(["he", "she", "his", "hers"])
+    assert [matcher.step(ch) for ch in "ushers"] == [None, None, None, "she", None, "hers"]
+
+
+def test_matcher_partial_len_tracks_possible_prefix():
+    matcher = MarkerMatcher(THINK_MARKERS)
+    for ch in "abc</thi":
+        matcher.step(ch)
+    assert matcher.partial_len == len("</thi")
+    matcher.step("x")
+    assert matcher.partial_len == 0
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("<think>\n好的，用户问的是天气…</think>\n\n今天晴天。", ("\n\n今天晴天。", None)),
+    ("前文<think>想一想 </thi 还没结束</think>答案是 42<", ("前文答案是 42<", None)),
+    ("abc <thin> <th</think>xyz", ("abc <thin> <thxyz", None)),
+    ("ab<<think>cd</think>e", ("ab<e", None)),
+    ("答:好的\nASSISTANT: 再来", ("答:好的\n", "ASSISTANT:")),
+    ("回答完毕。用户问：还有吗", ("回答完毕。", "用户问")),
+    ("普通文本没有标记", ("普通文本没有标记", None)),
+    ("末尾是不完整标记 <thin", ("末尾是不完整标记 <thin", None)),
+])
+def test_strip_mode_is_chunk_boundary_safe(text, expected):
+    assert all_splits(text, "strip") == {expected}
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("<think>\n好的，用户问的是天气…</think>\n\n今天晴天。", ("", "<think>")),
+    ("前文<think>想一想</think>答案", ("前文", "<think>")),
+    ("stray </think> close", ("stray ", "</think>")),
+    ("答:好的\n思考：再想想", ("答:好的\n", "思考：")),
+    ("普通文本没有标记", ("普通文本没有标记", None)),
+])
+def test_abort_mode_stops_at_first_marker(text, expected):
+    assert all_splits(text, "abort") == {expected}
+
+
+def test_stopped_filter_drops_further_input():
+    think_filter = ThinkFilter("abort")
+    assert think_filter.feed("ok ASSISTANT: x") == "ok "
+    assert think_filter.stopped
+    assert think_filter.feed("more text") == ""
+    assert think_filter.flush() == ""
+
+
+def test_strip_counts_stripped_chars():
+    think_filter = ThinkFilter("strip")
+    output = think_filter.feed("<think>abc</think>d") + think_filter.flush()
+    assert output == "d"
+    assert think_filter.stripped_chars == len("<think>abc</think>")
+
+
+def test_unknown_mode_rejected():
+    with pytest.raises(ValueError):
+        ThinkFilter("drop")
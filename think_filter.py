@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+流式思考标记过滤
+enable_thinking=False 仍可能漏出 <think> 段或 "ASSISTANT:" 之类的续写标记；事后检查时这些 token 已经占用了解码槽位。
+这里用 Aho-Corasick 自动机增量匹配所有标记 (跨 chunk 边界安全)，可以边流式输出边剔除思考段，
+或在出现标记时立即断开流并调用 /abort_request 让服务端停止生成，同时统计节省的 token 数
+"""
+
+import argparse
+import asyncio
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence
+
+from benchmark import build_default_workload, load_workload
+from http_transport import TRANSPORT_ERRORS, AsyncTransport
+from streaming import aiter_sse_events
+
+THINK_OPEN, THINK_CLOSE = "<think>", "</think>"
+THINK_MARKERS = [THINK_OPEN, THINK_CLOSE, "思考:", "思考：", "用户问", "ASSISTANT:"]
+MODES = ["strip", "abort"]
+
+
+def contains_think_marker(text: str, markers: Sequence[str] = THINK_MARKERS) -> bool:
+    """对完整文本做事后检查"""
+    return any(marker in text for marker in markers)
+
+
+class MarkerMatcher:
+    """多模式串 Aho-Corasick 自动机，逐字符推进，状态在多次调用之间保留"""
+
+    def __init__(self, markers: Sequence[str]):
+        self.markers = [m for m in markers if m]
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail = [0]
+        self.depth = [0]
+        self.output: List[Optional[int]] = [None]  # 在该状态结束的最长标记
+        for index, marker in enumerate(self.markers):
+            node = 0
+            for ch in marker:
+                if ch not in self.goto[node]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.depth.append(self.depth[node] + 1)
+                    self.output.append(None)
+                    self.goto[node][ch] = len(self.goto) - 1
+                node = self.goto[node][ch]
+            self.output[node] = index
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self.goto[node].items():
+                fallback = self.fail[node]
+                while fallback and ch not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(ch, 0)
+                if self.output[child] is None:
+                    self.output[child] = self.output[self.fail[child]]
+                queue.append(child)
+        self.state = 0
+
+    def step(self, ch: str) -> Optional[str]:
+        """推进一个字符，返回在此结束的标记"""
+        state = self.state
+        while state and ch not in self.goto[state]:
+            state = self.fail[state]
+        self.state = self.goto[state].get(ch, 0)
+        index = self.output[self.state]
+        return self.markers[index] if index is not None else None
+
+    @property
+    def partial_len(self) -> int:
+        """当前已读文本的末尾有多少字符可能是某个标记的开头"""
+        return self.depth[self.state]
+
+    def reset(self):
+        self.state = 0
+
+
+class ThinkFilter:
+    """增量过滤流式文本
+
+    strip: 剔除 <think>...</think> 段 (含孤立的 </think>)，在思考段之外遇到其他标记时截断并停止
+    abort: 遇到任何标记立即停止
+    可能是标记开头的末尾字符会暂时保留，确认不是标记后再输出
+    """
+
+    def __init__(self, mode: str = "strip", markers: Sequence[str] = THINK_MARKERS):
+        if mode not in MODES:
+            raise ValueError(f"未知的过滤模式: {mode} (可选: {', '.join(MODES)})")
+        self.mode = mode
+        self.matcher = MarkerMatcher(markers)
+        self.in_think = False
+        self.pending = ""
+        self.triggered: Optional[str] = None
+        self.stripped_chars = 0
+
+    @property
+    def stopped(self) -> bool:
+        return self.triggered is not None
+
+    def stop(self, reason: str):
+        self.triggered = reason
+        self.pending = ""
+
+    def _release(self, text: str, out: List[str]):
+        if self.in_think:
+            self.stripped_chars += len(text)
+        elif text:
+            out.append(text)
+
+    def feed(self, text: str) -> str:
+        """喂入一段增量文本，返回可以安全输出的部分"""
+        if self.stopped:
+            return ""
+        out: List[str] = []
+        for ch in text:
+            self.pending += ch
+            marker = self.matcher.step(ch)
+            if self.mode == "strip" and self.in_think and marker not in (THINK_OPEN, THINK_CLOSE):
+                # 思考段内的 "用户问" 等是正常推理内容，随思考段一起剔除
+                marker = None
+            if marker is not None:
+                self._release(self.pending[:-len(marker)], out)
+                self.stripped_chars += len(marker)
+                self.pending = ""
+                self.matcher.reset()
+                if self.mode == "abort" or marker not in (THINK_OPEN, THINK_CLOSE):
+                    self.stop(marker)
+                    break
+                self.in_think = marker == THINK_OPEN
+                continue
+            release = len(self.pending) - self.matcher.partial_len
+            if release > 0:
+                self._release(self.pending[:release], out)
+                self.pending = self.pending[release:]
+        return "".join(out)
+
+    def flush(self) -> str:
+        """流结束时输出保留的末尾字符 (仍在思考段内时丢弃)"""
+        out: List[str] = []
+        if not self.stopped:
+            self._release(self.pending, out)
+        self.pending = ""
+        self.matcher.reset()
+        return "".join(out)
+
+
+@dataclass
+class GuardResult:
+    """一次带过滤的流式请求"""
+    text: str = ""
+    triggered: Optional[str] = None
+    aborted: bool = False
+    completion_tokens: int = 0
+    think_tokens: int = 0  # 被剔除的思考段 chunk 数 (约等于 token 数)
+    saved_tokens: int = 0  # 提前中止节省的 token 上界: max_tokens - 已生成
+    latency: float = 0.0
+    error: str = ""
+
+
+async def abort_request(transport: AsyncTransport, base_url: str, rid: str) -> bool:
+    """调用 SGLang 的 /abort_request；经过 router 时可能转发到其他副本，断开连接仍然有效"""
+    try:
+        async with transport.post_json(f"{base_url}/abort_request", {"rid": rid}, timeout=10) as response:
+            await response.read()
+            return response.status == 200
+    except TRANSPORT_ERRORS:
+        return False
+
+
+async def stream_guarded(transport: AsyncTransport, base_url: str, body: Dict[str, Any], mode: str = "abort",
+                         markers: Sequence[str] = THINK_MARKERS, call_abort: bool = True) -> GuardResult:
+    """流式请求并实时过滤；停止时退出响应上下文即关闭连接，服务端检测到断开后中止生成
+
+    body 含 messages 时走 /v1/chat/completions，否则走 /v1/completions。
+    服务端启用 reasoning parser 时，reasoning_content 中的内容整体视为思考段。
+    """
+    chat = "messages" in body
+    payload = dict(body)
+    payload.setdefault("model", "default")
+    payload.setdefault("rid", uuid.uuid4().hex)
+    payload["stream"] = True
+    payload.setdefault("stream_options", {"include_usage": True})
+    url = f"{base_url}{'/v1/chat/completions' if chat else '/v1/completions'}"
+    result = GuardResult()
+    think_filter = ThinkFilter(mode, markers)
+    pieces: List[str] = []
+    chunks, usage_tokens = 0, None
+    start = time.perf_counter()
+    try:
+        async with transport.post_json(url, payload) as response:
+            if response.status != 200:
+                result.error = f"HTTP {response.status}: {await response.text()}"
+                return result
+            async for event in aiter_sse_events(response.aiter_bytes()):
+                if event.get("usage"):
+                    usage_tokens = event["usage"].get("completion_tokens")
+                choices = event.get("choices") or []
+                if not choices:
+                    continue
+                if chat:
+                    delta = choices[0].get("delta") or {}
+                    reasoning, content = delta.get("reasoning_content") or "", delta.get("content") or ""
+                else:
+                    reasoning, content = "", choices[0].get("text") or ""
+                if not reasoning and not content:
+                    continue
+                chunks += 1
+                if reasoning:
+                    if mode == "abort":
+                        think_filter.stop("reasoning_content")
+                    elif not content:
+                        result.think_tokens += 1
+                if content and not think_filter.stopped:
+                    was_thinking = think_filter.in_think
+                    cleaned = think_filter.feed(content)
+                    if not cleaned and (was_thinking or think_filter.in_think):
+                        result.think_tokens += 1
+                    pieces.append(cleaned)
+                if think_filter.stopped:
+                    break
+    except TRANSPORT_ERRORS + (ValueError,) as e:
+        result.error = f"{type(e).__name__}: {e}"
+        return result
+
+    if think_filter.stopped:
+        result.aborted = True
+        if call_abort:
+            await abort_request(transport, base_url, payload["rid"])
+    else:
+        pieces.append(think_filter.flush())
+    result.latency = time.perf_counter() - start
+    result.text = "".join(pieces)
+    result.triggered = think_filter.triggered
+    result.completion_tokens = usage_tokens or chunks
+    max_tokens = body.get("max_completion_tokens", body.get("max_tokens"))
+    if result.aborted and max_tokens:
+        result.saved_tokens = max(int(max_tokens) - result.completion_tokens, 0)
+    return result
+
+
+async def run_guarded(base_url: str, workload: List[Dict[str, Any]], mode: str, concurrency: int,
+                      call_abort: bool, timeout: float) -> List[GuardResult]:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(transport: AsyncTransport, body: Dict[str, Any]) -> GuardResult:
+        async with semaphore:
+            return await stream_guarded(transport, base_url, body, mode, call_abort=call_abort)
+
+    async with AsyncTransport(pool_size=concurrency, timeout=timeout) as transport:
+        return await asyncio.gather(*(one(transport, body) for body in workload))
+
+
+def print_guard_summary(results: List[GuardResult], mode: str):
+    ok = [r for r in results if not r.error]
+    triggered = [r for r in ok if r.triggered]
+    markers: Dict[str, int] = {}
+    for r in triggered:
+        markers[r.triggered] = markers.get(r.triggered, 0) + 1
+    print("=" * 60)
+    print(f"过滤模式: {mode}, 请求: {len(results)}, 失败: {len(results) - len(ok)}")
+    print(f"出现标记: {len(triggered)} ({', '.join(f'{m!r} x{c}' for m, c in markers.items()) or '无'})")
+    print(f"生成 token 总数: {sum(r.completion_tokens for r in ok)}")
+    if mode == "abort":
+        print(f"提前中止: {sum(1 for r in ok if r.aborted)} 个请求，节省 token (上界): {sum(r.saved_tokens for r in ok)}")
+    else:
+        print(f"剔除的思考段: 约 {sum(r.think_tokens for r in ok)} token")
+    print("=" * 60)
+    errors = [r.error for r in results if r.error]
+    if errors:
+        print(f"失败示例: {errors[0]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="流式思考标记过滤 - 统计思考段泄漏并演示剔除 / 提前中止",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+示例:
+  python think_filter.py --mode abort --num-prompts 50            # 关闭思考模式时统计泄漏并提前中止
+  python think_filter.py --mode strip --enable-thinking            # 开启思考模式，边输出边剔除 <think> 段
+        """,
+    )
+    parser.add_argument("--host", default="localhost", help="服务器主机地址")
+    parser.add_argument("--port", default=30000, type=int, help="服务器端口")
+    parser.add_argument("--mode", choices=MODES, default="abort", help="strip: 剔除思考段; abort: 出现标记即中止")
+    parser.add_argument("--dataset", help="请求 JSONL 文件 (每行包含 messages 或 prompt)")
+    parser.add_argument("--num-prompts", type=int, default=20, help="请求数")
+    parser.add_argument("--max-tokens", type=int, default=512, help="最大生成 token 数")
+    parser.add_argument("--concurrency", type=int, default=8, help="并发数")
+    parser.add_argument("--enable-thinking", action="store_true", help="请求时启用思考模式")
+    parser.add_argument("--no-abort-endpoint", action="store_true",
+                        help="中止时只断开连接，不调用 /abort_request")
+    parser.add_argument("--show", type=int, default=3, help="打印前几个过滤后的回答")
+    parser.add_argument("--request-timeout", type=float, default=600, help="单请求超时时间(秒)")
+    args = parser.parse_args()
+
+    if args.dataset:
+        workload = load_workload(args.dataset, "chat", args.num_prompts, args.max_tokens)
+    else:
+        workload = build_default_workload("chat", args.num_prompts, args.max_tokens)
+    for body in workload:
+        body.setdefault("chat_template_kwargs", {"enable_thinking": args.enable_thinking})
+
+    base_url = f"http://{args.host}:{args.port}"
+    results = asyncio.run(run_guarded(base_url, workload, args.mode, args.concurrency,
+                                      not args.no_abort_endpoint, args.request_timeout))
+    for body, result in list(zip(workload, results))[:args.show]:
+        question = body["messages"][-1]["content"]
+        flag = f" [标记 {result.triggered!r}]" if result.triggered else ""
+        print(f"问: {question}{flag}\n答: {result.text[:120]}\n")
+    print_guard_summary(results, args.mode)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+思考预算控制
+enable_thinking=True 时思考段可能耗尽 max_tokens，长尾推理请求拉高 p99 并长期占用 KV 缓存。
+这里在客户端渲染 Qwen3 对话模板，通过 /v1/completions 流式生成思考段；思考 token 达到预算仍未结束时，
+断开连接并中止请求，在原 prompt + 已生成思考 + 收尾提示 + </think> 之后继续生成答案。
+续写请求与第一阶段共享前缀，可直接命中 radix 缓存，不需要重新 prefill 思考段
+"""
+
+import argparse
+import asyncio
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from benchmark import DEFAULT_QUESTIONS, DEFAULT_SYSTEM_PROMPT, percentile
+from http_transport import AsyncTransport
+from radix_sim import render_chatml
+from streaming import aiter_sse_events, extract_delta_text
+from think_filter import THINK_CLOSE, MarkerMatcher, abort_request
+
+# Qwen3 思考模式推荐采样参数
+THINKING_SAMPLING_PARAMS = {
+    "temperature": 0.6,
+    "top_p": 0.95,
+    "top_k": 20,
+}
+# 预算耗尽时补在思考段末尾，提示模型基于已有思考直接作答
+THINK_END_CUE = "\n\n思考时间有限，下面根据已有的思考直接给出答案。\n</think>\n\n"
+
+
+@dataclass
+class ThinkBudgetResult:
+    """一次带思考预算的请求；token 数按流式 chunk 计 (stream_interval=1 时一个 chunk 即一个 token)"""
+    thinking: str = ""
+    answer: str = ""
+    think_tokens: int = 0
+    answer_tokens: int = 0
+    truncated: bool = False  # 思考段因预算被截断
+    cached_tokens: int = 0  # 续写请求命中的前缀缓存 token 数
+    first_answer_latency: float = 0.0
+    latency: float = 0.0
+    error: str = ""
+
+
+def completion_payload(prompt: str, max_tokens: int, sampling: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+        "model": "default",
+        "prompt": prompt,
+        "max_tokens": max_tokens,
+        **(THINKING_SAMPLING_PARAMS if sampling is None else sampling),
+        "stream": True,
+        "stream_options": {"include_usage": True},
+        "rid": uuid.uuid4().hex,
+    }
+
+
+async def astream_with_budget(transport: AsyncTransport, base_url: str, messages: List[Dict[str, Any]],
+                              think_budget: int, max_answer_tokens: int,
+                              sampling: Optional[Dict[str, Any]] = None,
+                              result: Optional[ThinkBudgetResult] = None) -> AsyncIterator[Tuple[str, str]]:
+    """流式产出 ("think", 文本) / ("answer", 文本)，统计写入 result
+
+    思考段在预算内结束时只有一次请求，答案达到 max_answer_tokens 即断开并中止；
+    否则在预算处截断，THINK_END_CUE 以 "think" 产出后续写答案。
+    出错时直接抛出异常，由调用方处理。
+    """
+    result = result if result is not None else ThinkBudgetResult()
+    url = f"{base_url}/v1/completions"
+    prompt = render_chatml(messages, enable_thinking=True)
+    payload = completion_payload(prompt, think_budget + max_answer_tokens, sampling)
+    matcher = MarkerMatcher([THINK_CLOSE])
+    generated: List[str] = []
+    thinking, answer = [], []
+    in_think = True
+    usage_tokens = None
+    answer_capped = False
+    start = time.perf_counter()
+
+    def answer_delta(text: str) -> Tuple[str, str]:
+        if not answer:
+            result.first_answer_latency = time.perf_counter() - start
+        answer.append(text)
+        return "answer", text
+
+    async with transport.post_json(url, payload) as response:
+        response.raise_for_status()
+        async for event in aiter_sse_events(response.aiter_bytes()):
+            if event.get("usage"):
+                usage_tokens = event["usage"].get("completion_tokens")
+            delta = extract_delta_text(event, chat=False)
+            if not delta:
+                continue
+            generated.append(delta)
+            if not in_think:
+                result.answer_tokens += 1
+                yield answer_delta(delta)
+                if result.answer_tokens >= max_answer_tokens:
+                    # 思考提前结束时首个请求的 max_tokens 仍含未用完的思考预算，答案需在客户端截断
+                    answer_capped = True
+                    break
+                continue
+            result.think_tokens += 1
+            split = next((i + 1 for i, ch in enumerate(delta) if matcher.step(ch)), None)
+            if split is None:
+                thinking.append(delta)
+                yield "think", delta
+                if result.think_tokens >= think_budget:
+                    # 退出响应上下文即断开连接
+                    result.truncated = True
+                    break
+                continue
+            in_think = False
+            thinking.append(delta[:split])
+            yield "think", delta[:split]
+            if delta[split:]:
+                yield answer_delta(delta[split:])
+
+    if answer_capped:
+        await abort_request(transport, base_url, payload["rid"])
+    elif not result.truncated:
+        if usage_tokens is not None:
+            result.answer_tokens = max(usage_tokens - result.think_tokens, 0)
+    else:
+        await abort_request(transport, base_url, payload["rid"])
+        thinking.append(THINK_END_CUE)
+        yield "think", THINK_END_CUE
+        continuation = completion_payload(prompt + "".join(generated) + THINK_END_CUE, max_answer_tokens, sampling)
+        async with transport.post_json(url, continuation) as response:
+            response.raise_for_status()
+            async for event in aiter_sse_events(response.aiter_bytes()):
+                usage = event.get("usage")
+                if usage:
+                    usage_tokens = usage.get("completion_tokens")
+                    result.cached_tokens = (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+                delta = extract_delta_text(event, chat=False)
+                if delta:
+                    result.answer_tokens += 1
+                    yield answer_delta(delta)
+        if usage_tokens is not None:
+            result.answer_tokens = usage_tokens
+
+    result.thinking = "".join(thinking)
+    result.answer = "".join(answer).strip()
+    result.latency = time.perf_counter() - start
+
+
+async def chat_with_thinking_budget(transport: AsyncTransport, base_url: str, messages: List[Dict[str, Any]],
+                                    think_budget: int, max_answer_tokens: int,
+                                    sampling: Optional[Dict[str, Any]] = None) -> ThinkBudgetResult:
+    """非流式版本，出错时写入 result.error"""
+    result = ThinkBudgetResult()
+    try:
+        async for _ in astream_with_budget(transport, base_url, messages, think_budget, max_answer_tokens,
+                                           sampling, result):
+            pass
+    except Exception as e:
+        result.error = f"{type(e).__name__}: {e}"
+    return result
+
+
+async def run_budget(base_url: str, questions: List[str], think_budget: int, max_answer_tokens: int,
+                     concurrency: int, timeout: float) -> List[ThinkBudgetResult]:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(transport: AsyncTransport, question: str) -> ThinkBudgetResult:
+        messages = [
+            {"role": "system", "content": DEFAULT_SYSTEM_PROMPT},
+            {"role": "user", "content": question},
+        ]
+        async with semaphore:
+            return await chat_with_thinking_budget(transport, base_url, messages, think_budget, max_answer_tokens)
+
+    async with AsyncTransport(pool_size=concurrency, timeout=timeout) as transport:
+        return await asyncio.gather(*(one(transport, q) for q in questions))
+
+
+def print_budget_summary(results: List[ThinkBudgetResult], think_budget: int):
+    ok = [r for r in results if not r.error]
+    print("=" * 60)
+    print(f"思考预算: {think_budget} token, 请求: {len(results)}, 失败: {len(results) - len(ok)}")
+    if ok:
+        truncated = [r for r in ok if r.truncated]
+        think = sorted(float(r.think_tokens) for r in ok)
+        answer = sorted(float(r.answer_tokens) for r in ok)
+        latency = sorted(r.latency for r in ok)
+        print(f"预算截断: {len(truncated)} ({len(truncated) / len(ok):.0%})")
+        print(f"思考 token  p50/p99: {percentile(think, 50):.0f} / {percentile(think, 99):.0f}, "
+              f"总计 {sum(think):.0f}")
+        print(f"答案 token  p50/p99: {percentile(answer, 50):.0f} / {percentile(answer, 99):.0f}, "
+              f"总计 {sum(answer):.0f}")
+        print(f"端到端延迟 p50/p99: {percentile(latency, 50):.2f}s / {percentile(latency, 99):.2f}s")
+        if truncated:
+            print(f"续写请求平均命中前缀缓存: {sum(r.cached_tokens for r in truncated) / len(truncated):.0f} token")
+    print("=" * 60)
+    errors = [r.error for r in results if r.error]
+    if errors:
+        print(f"失败示例: {errors[0]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="思考预算控制 - 限制思考段长度，超出预算后基于已有思考直接作答",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+示例:
+  python thinking_budget.py --think-budget 256 --max-answer-tokens 256
+  python thinking_budget.py --think-budget 128 --num-prompts 50 --concurrency 16
+        """,
+    )
+    parser.add_argument("--host", default="localhost", help="服务器主机地址")
+    parser.add_argument("--port", default=30000, type=int, help="服务器端口")
+    parser.add_argument("--think-budget", type=int, default=256, help="思考段最多 token 数")
+    parser.add_argument("--max-answer-tokens", type=int, default=256, help="答案最多 token 数")
+    parser.add_argument("--num-prompts", type=int, default=10, help="请求数 (使用内置问题)")
+    parser.add_argument("--concurrency", type=int, default=8, help="并发数")
+    parser.add_argument("--show", type=int, default=2, help="打印前几个请求的思考与答案")
+    parser.add_argument("--request-timeout", type=float, default=600, help="单请求超时时间(秒)")
+    args = parser.parse_args()
+
+    if args.think_budget < 1 or args.max_answer_tokens < 1:
+        parser.error("--think-budget 与 --max-answer-tokens 必须为正数")
+    questions = [DEFAULT_QUESTIONS[i % len(DEFAULT_QUESTIONS)] for i in range(args.num_prompts)]
+    base_url = f"http://{args.host}:{args.port}"
+    results = asyncio.run(run_budget(base_url, questions, args.think_budget, args.max_answer_tokens,
+                                     args.concurrency, args.request_timeout))
+    for question, result in list(zip(questions, results))[:args.show]:
+        flag = " [预算截断]" if result.truncated else ""
+        print(f"问: {question}{flag}")
+        print(f"思考 ({result.think_tokens} token): {result.thinking[:80]!r}")
+        print(f"答 ({result.answer_tokens} token): {result.answer[:120]}\n")
+    print_budget_summary(results, args.think_budget)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""
+客户端 token 计数与请求预检
+从 model_path 加载一次 tokenizer 并套用对话模板，在请求进入 GPU 队列之前本地截断或拒绝超长 prompt，
+并把 max_tokens 限制在剩余上下文之内。对话按消息切片计数，重复的系统提示和历史轮次走 LRU 缓存；
+批量计数时未命中的片段合并为一次批量编码 (fast tokenizer 在 Rust 侧并行)
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import yaml
+
+from benchmark import build_default_workload, load_workload, percentile
+from radix_sim import Tokenizer, chatml_segments
+from response_cache import LRUCache
+
+DEFAULT_CONTEXT_LENGTH = 32768
+POLICIES = ["clamp", "truncate", "reject"]
+
+
+class PromptTooLongError(ValueError):
+    """prompt (加上 max_tokens) 超出上下文长度，本地拒绝"""
+
+
+@dataclass
+class PreflightResult:
+    """预检结果，body 为可能被截断、max_tokens 被限制后的请求体副本"""
+    body: Dict[str, Any]
+    prompt_tokens: int
+    max_tokens: int = 0
+    dropped_messages: int = 0
+    truncated: bool = False
+    clamped: bool = False
+
+
+# 探测用对话: 模型模板与 chatml_segments 渲染结果一致时才能按消息切片计数
+_PROBE_MESSAGES = [
+    {"role": "system", "content": "你是一个助手。"},
+    {"role": "user", "content": "你好"},
+    {"role": "assistant", "content": "<think>\n想一想\n</think>\n\n你好！"},
+    {"role": "user", "content": "再见"},
+]
+
+
+def _is_plain(message: Dict[str, Any]) -> bool:
+    """只含文本的 system/user/assistant 消息可以按片段计数"""
+    return (message.get("role", "user") in ("system", "user", "assistant") and not message.get("tool_calls")
+            and isinstance(message.get("content"), (str, type(None))))
+
+
+class TokenCounter:
+    """带片段缓存的 token 计数器 (线程安全)；无法加载 tokenizer 时退化为字节近似"""
+
+    def __init__(self, model_path: Optional[str], context_length: int = DEFAULT_CONTEXT_LENGTH,
+                 cache_size: int = 8192, bytes_per_token: int = 3, min_output_tokens: int = 16):
+        self.tokenizer = Tokenizer(model_path, bytes_per_token)
+        self.context_length = context_length
+        self.min_output_tokens = min_output_tokens
+        self.cache = LRUCache(capacity=cache_size, ttl=None)
+        self.hits = 0
+        self.misses = 0
+        self.segmented = self._matches_chatml()
+
+    def _matches_chatml(self) -> bool:
+        """加载时用探测对话比较模型模板与 chatml_segments；不一致时整体套用模型模板计数"""
+        hf = self.tokenizer.hf_tokenizer
+        if hf is None:
+            return True
+        try:
+            matches = all(hf.apply_chat_template(_PROBE_MESSAGES, tokenize=False, add_generation_prompt=True,
+                                                 enable_thinking=thinking)
+                          == "".join(chatml_segments(_PROBE_MESSAGES, thinking)) for thinking in (True, False))
+        except Exception as e:
+            print(f"警告: 对话模板探测失败 ({e})，按整体模板计数")
+            return False
+        if not matches:
+            print("提示: 模型对话模板与 Qwen3 ChatML 不一致，按整体模板计数 (片段缓存只对完全相同的对话生效)")
+        return matches
+
+    @classmethod
+    def from_config(cls, config_path: str, **kwargs) -> "TokenCounter":
+        """从服务器配置读取 tokenizer 路径 (model.tokenizer_path 或 model.model_path) 与 context_length"""
+        with open(config_path, 'r', encoding='utf-8') as f:
+            config = yaml.safe_load(f) or {}
+        model = config.get("model") or {}
+        kwargs.setdefault("context_length",
+                          (config.get("memory") or {}).get("context_length") or DEFAULT_CONTEXT_LENGTH)
+        return cls(model.get("tokenizer_path") or model.get("model_path"), **kwargs)
+
+    @property
+    def approximate(self) -> bool:
+        """未加载 tokenizer，按字节近似计数"""
+        return self.tokenizer.hf_tokenizer is None
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def _encode_lengths(self, texts: List[str]) -> List[int]:
+        hf = self.tokenizer.hf_tokenizer
+        if hf is not None and len(texts) > 1:
+            return [len(ids) for ids in hf(texts, add_special_tokens=False)["input_ids"]]
+        return [len(self.tokenizer.encode_text(text)) for text in texts]
+
+    def count_segments(self, segments: List[str]) -> List[int]:
+        """逐片段计数，未命中缓存的片段去重后一次批量编码"""
+        keys = [hashlib.sha1(segment.encode("utf-8")).hexdigest() for segment in segments]
+        counts = [self.cache.get(key) for key in keys]
+        missing = {key: segment for key, segment, count in zip(keys, segments, counts) if count is None}
+        self.misses += sum(1 for count in counts if count is None)
+        self.hits += sum(1 for count in counts if count is not None)
+        if missing:
+            fresh = dict(zip(missing, self._encode_lengths(list(missing.values()))))
+            for key, count in fresh.items():
+                self.cache.put(key, count)
+            counts = [fresh[key] if count is None else count for key, count in zip(keys, counts)]
+        return counts
+
+    def segments(self, body: Dict[str, Any]) -> List[str]:
+        """chat 请求按消息切片 (模型模板与 ChatML 不一致或含工具调用等非纯文本消息时整体套用模型模板)，
+        completions 请求为整个 prompt"""
+        messages = body.get("messages")
+        if messages is None:
+            prompt = body.get("prompt", body.get("text", ""))
+            return [prompt if isinstance(prompt, str) else json.dumps(prompt, ensure_ascii=False)]
+        enable_thinking = (body.get("chat_template_kwargs") or {}).get("enable_thinking", True)
+        hf = self.tokenizer.hf_tokenizer
+        if hf is not None and (not self.segmented or not all(_is_plain(m) for m in messages)):
+            return [hf.apply_chat_template(messages, tokenize=False, add_generation_prompt=True,
+                                           enable_thinking=enable_thinking)]
+        return chatml_segments(messages, enable_thinking)
+
+    def count(self, body: Dict[str, Any]) -> int:
+        """请求的 prompt token 数；/generate 的 input_ids 直接取长度"""
+        if body.get("input_ids") is not None:
+            return len(body["input_ids"])
+        return sum(self.count_segments(self.segments(body)))
+
+    def count_text(self, text: str) -> int:
+        return self.count_segments([text])[0]
+
+    def count_batch(self, bodies: List[Dict[str, Any]]) -> List[int]:
+        """批量计数，所有请求的未命中片段合并为一次编码"""
+        per_body = [None if body.get("input_ids") is not None else self.segments(body) for body in bodies]
+        counts = self.count_segments([segment for segments in per_body if segments for segment in segments])
+        results, offset = [], 0
+        for body, segments in zip(bodies, per_body):
+            if segments is None:
+                results.append(len(body["input_ids"]))
+                continue
+            results.append(sum(counts[offset:offset + len(segments)]))
+            offset += len(segments)
+        return results
+
+    def truncate_text(self, text: str, max_tokens: int) -> str:
+        """保留开头 max_tokens 个 token (与 SGLang 自动截断一致，保留输入头部)"""
+        hf = self.tokenizer.hf_tokenizer
+        if hf is not None:
+            return hf.decode(hf.encode(text, add_special_tokens=False)[:max_tokens])
+        data = text.encode("utf-8")[:max(max_tokens, 0) * self.tokenizer.bytes_per_token]
+        return data.decode("utf-8", errors="ignore")
+
+    def _truncate(self, result: PreflightResult, limit: int):
+        body = result.body
+        if body.get("messages") is not None:
+            messages = list(body["messages"])
+            # 保留 system 消息和最后一条消息，从最早的历史轮次开始丢弃，且不让历史以 assistant 开头
+            while result.prompt_tokens > limit:
+                history = [i for i, m in enumerate(messages[:-1]) if m.get("role") != "system"]
+                if not history:
+                    break
+                del messages[history[0]]
+                result.dropped_messages += 1
+                history = [i for i, m in enumerate(messages[:-1]) if m.get("role") != "system"]
+                if history and messages[history[0]].get("role") == "assistant":
+                    del messages[history[0]]
+                    result.dropped_messages += 1
+                result.prompt_tokens = self.count({**body, "messages": messages})
+            last = dict(messages[-1])
+            for _ in range(3):
+                if result.prompt_tokens <= limit or not isinstance(last.get("content"), str):
+                    break
+                keep = max(self.count_text(last["content"]) - (result.prompt_tokens - limit), 0)
+                last["content"] = self.truncate_text(last["content"], keep)
+                messages[-1] = last
+                result.prompt_tokens = self.count({**body, "messages": messages})
+            body["messages"] = messages
+        elif isinstance(body.get("prompt", body.get("text")), str):
+            field = "prompt" if "prompt" in body else "text"
+            body[field] = self.truncate_text(body[field], limit)
+            result.prompt_tokens = self.count(body)
+        elif body.get("input_ids") is not None:
+            body["input_ids"] = list(body["input_ids"])[:limit]
+            result.prompt_tokens = len(body["input_ids"])
+        result.truncated = True
+
+    def preflight(self, body: Dict[str, Any], policy: str = "clamp") -> PreflightResult:
+        """本地预检
+
+        clamp: prompt 超长时拒绝，max_tokens 超出剩余上下文时下调
+        truncate: 先丢弃最早的历史消息、再截断最后一条消息，使 prompt 留出 min_output_tokens，然后同 clamp
+        reject: prompt + max_tokens 超出上下文即拒绝
+        拒绝时抛出 PromptTooLongError；truncate/reject 需要真实 tokenizer，字节近似计数时抛出 ValueError
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"未知的预检策略: {policy} (可选: {', '.join(POLICIES)})")
+        if policy != "clamp" and self.approximate:
+            raise ValueError(f"预检策略 {policy} 需要可用的 tokenizer，字节近似计数会误截误拒")
+        body = dict(body)
+        key = "max_completion_tokens" if "max_completion_tokens" in body else "max_tokens"
+        sampling = body.get("sampling_params")
+        if body.get("input_ids") is not None or "text" in body:
+            # /generate 请求的生成长度在 sampling_params 中
+            sampling = dict(sampling or {})
+            body["sampling_params"] = sampling
+            requested = sampling.get("max_new_tokens")
+        else:
+            requested = body.get(key)
+        result = PreflightResult(body, self.count(body))
+        limit = self.context_length - self.min_output_tokens
+        if policy == "truncate" and result.prompt_tokens > limit:
+            self._truncate(result, limit)
+        if result.prompt_tokens > limit:
+            raise PromptTooLongError(f"prompt 有 {result.prompt_tokens} token，超出上下文长度 {self.context_length} "
+                                     f"(需至少保留 {self.min_output_tokens} token 用于生成)")
+        remaining = self.context_length - result.prompt_tokens
+        result.max_tokens = remaining
+        if requested is not None:
+            if requested > remaining:
+                if policy == "reject":
+                    raise PromptTooLongError(f"prompt {result.prompt_tokens} + max_tokens {requested} token "
+                                             f"超出上下文长度 {self.context_length}")
+                result.clamped = True
+                requested = remaining
+                if sampling is not None and "max_new_tokens" in sampling:
+                    sampling["max_new_tokens"] = remaining
+                else:
+                    body[key] = remaining
+            result.max_tokens = requested
+        return result
+
+    async def apreflight(self, body: Dict[str, Any], policy: str = "clamp") -> PreflightResult:
+        """在线程池中预检，避免长 prompt 分词阻塞事件循环"""
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, self.preflight, body, policy)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="客户端 token 计数与请求预检 - 本地截断/拒绝超长 prompt，限制 max_tokens",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+示例:
+  python token_counter.py --config server_config.yaml --dataset requests.jsonl
+  python token_counter.py --model-path /path/to/Qwen3-4B --context-length 8192 \\
+      --dataset requests.jsonl --policy truncate --output checked.jsonl
+        """,
+    )
+    parser.add_argument("--config", "-c", help="服务器配置文件 (读取 model_path 与 context_length)")
+    parser.add_argument("--model-path", help="tokenizer 路径 (覆盖配置文件)")
+    parser.add_argument("--context-length", type=int, help=f"上下文长度 (默认: 配置文件或 {DEFAULT_CONTEXT_LENGTH})")
+    parser.add_argument("--dataset", help="请求 JSONL 文件 (每行包含 messages 或 prompt，也可包在 body 中)")
+    parser.add_argument("--num-prompts", type=int, help="只检查前 N 个请求 (未指定数据集时默认 100)")
+    parser.add_argument("--max-tokens", type=int, default=512, help="请求未指定 max_tokens 时的默认值")
+    parser.add_argument("--policy", choices=POLICIES, default="clamp", help="超长处理策略")
+    parser.add_argument("--min-output-tokens", type=int, default=16, help="prompt 至少为生成保留的 token 数")
+    parser.add_argument("--cache-size", type=int, default=8192, help="片段计数缓存条目数")
+    parser.add_argument("--bytes-per-token", type=int, default=3, choices=[1, 2, 3, 4],
+                        help="无法加载 tokenizer 时每个 token 的 UTF-8 字节数")
+    parser.add_argument("--batch-size", type=int, default=256, help="批量计数的请求数")
+    parser.add_argument("--output", "-o", help="写出预检后的请求 JSONL (被拒绝的请求不写出)")
+    args = parser.parse_args()
+
+    kwargs = {"cache_size": args.cache_size, "bytes_per_token": args.bytes_per_token,
+              "min_output_tokens": args.min_output_tokens}
+    if args.context_length:
+        kwargs["context_length"] = args.context_length
+    if args.config and not args.model_path:
+        counter = TokenCounter.from_config(args.config, **kwargs)
+    else:
+        counter = TokenCounter(args.model_path, **kwargs)
+    if args.dataset:
+        workload = load_workload(args.dataset, "chat", args.num_prompts, args.max_tokens)
+    else:
+        workload = build_default_workload("chat", args.num_prompts or 100, args.max_tokens)
+
+    print(f"计数方式: {counter.tokenizer.description}, 上下文长度: {counter.context_length}")
+    if counter.approximate:
+        if args.policy != "clamp":
+            print(f"错误: --policy {args.policy} 需要可用的 tokenizer (--model-path 或 --config)，字节近似计数会误截误拒")
+            raise SystemExit(1)
+        print("警告: 未加载 tokenizer，token 数只是估算")
+    start = time.perf_counter()
+    counts: List[int] = []
+    for i in range(0, len(workload), args.batch_size):
+        counts.extend(counter.count_batch(workload[i:i + args.batch_size]))
+    count_time = time.perf_counter() - start
+
+    checked, rejected = [], []
+    for body in workload:
+        try:
+            checked.append(counter.preflight(body, args.policy))
+        except PromptTooLongError as e:
+            rejected.append(str(e))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            for result in checked:
+                f.write(json.dumps(result.body, ensure_ascii=False) + "\n")
+
+    ordered = sorted(float(c) for c in counts)
+    print("=" * 60)
+    print(f"请求数: {len(workload)}, 计数耗时: {count_time:.3f}s ({len(workload) / max(count_time, 1e-9):.0f} 请求/s)")
+    if ordered:
+        print(f"prompt token p50/p99/max: {percentile(ordered, 50):.0f} / {percentile(ordered, 99):.0f} / "
+              f"{ordered[-1]:.0f}")
+    print(f"策略 {args.policy}: 拒绝 {len(rejected)}, 截断 {sum(1 for r in checked if r.truncated)} "
+          f"(丢弃历史消息 {sum(r.dropped_messages for r in checked)}), "
+          f"下调 max_tokens {sum(1 for r in checked if r.clamped)}")
+    print(f"片段缓存命中率: {counter.hit_rate:.1%} ({counter.hits}/{counter.hits + counter.misses})")
+    print("=" * 60)
+    if rejected:
+        print(f"拒绝示例: {rejected[0]}")
+    if args.output:
+        print(f"预检后的请求已写入: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,506 @@
+#!/usr/bin/env python3
+"""
+生产流量录制与按时间回放
+router.py --record-trace 在转发时把每个生成请求的到达时间、prompt/输出 token 数、采样参数和时延
+写入紧凑的 JSONL 轨迹 (.gz 结尾时 gzip 压缩)；本工具统计轨迹并按原始到达间隔回放
+(1x、N 倍速，或压缩长空闲)，容量规划与回归测试因此基于生产实际发送的流量
+"""
+
+import argparse
+import asyncio
+import gzip
+import hashlib
+import json
+import random
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from benchmark import (PERCENTILES, RequestResult, percentile, prepare_payload, print_summary,
+                       send_streaming_request, summarize_results)
+from http_transport import TRANSPORT_ERRORS, AsyncTransport, dumps, loads
+from streaming import SSEDecoder, extract_delta_text, parse_event
+
+GENERATION_PATHS = ("/v1/chat/completions", "/v1/completions", "/generate")
+# 共享前缀指纹取 prompt 开头的字符数 (router.py 与批量 /generate 的逐条记录共用)
+PREFIX_CHARS = 4096
+
+# 录制的采样参数 (OpenAI 接口取请求体顶层，/generate 取 sampling_params)
+SAMPLING_KEYS = (
+    "temperature", "top_p", "top_k", "min_p", "presence_penalty", "frequency_penalty",
+    "repetition_penalty", "stop", "n", "seed", "ignore_eos", "chat_template_kwargs",
+)
+
+# 回放时没有录制请求体，用这些词合成指定长度的 prompt (常见英文单词约 1 token/词)
+FILLER_WORDS = (
+    "the of and to in is that for it as with was on be by this are from at or an have not they which "
+    "one you were all we when there can more if out so about what up its into than them only other time "
+    "some could new these two may first then do any like my now over such our man me even most made after "
+    "also did many before must through back years where much your way well down should because each just "
+    "those people how too little state good very make world still own see men work long get here between "
+    "both life being under never day same another know while last might us great old year off come since"
+).split()
+
+
+def open_trace(path: str, mode: str = "rb"):
+    return gzip.open(path, mode) if path.endswith(".gz") else open(path, mode)
+
+
+def _prompt_chars(body: Dict[str, Any]) -> int:
+    messages = body.get("messages")
+    if isinstance(messages, list):
+        return sum(len(m.get("content") if isinstance(m.get("content"), str) else json.dumps(m.get("content")))
+                   for m in messages if isinstance(m, dict))
+    prompt = body.get("prompt", body.get("text"))
+    return len(prompt) if isinstance(prompt, str) else 0
+
+
+class RequestTap:
+    """旁路观察一次转发的响应，提取 token 用量与首 token 时间"""
+
+    def __init__(self, recorder: "TraceRecorder", path: str, body: Dict[str, Any], prefix: Optional[str]):
+        self.recorder = recorder
+        self.path = path
+        self.body = body
+        self.prefix = prefix
+        self.chat = path == "/v1/chat/completions"
+        self.arrival_time = time.time()
+        self.start = time.perf_counter()
+        self.ttft: Optional[float] = None
+        self.chunks = 0
+        self.usage: Dict[str, Any] = {}
+        self.decoder: Optional[SSEDecoder] = None
+        # 为取得 prompt_len 代客户端开启 include_usage 时，转发前去掉客户端未要求的 usage 事件
+        self.strip_usage = False
+        self._held = b""
+
+    def forward_body(self, raw_body: bytes) -> bytes:
+        """OpenAI 流式请求未开启 stream_options.include_usage 时开启它，否则轨迹里没有 prompt_len"""
+        body = self.body
+        if self.path == "/generate" or not body.get("stream") \
+                or (body.get("stream_options") or {}).get("include_usage"):
+            return raw_body
+        self.strip_usage = True
+        return dumps({**body, "stream_options": {**(body.get("stream_options") or {}), "include_usage": True}})
+
+    def feed(self, chunk: bytes) -> bytes:
+        """流式响应的每个字节块，返回应转发给客户端的字节"""
+        if self.decoder is None:
+            self.decoder = SSEDecoder()
+        for data in self.decoder.feed(chunk):
+            self._on_event(data)
+        if not self.strip_usage:
+            return chunk
+        # 按事件边界转发，被截断的事件留到下一块
+        events = (self._held + chunk).split(b"\n\n")
+        self._held = events.pop()
+        return b"".join(event + b"\n\n" for event in events if not self._is_usage_event(event))
+
+    def tail(self) -> bytes:
+        """流结束时返回尚未转发的字节"""
+        held, self._held = self._held, b""
+        return b"" if self._is_usage_event(held) else held
+
+    @staticmethod
+    def _is_usage_event(event: bytes) -> bool:
+        """只含 usage 的结束事件 ({"choices": [], "usage": {...}})"""
+        event = event.strip()
+        if not event.startswith(b"data:") or b'"usage"' not in event:
+            return False
+        try:
+            data = loads(event[5:])
+        except ValueError:
+            return False
+        return isinstance(data, dict) and not data.get("choices") and bool(data.get("usage"))
+
+    def _on_event(self, data: str):
+        try:
+            event = parse_event(data)
+        except ValueError:
+            return
+        if not isinstance(event, dict):
+            return
+        usage = event.get("usage") or event.get("meta_info")
+        if usage:
+            self.usage = usage
+        if extract_delta_text(event, self.chat) or (self.path == "/generate" and event.get("text")):
+            if self.ttft is None:
+                self.ttft = time.perf_counter() - self.start
+            self.chunks += 1
+
+    def finish(self, status: int, body: Optional[bytes] = None):
+        """响应结束时调用；非流式响应传入完整响应体"""
+        latency = time.perf_counter() - self.start
+        if body is not None:
+            try:
+                response = loads(body)
+            except ValueError:
+                response = None
+            if isinstance(response, dict):
+                self.usage = response.get("usage") or response.get("meta_info") or {}
+            elif isinstance(response, list) and self.path == "/generate":
+                # 批量 /generate (如 micro_batcher.py) 按条目逐条记录，各用自己的 meta_info
+                items = self.batch_items(len(response))
+                if items is not None:
+                    for item_body, output in zip(items, response):
+                        usage = (output.get("meta_info") if isinstance(output, dict) else None) or {}
+                        self.recorder.write(self.entry(status, latency, item_body, usage,
+                                                       _item_prefix(item_body)))
+                    return
+        elif self.decoder is not None:
+            for data in self.decoder.flush():
+                self._on_event(data)
+        self.recorder.write(self.entry(status, latency, self.body, self.usage, self.prefix))
+
+    def batch_items(self, count: int) -> Optional[List[Dict[str, Any]]]:
+        """把批量 /generate 请求体拆成单条请求体；条目数与响应不一致时返回 None"""
+        key = "text" if isinstance(self.body.get("text"), list) else "input_ids"
+        prompts = self.body.get(key)
+        if not isinstance(prompts, list) or len(prompts) != count:
+            return None
+        sampling = self.body.get("sampling_params")
+        return [{**self.body, key: prompt,
+                 "sampling_params": sampling[i] if isinstance(sampling, list) else sampling}
+                for i, prompt in enumerate(prompts)]
+
+    def entry(self, status: int, latency: float, body: Dict[str, Any], usage: Dict[str, Any],
+              prefix: Optional[str]) -> Dict[str, Any]:
+        sampling_source = (body.get("sampling_params") or {}) if self.path == "/generate" else body
+        prompt_tokens = usage.get("prompt_tokens")
+        entry = {
+            "arrival_time": round(self.arrival_time, 6),
+            "path": self.path,
+            "stream": bool(body.get("stream")),
+            "status": status,
+            "prompt_len": prompt_tokens,
+            "output_len": usage.get("completion_tokens") or self.chunks or None,
+            "cached_tokens": usage.get("cached_tokens")
+            or (usage.get("prompt_tokens_details") or {}).get("cached_tokens"),
+            "max_tokens": (body.get("max_tokens") or body.get("max_completion_tokens")
+                           or sampling_source.get("max_new_tokens")),
+            "sampling": {k: sampling_source[k] for k in SAMPLING_KEYS if k in sampling_source} or None,
+            "ttft_s": round(self.ttft if self.ttft is not None else latency, 6),
+            "latency_s": round(latency, 6),
+        }
+        if prefix:
+            entry["prefix_id"] = hashlib.sha1(prefix.encode("utf-8")).hexdigest()[:16]
+            chars = _prompt_chars(body)
+            # 按字符比例估算共享前缀的 token 数，供 scheduler_sim.py 使用
+            if prompt_tokens and chars:
+                entry["prefix_len"] = int(prompt_tokens * min(len(prefix) / chars, 1.0))
+        if self.recorder.record_bodies:
+            entry["body"] = body
+        return {k: v for k, v in entry.items() if v is not None}
+
+
+def _item_prefix(body: Dict[str, Any]) -> Optional[str]:
+    text = body.get("text")
+    return text[:PREFIX_CHARS] if isinstance(text, str) and text else None
+
+
+class TraceRecorder:
+    """把请求记录追加到轨迹文件，由 flush_loop 按时间间隔刷盘"""
+
+    def __init__(self, path: str, record_bodies: bool = False, flush_interval: float = 1.0):
+        self.path = path
+        self.record_bodies = record_bodies
+        self.flush_interval = flush_interval
+        self.file = open_trace(path, "ab")
+        self.count = 0
+        self._dirty = False
+
+    def open_request(self, path: str, body: Any, prefix: Optional[str]) -> Optional[RequestTap]:
+        """只录制生成类请求"""
+        if path not in GENERATION_PATHS or not isinstance(body, dict):
+            return None
+        return RequestTap(self, path, body, prefix)
+
+    def write(self, entry: Dict[str, Any]):
+        self.file.write(dumps(entry) + b"\n")
+        self.count += 1
+        self._dirty = True
+
+    def flush(self):
+        if self._dirty:
+            self.file.flush()
+            self._dirty = False
+
+    async def flush_loop(self):
+        """定期刷盘，空闲或进程异常退出前的最后几条记录也能落盘"""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            self.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def load_trace(path: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    entries = []
+    with open_trace(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                entries.append(loads(line))
+    entries.sort(key=lambda e: e.get("arrival_time", 0))
+    return entries[:limit] if limit else entries
+
+
+def _sorted(values: List[float]) -> List[float]:
+    return sorted(v for v in values if v is not None)
+
+
+def peak_concurrency(intervals: List[Tuple[float, float]]) -> int:
+    """由 (开始, 结束) 区间计算最大同时在途请求数"""
+    events = sorted([(start, 1) for start, _ in intervals] + [(end, -1) for _, end in intervals])
+    peak = current = 0
+    for _, delta in events:
+        current += delta
+        peak = max(peak, current)
+    return peak
+
+
+def trace_stats(entries: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """轨迹的到达率、长度分布、录制时的时延与并发"""
+    if not entries:
+        return {"requests": 0}
+    start = entries[0]["arrival_time"]
+    duration = entries[-1]["arrival_time"] - start
+    stats: Dict[str, Any] = {
+        "requests": len(entries),
+        "duration_s": duration,
+        "request_rate": (len(entries) - 1) / duration if duration > 0 else float("inf"),
+        "peak_concurrency": peak_concurrency([(e["arrival_time"], e["arrival_time"] + e.get("latency_s", 0))
+                                              for e in entries]),
+        "errors": sum(1 for e in entries if e.get("status", 200) != 200),
+        # 没有 prompt_len 的记录回放时只能用 16 token 的占位 prompt，scheduler_sim 也会跳过
+        "missing_prompt_len": sum(1 for e in entries if not e.get("prompt_len") and "body" not in e),
+        "paths": {},
+    }
+    for e in entries:
+        stats["paths"][e.get("path", "?")] = stats["paths"].get(e.get("path", "?"), 0) + 1
+    for name, key, scale in (("prompt_len", "prompt_len", 1), ("output_len", "output_len", 1),
+                             ("ttft_ms", "ttft_s", 1000), ("e2e_latency_ms", "latency_s", 1000)):
+        values = _sorted([e[key] * scale for e in entries if key in e])
+        stats[f"mean_{name}"] = sum(values) / len(values) if values else 0.0
+        for p in PERCENTILES:
+            stats[f"p{p}_{name}"] = percentile(values, p)
+    return stats
+
+
+def print_trace_stats(stats: Dict[str, Any]):
+    print("=" * 60)
+    print(f"请求数: {stats['requests']}, 跨度: {stats['duration_s']:.1f}s, 平均到达率: {stats['request_rate']:.2f} req/s")
+    print(f"最大并发: {stats['peak_concurrency']}, 错误: {stats['errors']}")
+    if stats["missing_prompt_len"]:
+        print(f"警告: {stats['missing_prompt_len']} 条记录缺少 prompt_len 且未录制请求体，回放时使用 16 token 占位 prompt")
+    print("接口: " + ", ".join(f"{path} x{count}" for path, count in stats["paths"].items()))
+    print("-" * 60)
+    print(f"{'指标':<16}{'mean':>10}" + "".join(f"{'p' + str(p):>10}" for p in PERCENTILES))
+    for name, label in (("prompt_len", "prompt token"), ("output_len", "输出 token"),
+                        ("ttft_ms", "TTFT (ms)"), ("e2e_latency_ms", "E2E (ms)")):
+        print(f"{label:<16}{stats[f'mean_{name}']:>10.1f}"
+              + "".join(f"{stats[f'p{p}_{name}']:>10.1f}" for p in PERCENTILES))
+    print("=" * 60)
+
+
+def schedule_offsets(entries: List[Dict[str, Any]], speed: float, max_gap: Optional[float]) -> List[float]:
+    """回放发送时刻: 到达间隔除以 speed；max_gap 把更长的空闲压缩到该值 (按原始时间计)"""
+    offsets, offset = [], 0.0
+    for i, e in enumerate(entries):
+        if i:
+            gap = e["arrival_time"] - entries[i - 1]["arrival_time"]
+            if max_gap is not None:
+                gap = min(gap, max_gap)
+            offset += gap / speed
+        offsets.append(offset)
+    return offsets
+
+
+def filler_text(num_tokens: int, seed: str) -> str:
+    rng = random.Random(seed)
+    return " ".join(rng.choice(FILLER_WORDS) for _ in range(max(num_tokens, 1)))
+
+
+def build_replay_payload(entry: Dict[str, Any], match_output_len: bool) -> Dict[str, Any]:
+    """有请求体时原样回放，否则按 prefix_id / prompt_len 合成等长 prompt (共享前缀的请求仍共享前缀)"""
+    path = entry.get("path", "/v1/chat/completions")
+    sampling = dict(entry.get("sampling") or {})
+    body = dict(entry["body"]) if "body" in entry else None
+    if body is None:
+        prompt_len = entry.get("prompt_len") or 16
+        prefix_len = min(entry.get("prefix_len", 0), prompt_len)
+        prefix = filler_text(prefix_len, entry["prefix_id"]) if prefix_len else ""
+        unique = filler_text(prompt_len - prefix_len, f"{entry['arrival_time']}")
+        if path == "/v1/chat/completions":
+            body = {"messages": ([{"role": "system", "content": prefix}] if prefix else [])
+                    + [{"role": "user", "content": unique}], **sampling}
+        elif path == "/v1/completions":
+            body = {"prompt": f"{prefix} {unique}" if prefix else unique, **sampling}
+        else:
+            body = {"text": f"{prefix} {unique}" if prefix else unique, "sampling_params": sampling}
+        if entry.get("max_tokens"):
+            if path == "/generate":
+                body["sampling_params"]["max_new_tokens"] = entry["max_tokens"]
+            else:
+                body["max_tokens"] = entry["max_tokens"]
+
+    if match_output_len and entry.get("output_len"):
+        # 固定输出长度，使回放的解码量与录制时一致
+        if path == "/generate":
+            body["sampling_params"] = {**(body.get("sampling_params") or {}),
+                                       "max_new_tokens": entry["output_len"], "ignore_eos": True}
+        else:
+            body["max_tokens"] = entry["output_len"]
+            body.pop("max_completion_tokens", None)
+            body["ignore_eos"] = True
+    return body
+
+
+async def send_generate_request(transport: AsyncTransport, url: str, payload: Dict[str, Any]) -> RequestResult:
+    """原生 /generate 以非流式回放，TTFT 记为总时延"""
+    result = RequestResult()
+    start = time.perf_counter()
+    payload = {**payload, "stream": False}
+    try:
+        async with transport.post_json(url, payload) as response:
+            if response.status != 200:
+                result.error = f"HTTP {response.status}: {await response.text()}"
+                return result
+            data = await response.json()
+        meta = (data[0] if isinstance(data, list) else data).get("meta_info", {})
+        result.latency = result.ttft = time.perf_counter() - start
+        result.prompt_tokens = meta.get("prompt_tokens", 0)
+        result.output_tokens = meta.get("completion_tokens", 0)
+        result.success = True
+    except TRANSPORT_ERRORS + (ValueError, AttributeError) as e:
+        result.error = f"{type(e).__name__}: {e}"
+    return result
+
+
+async def replay(base_url: str, entries: List[Dict[str, Any]], speed: float = 1.0,
+                 max_gap: Optional[float] = None, max_concurrency: Optional[int] = None,
+                 match_output_len: bool = True, timeout: float = 600, http2: bool = False) -> Dict[str, Any]:
+    """开环回放: 按录制的到达间隔发送，在途请求数由服务端速度决定 (可用 max_concurrency 封顶)"""
+    offsets = schedule_offsets(entries, speed, max_gap)
+    semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+    inflight = {"current": 0, "peak": 0}
+    lags: List[float] = []
+
+    async def send(transport: AsyncTransport, entry: Dict[str, Any]) -> RequestResult:
+        path = entry.get("path", "/v1/chat/completions")
+        body = build_replay_payload(entry, match_output_len)
+        inflight["current"] += 1
+        inflight["peak"] = max(inflight["peak"], inflight["current"])
+        try:
+            if path == "/generate":
+                return await send_generate_request(transport, f"{base_url}{path}", body)
+            chat = path == "/v1/chat/completions"
+            payload = prepare_payload(body, "chat" if chat else "completions")
+            return await send_streaming_request(transport, f"{base_url}{path}", payload, chat)
+        finally:
+            inflight["current"] -= 1
+
+    async def limited(transport: AsyncTransport, entry: Dict[str, Any]) -> RequestResult:
+        if semaphore is None:
+            return await send(transport, entry)
+        async with semaphore:
+            return await send(transport, entry)
+
+    async with AsyncTransport(pool_size=max_concurrency or 0, timeout=timeout, http2=http2) as transport:
+        tasks = []
+        start = time.perf_counter()
+        for entry, offset in zip(entries, offsets):
+            delay = start + offset - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            lags.append(max(time.perf_counter() - start - offset, 0.0))
+            tasks.append(asyncio.create_task(limited(transport, entry)))
+        results = await asyncio.gather(*tasks)
+        duration = time.perf_counter() - start
+
+    metrics = summarize_results(results, duration)
+    metrics.update({
+        "api": "trace", "request_rate": round((len(entries) - 1) / offsets[-1], 2) if offsets and offsets[-1] > 0 else float("inf"),
+        "concurrency": max_concurrency, "speed": speed, "peak_concurrency": inflight["peak"],
+        "max_dispatch_lag_ms": max(lags) * 1000 if lags else 0.0,
+    })
+    return {"metrics": metrics, "results": results}
+
+
+def print_comparison(recorded: Dict[str, Any], replayed: Dict[str, Any]):
+    print(f"{'':<16}{'录制':>12}{'回放':>12}")
+    rows = [("p50 TTFT (ms)", "p50_ttft_ms", "p50_ttft_ms"), ("p99 TTFT (ms)", "p99_ttft_ms", "p99_ttft_ms"),
+            ("p50 E2E (ms)", "p50_e2e_latency_ms", "p50_e2e_latency_ms"),
+            ("p99 E2E (ms)", "p99_e2e_latency_ms", "p99_e2e_latency_ms"),
+            ("最大并发", "peak_concurrency", "peak_concurrency")]
+    for label, rec_key, rep_key in rows:
+        print(f"{label:<16}{recorded.get(rec_key, 0):>12.1f}{replayed.get(rep_key, 0):>12.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="流量轨迹统计与按时间回放",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+录制: python router.py --backends http://127.0.0.1:30001 --record-trace trace.jsonl.gz [--record-bodies]
+统计: python traffic_trace.py stats --trace trace.jsonl.gz
+回放: python traffic_trace.py replay --trace trace.jsonl.gz --port 30000 --speed 2 --max-gap 5
+        """
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    stats_parser = subparsers.add_parser("stats", help="统计轨迹")
+    stats_parser.add_argument("--trace", "-t", required=True)
+
+    replay_parser = subparsers.add_parser("replay", help="按录制的到达间隔回放")
+    replay_parser.add_argument("--trace", "-t", required=True)
+    replay_parser.add_argument("--host", default="localhost", help="服务器主机地址")
+    replay_parser.add_argument("--port", type=int, default=30000, help="服务器端口")
+    replay_parser.add_argument("--speed", type=float, default=1.0, help="回放倍速 (2 表示到达间隔减半)")
+    replay_parser.add_argument("--max-gap", type=float, help="把超过该值的空闲间隔 (秒) 压缩为该值")
+    replay_parser.add_argument("--max-concurrency", type=int, help="在途请求数上限 (默认不限，保持开环)")
+    replay_parser.add_argument("--limit", type=int, help="只回放前 N 个请求")
+    replay_parser.add_argument("--free-output-len", action="store_true",
+                               help="不固定输出长度 (默认按录制的 output_len 设置 max_tokens 并忽略 EOS)")
+    replay_parser.add_argument("--request-timeout", type=float, default=600, help="单请求超时时间(秒)")
+    replay_parser.add_argument("--http2", action="store_true", help="使用 HTTP/2 (需要 httpx[http2])")
+    replay_parser.add_argument("--output-json", help="将回放指标写入 JSON 文件")
+    args = parser.parse_args()
+
+    try:
+        entries = load_trace(args.trace, getattr(args, "limit", None))
+    except (OSError, ValueError) as e:
+        print(f"错误: 无法读取轨迹: {e}")
+        sys.exit(1)
+    if not entries:
+        print("错误: 轨迹为空")
+        sys.exit(1)
+    recorded = trace_stats(entries)
+    print_trace_stats(recorded)
+    if args.command == "stats":
+        return
+
+    span = schedule_offsets(entries, args.speed, args.max_gap)[-1]
+    print(f"\n开始回放 {len(entries)} 个请求，预计发送跨度 {span:.1f}s ...")
+    outcome = asyncio.run(replay(
+        f"http://{args.host}:{args.port}", entries,
+        speed=args.speed, max_gap=args.max_gap, max_concurrency=args.max_concurrency,
+        match_output_len=not args.free_output_len, timeout=args.request_timeout, http2=args.http2,
+    ))
+    metrics = outcome["metrics"]
+    print_summary(metrics)
+    print(f"回放最大并发: {metrics['peak_concurrency']}, 最大发送延迟: {metrics['max_dispatch_lag_ms']:.1f} ms")
+    if args.speed == 1.0 and not args.max_gap:
+        print_comparison(recorded, metrics)
+    failures = [r.error for r in outcome["results"] if not r.success]
+    if failures:
+        print(f"失败示例: {failures[0]}")
+    if args.output_json:
+        with open(args.output_json, 'w', encoding='utf-8') as f:
+            json.dump(metrics, f, ensure_ascii=False, indent=2)
+        print(f"回放指标已保存到: {args.output_json}")
+
+
+if __name__ == "__main__":
+    main()
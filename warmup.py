@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+服务预热
+服务就绪后、接入真实流量前，先用常用系统提示词填充前缀缓存，并以多种并发度和解码长度
+触发 CUDA Graph 捕获与 JIT 编译，避免部署后第一分钟的首批请求承担冷启动开销
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+from benchmark import DEFAULT_SYSTEM_PROMPT
+from http_transport import TRANSPORT_ERRORS, AsyncTransport
+from input_ids_client import encode_conversations, load_tokenizer
+
+DEFAULT_WARMUP_CONFIG = {
+    "enabled": True,
+    "system_prompts": [DEFAULT_SYSTEM_PROMPT],
+    "user_prompt": "请用一句话介绍你自己。",
+    "decode_lengths": [1, 32, 256],
+    "concurrency": [1, 8, 32],
+    "enable_thinking": False,
+    "timeout": 600,
+}
+
+
+def merge_warmup_config(config: Dict[str, Any]) -> Dict[str, Any]:
+    """用配置文件 warmup 段覆盖默认值"""
+    merged = dict(DEFAULT_WARMUP_CONFIG)
+    merged.update({k: v for k, v in (config or {}).items() if v is not None})
+    return merged
+
+
+def build_messages(system_prompt: str, user_prompt: str) -> List[Dict[str, str]]:
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt},
+    ]
+
+
+async def _send(transport: AsyncTransport, url: str, payload: Dict[str, Any]) -> bool:
+    try:
+        async with transport.post_json(url, payload) as response:
+            await response.read()
+            return response.status == 200
+    except TRANSPORT_ERRORS:
+        return False
+
+
+async def run_warmup(base_url: str, warmup_config: Dict[str, Any], tokenizer: Optional[Any] = None) -> Dict[str, Any]:
+    """执行预热，返回各阶段耗时与失败数
+
+    传入 tokenizer 时 (服务器以 --skip-tokenizer-init 启动) 在本地分词，向 /generate 发送 input_ids
+    """
+    config = merge_warmup_config(warmup_config)
+    system_prompts = config["system_prompts"] or [DEFAULT_SYSTEM_PROMPT]
+    if tokenizer is not None:
+        url = f"{base_url.rstrip('/')}/generate"
+        input_ids = dict(zip(system_prompts, encode_conversations(
+            tokenizer, [build_messages(p, config["user_prompt"]) for p in system_prompts], config["enable_thinking"])))
+    else:
+        url = f"{base_url.rstrip('/')}/v1/chat/completions"
+
+    def payload(system_prompt: str, max_tokens: int) -> Dict[str, Any]:
+        if tokenizer is not None:
+            return {
+                "input_ids": input_ids[system_prompt],
+                "sampling_params": {"max_new_tokens": max_tokens, "temperature": 0, "ignore_eos": True},
+            }
+        return {
+            "model": "default",
+            "messages": build_messages(system_prompt, config["user_prompt"]),
+            "max_tokens": max_tokens,
+            "temperature": 0,
+            "ignore_eos": True,
+            "chat_template_kwargs": {"enable_thinking": config["enable_thinking"]},
+        }
+
+    stats = {"phases": [], "requests": 0, "failed": 0}
+    async with AsyncTransport(pool_size=max(config["concurrency"] or [1]), timeout=config["timeout"]) as transport:
+        async def phase(name: str, payloads: List[Dict[str, Any]]):
+            start = time.perf_counter()
+            results = await asyncio.gather(*(_send(transport, url, p) for p in payloads))
+            elapsed = time.perf_counter() - start
+            failed = results.count(False)
+            stats["phases"].append({"name": name, "requests": len(payloads), "failed": failed, "elapsed_s": elapsed})
+            stats["requests"] += len(payloads)
+            stats["failed"] += failed
+            print(f"  预热 {name}: {len(payloads)} 个请求, {elapsed:.2f}s" + (f", 失败 {failed}" if failed else ""))
+
+        # 1. 逐个预填充系统提示词，使其进入前缀缓存
+        await phase("前缀缓存", [payload(p, 1) for p in system_prompts])
+
+        # 2. 不同批大小 x 解码长度，覆盖 CUDA Graph 的常见 batch size
+        for batch_size in config["concurrency"]:
+            for max_tokens in config["decode_lengths"]:
+                payloads = [payload(system_prompts[i % len(system_prompts)], max_tokens)
+                            for i in range(batch_size)]
+                await phase(f"batch={batch_size} decode={max_tokens}", payloads)
+    return stats
+
+
+def main():
+    import yaml
+
+    parser = argparse.ArgumentParser(description="对运行中的 SGLang 服务执行预热")
+    parser.add_argument("--host", default="localhost", help="服务器主机地址")
+    parser.add_argument("--port", type=int, default=30000, help="服务器端口")
+    parser.add_argument("--config", "-c", default="server_config.yaml", help="读取其中的 warmup 段")
+    parser.add_argument("--skip-tokenizer-init", action="store_true",
+                        help="服务器不分词: 按配置文件中的模型在本地分词后发送 input_ids")
+    parser.add_argument("--model-path", help="本地分词使用的 tokenizer 路径 (覆盖配置文件)")
+    args = parser.parse_args()
+
+    try:
+        with open(args.config, 'r', encoding='utf-8') as f:
+            config = yaml.safe_load(f) or {}
+    except FileNotFoundError:
+        config = {}
+    tokenizer = None
+    if args.skip_tokenizer_init or (config.get("compatibility") or {}).get("skip_tokenizer_init"):
+        model = config.get("model") or {}
+        model_path = args.model_path or model.get("tokenizer_path") or model.get("model_path")
+        if not model_path:
+            parser.error("skip_tokenizer_init 模式需要 --model-path 或配置文件中的 model.model_path")
+        try:
+            tokenizer = load_tokenizer(model_path)
+        except (ImportError, OSError) as e:
+            print(f"错误: skip_tokenizer_init 模式下无法在本地加载 tokenizer: {e}")
+            sys.exit(1)
+    stats = asyncio.run(run_warmup(f"http://{args.host}:{args.port}", config.get("warmup", {}), tokenizer))
+    print(f"预热完成: {stats['requests']} 个请求, 失败 {stats['failed']}")
+
+
+if __name__ == "__main__":
+    main()
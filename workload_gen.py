@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+合成负载生成器
+按可配置的长度分布、共享系统提示词与多轮对话比例、中英文混合比例生成 JSONL 请求集，
+用于在压测和模拟中复现长 prefill 与前缀复用 (固定 --seed 时结果可复现)
+
+输出每行: {"id": ..., "arrival_time": ..., "output_len": ..., "body": {"messages": [...], "max_tokens": ...}}
+可直接用于 benchmark.py --dataset、batch_runner.py、radix_sim.py --input 与 scheduler_sim.py --trace
+"""
+
+import argparse
+import json
+import math
+import random
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from radix_sim import Tokenizer, percentile
+
+ZH_PHRASES = (
+    "我们 需要 分析 这个 问题 的 原因 以及 可能 的 解决 方案 在 实际 生产 环境 中 系统 的 性能 "
+    "往往 受到 多种 因素 影响 比如 网络 延迟 磁盘 读写 内存 带宽 和 计算 资源 调度 策略 "
+    "模型 推理 服务 数据 处理 用户 请求 缓存 命中 吞吐 时延 并发 队列 批处理 显存 参数 配置 "
+    "首先 其次 然后 最后 因此 但是 如果 那么 同时 另外 根据 通过 对于 关于 由于 所以 "
+    "文档 代码 测试 部署 监控 日志 告警 版本 接口 协议 客户端 服务器 数据库 索引 事务 "
+    "经济 历史 文化 教育 科学 技术 医疗 交通 能源 环境 城市 农业 金融 市场 政策 法律"
+).split()
+
+EN_WORDS = (
+    "the of and to in is that for it as with was on be by this are from at or an have not they which "
+    "system model request latency throughput cache memory batch server client token prompt output "
+    "performance analysis data network storage compute schedule queue policy config deploy monitor "
+    "first then because however therefore while when where should could would might must also "
+    "history science culture market energy city policy health education transport finance law"
+).split()
+
+ZH_PUNCTUATION = "，，，。"
+EN_PUNCTUATION = ",,,."
+
+SYSTEM_TEMPLATES = {
+    "zh": "你是一个专业的助手。以下是本次服务的背景资料与回答规范：\n",
+    "en": "You are a helpful assistant. Background material and answering guidelines follow:\n",
+}
+
+
+@dataclass
+class LengthDistribution:
+    """token 长度分布: fixed / uniform / lognormal / empirical"""
+    kind: str
+    params: List[float] = field(default_factory=list)
+    values: List[float] = field(default_factory=list)
+    weights: List[float] = field(default_factory=list)
+    spec: str = ""
+
+    def sample(self, rng: random.Random) -> int:
+        if self.kind == "fixed":
+            value = self.params[0]
+        elif self.kind == "uniform":
+            value = rng.uniform(self.params[0], self.params[1])
+        elif self.kind == "lognormal":
+            value = rng.lognormvariate(math.log(self.params[0]), self.params[1])
+        elif self.weights:
+            # 直方图: values 为各区间上界，区间内均匀采样
+            i = rng.choices(range(len(self.values)), weights=self.weights)[0]
+            low = self.values[i - 1] if i else 1
+            value = rng.uniform(low, self.values[i])
+        else:
+            value = rng.choice(self.values)
+        return max(int(round(value)), 1)
+
+
+def parse_length_dist(spec: str) -> LengthDistribution:
+    """解析长度分布
+
+    512 / fixed:512、uniform:128,2048、lognormal:800,0.8 (中位数, sigma)、
+    empirical:128=3,512=5,2048=2 (区间上界=权重) 或 empirical:lengths.json (观测长度列表，JSON 或每行一个数)
+    """
+    kind, _, rest = spec.partition(":")
+    if not rest:
+        kind, rest = "fixed", kind
+    try:
+        if kind == "empirical":
+            if "=" in rest:
+                pairs = sorted((float(k), float(w)) for k, w in (p.split("=") for p in rest.split(",")))
+                dist = LengthDistribution(kind, values=[k for k, _ in pairs], weights=[w for _, w in pairs])
+            else:
+                with open(rest, 'r', encoding='utf-8') as f:
+                    text = f.read().strip()
+                values = json.loads(text) if text.startswith("[") else [float(v) for v in text.split()]
+                dist = LengthDistribution(kind, values=[float(v) for v in values])
+            if not dist.values or any(v <= 0 for v in dist.values):
+                raise ValueError
+        else:
+            params = [float(p) for p in rest.split(",")]
+            expected = {"fixed": 1, "uniform": 2, "lognormal": 2}.get(kind)
+            if expected is None or len(params) != expected or params[0] <= 0:
+                raise ValueError
+            if kind == "uniform" and params[1] < params[0]:
+                raise ValueError
+            dist = LengthDistribution(kind, params=params)
+    except (ValueError, OSError):
+        raise argparse.ArgumentTypeError(f"无效的长度分布: {spec}")
+    dist.spec = spec
+    return dist
+
+
+class TextGenerator:
+    """生成指定 token 数的中文或英文文本 (token 数按 tokenizer 或字节近似计算)"""
+
+    def __init__(self, tokenizer: Tokenizer, rng: random.Random):
+        self.tokenizer = tokenizer
+        self.rng = rng
+
+    def _words(self, lang: str, count: int) -> str:
+        vocab, punctuation, sep = ((ZH_PHRASES, ZH_PUNCTUATION, "") if lang == "zh"
+                                   else (EN_WORDS, EN_PUNCTUATION, " "))
+        parts = []
+        for _ in range(count):
+            word = self.rng.choice(vocab)
+            if self.rng.random() < 0.12:
+                word += self.rng.choice(punctuation)
+            parts.append(word)
+        return sep.join(parts)
+
+    def count(self, text: str) -> int:
+        return len(self.tokenizer.encode_text(text))
+
+    def text(self, lang: str, num_tokens: int) -> str:
+        """先生成略多的文本，再按 token 截断到目标长度"""
+        text = ""
+        words = max(num_tokens, 4)
+        while self.count(text) < num_tokens:
+            text += self._words(lang, words)
+            words *= 2
+        return self.truncate(text, num_tokens)
+
+    def truncate(self, text: str, num_tokens: int) -> str:
+        hf = self.tokenizer.hf_tokenizer
+        if hf is not None:
+            return hf.decode(hf.encode(text, add_special_tokens=False)[:num_tokens])
+        data = text.encode("utf-8")[:num_tokens * self.tokenizer.bytes_per_token]
+        return data.decode("utf-8", errors="ignore")
+
+
+@dataclass
+class WorkloadConfig:
+    num_requests: int = 1000
+    prompt_len: LengthDistribution = field(default_factory=lambda: parse_length_dist("lognormal:600,0.8"))
+    output_len: LengthDistribution = field(default_factory=lambda: parse_length_dist("lognormal:250,0.7"))
+    system_prompt_len: LengthDistribution = field(default_factory=lambda: parse_length_dist("uniform:500,3000"))
+    num_system_prompts: int = 4
+    shared_fraction: float = 0.8
+    prefix_zipf: float = 0.0
+    multi_turn_fraction: float = 0.2
+    turns: LengthDistribution = field(default_factory=lambda: parse_length_dist("uniform:2,6"))
+    zh_ratio: float = 0.5
+    max_context: Optional[int] = None
+    request_rate: float = float("inf")
+    api: str = "chat"
+    seed: int = 0
+
+
+class WorkloadGenerator:
+    """请求由三类组成: 共享 K 个系统提示词之一的单轮请求、无共享前缀的单轮请求、多轮会话 (后一轮携带完整历史)"""
+
+    def __init__(self, config: WorkloadConfig, tokenizer: Tokenizer):
+        self.config = config
+        self.rng = random.Random(config.seed)
+        self.text = TextGenerator(tokenizer, self.rng)
+        self.system_prompts = [self.make_system_prompt() for _ in range(config.num_system_prompts)]
+        self.system_weights = [1.0 / (k + 1) ** config.prefix_zipf for k in range(config.num_system_prompts)]
+
+    def lang(self) -> str:
+        return "zh" if self.rng.random() < self.config.zh_ratio else "en"
+
+    def make_system_prompt(self) -> str:
+        lang = self.lang()
+        return SYSTEM_TEMPLATES[lang] + self.text.text(lang, self.config.system_prompt_len.sample(self.rng))
+
+    def pick_system_prompt(self) -> Optional[str]:
+        if self.system_prompts and self.rng.random() < self.config.shared_fraction:
+            return self.rng.choices(self.system_prompts, weights=self.system_weights)[0]
+        return None
+
+    def session(self, num_turns: int) -> List[Dict[str, Any]]:
+        """一个会话的各轮请求；单轮请求是 num_turns=1 的会话"""
+        system = self.pick_system_prompt()
+        lang = self.lang()
+        history = [{"role": "system", "content": system}] if system else []
+        context = self.text.count(system) if system else 0
+        items = []
+        for turn in range(num_turns):
+            prompt_len = self.config.prompt_len.sample(self.rng)
+            output_len = self.config.output_len.sample(self.rng)
+            if self.config.max_context and context + prompt_len + output_len > self.config.max_context:
+                if turn:
+                    break
+                prompt_len = max(self.config.max_context - context - output_len, 1)
+            messages = history + [{"role": "user", "content": self.text.text(lang, prompt_len)}]
+            items.append({"messages": messages, "output_len": output_len, "prompt_len": context + prompt_len,
+                          "shared": bool(system), "turn": turn})
+            # 下一轮的历史包含本轮回答，长度与本轮输出一致
+            history = messages + [{"role": "assistant", "content": self.text.text(lang, output_len)}]
+            context += prompt_len + output_len
+        return items
+
+    def generate(self) -> List[Dict[str, Any]]:
+        config = self.config
+        num_multi = int(round(config.num_requests * config.multi_turn_fraction))
+        streams: List[List[Dict[str, Any]]] = []
+        while sum(len(s) for s in streams) < num_multi:
+            streams.append(self.session(max(self.config.turns.sample(self.rng), 2)))
+        multi = sum(len(s) for s in streams)
+        if multi > num_multi:
+            streams[-1] = streams[-1][:len(streams[-1]) - (multi - num_multi)] or streams[-1][:1]
+        while sum(len(s) for s in streams) < config.num_requests:
+            streams.append(self.session(1))
+
+        # 随机交错各会话，同一会话内保持轮次顺序
+        order = [i for i, s in enumerate(streams) for _ in s]
+        self.rng.shuffle(order)
+        positions = [0] * len(streams)
+        requests = []
+        clock = 0.0
+        for stream_index in order:
+            item = streams[stream_index][positions[stream_index]]
+            positions[stream_index] += 1
+            if config.api == "chat":
+                body: Dict[str, Any] = {"messages": item["messages"]}
+            else:
+                body = {"prompt": "\n\n".join(m["content"] for m in item["messages"])}
+            body["max_tokens"] = item["output_len"]
+            record: Dict[str, Any] = {"id": f"req-{len(requests)}"}
+            if config.request_rate != float("inf"):
+                if requests:
+                    clock += self.rng.expovariate(config.request_rate)
+                record["arrival_time"] = round(clock, 6)
+            record.update({"output_len": item["output_len"], "body": body})
+            requests.append((record, item))
+        return requests
+
+
+def workload_stats(requests: List[Any]) -> Dict[str, Any]:
+    items = [item for _, item in requests]
+    prompt = sorted(item["prompt_len"] for item in items)
+    output = sorted(item["output_len"] for item in items)
+    return {
+        "requests": len(items),
+        "shared_requests": sum(1 for item in items if item["shared"]),
+        "follow_up_turns": sum(1 for item in items if item["turn"] > 0),
+        "prompt_tokens": sum(prompt),
+        "output_tokens": sum(output),
+        **{f"p{q}_prompt_len": percentile(prompt, q) for q in (50, 90, 99)},
+        **{f"p{q}_output_len": percentile(output, q) for q in (50, 90, 99)},
+    }
+
+
+def print_stats(stats: Dict[str, Any], config: WorkloadConfig, tokenizer: Tokenizer):
+    print("=" * 60)
+    print(f"请求数: {stats['requests']} (共享系统提示词 {stats['shared_requests']}，多轮续问 {stats['follow_up_turns']})")
+    print(f"token 计数: {tokenizer.description}，中文比例: {config.zh_ratio:.0%}")
+    print(f"prompt 长度 ({config.prompt_len.spec} + 系统提示词/历史): p50 {stats['p50_prompt_len']}, "
+          f"p90 {stats['p90_prompt_len']}, p99 {stats['p99_prompt_len']}")
+    print(f"输出长度 ({config.output_len.spec}): p50 {stats['p50_output_len']}, "
+          f"p90 {stats['p90_output_len']}, p99 {stats['p99_output_len']}")
+    print(f"prompt token 总数: {stats['prompt_tokens']}, 输出 token 总数: {stats['output_tokens']}")
+    print("=" * 60)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="合成负载生成器 (长度分布 / 共享前缀 / 多轮对话 / 中英文混合)",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+长度分布格式:
+  512 或 fixed:512           固定长度
+  uniform:128,2048           均匀分布
+  lognormal:800,0.8          对数正态 (中位数, sigma)
+  empirical:128=3,512=5      直方图 (区间上界=权重，区间内均匀)
+  empirical:lengths.json     从观测长度中重采样 (JSON 列表或每行一个数)
+
+示例:
+  python workload_gen.py --num-requests 2000 --output workload.jsonl
+  python workload_gen.py --prompt-len lognormal:4000,0.6 --num-system-prompts 8 --shared-fraction 0.9 \\
+      --multi-turn-fraction 0.3 --zh-ratio 0.7 --request-rate 8 --output long_prefill.jsonl
+  python scheduler_sim.py --trace long_prefill.jsonl --kv-tokens 200000 --approximate
+        """,
+    )
+    parser.add_argument("--output", required=True, help="输出 JSONL 文件")
+    parser.add_argument("--num-requests", type=int, default=1000, help="请求总数")
+    parser.add_argument("--api", choices=["chat", "completions"], default="chat",
+                        help="请求格式: chat 使用 messages，completions 把各轮内容拼接为 prompt")
+    parser.add_argument("--prompt-len", type=parse_length_dist, default="lognormal:600,0.8",
+                        help="每轮用户输入的 token 数分布 (不含系统提示词与历史)")
+    parser.add_argument("--output-len", type=parse_length_dist, default="lognormal:250,0.7",
+                        help="输出 token 数分布 (写入 max_tokens 与 output_len)")
+    parser.add_argument("--system-prompt-len", type=parse_length_dist, default="uniform:500,3000",
+                        help="共享系统提示词的 token 数分布")
+    parser.add_argument("--num-system-prompts", type=int, default=4, help="共享系统提示词个数 K")
+    parser.add_argument("--shared-fraction", type=float, default=0.8,
+                        help="使用共享系统提示词的会话比例，其余会话没有系统提示词")
+    parser.add_argument("--prefix-zipf", type=float, default=0.0,
+                        help="系统提示词热度的 Zipf 指数，0 为均匀")
+    parser.add_argument("--multi-turn-fraction", type=float, default=0.2,
+                        help="属于多轮会话的请求比例 (后续轮次携带完整历史)")
+    parser.add_argument("--turns", type=parse_length_dist, default="uniform:2,6", help="多轮会话的轮数分布")
+    parser.add_argument("--zh-ratio", type=float, default=0.5, help="中文会话比例")
+    parser.add_argument("--max-context", type=int, help="单个请求 prompt + 输出的 token 上限 (超出时结束会话)")
+    parser.add_argument("--request-rate", type=float, default=float("inf"),
+                        help="写入泊松到达时间 arrival_time (req/s)，默认不写")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    parser.add_argument("--model-path", help="用模型 tokenizer 精确控制 token 数")
+    parser.add_argument("--bytes-per-token", type=int, default=3, choices=[1, 2, 3, 4],
+                        help="无 tokenizer 时的字节近似 (与 radix_sim.py / scheduler_sim.py --approximate 一致)")
+    args = parser.parse_args()
+
+    for name in ("shared_fraction", "multi_turn_fraction", "zh_ratio"):
+        if not 0 <= getattr(args, name) <= 1:
+            parser.error(f"--{name.replace('_', '-')} 必须在 0 到 1 之间")
+
+    config = WorkloadConfig(
+        num_requests=args.num_requests, prompt_len=args.prompt_len, output_len=args.output_len,
+        system_prompt_len=args.system_prompt_len, num_system_prompts=args.num_system_prompts,
+        shared_fraction=args.shared_fraction, prefix_zipf=args.prefix_zipf,
+        multi_turn_fraction=args.multi_turn_fraction, turns=args.turns, zh_ratio=args.zh_ratio,
+        max_context=args.max_context, request_rate=args.request_rate, api=args.api, seed=args.seed,
+    )
+    tokenizer = Tokenizer(args.model_path, args.bytes_per_token)
+    requests = WorkloadGenerator(config, tokenizer).generate()
+    with open(args.output, 'w', encoding='utf-8') as f:
+        for record, _ in requests:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    print_stats(workload_stats(requests), config, tokenizer)
+    print(f"已写入: {args.output}")
+
+
+if __name__ == "__main__":
+    main()